@@ -1,9 +1,38 @@
+-- Schéma initial (conteneur neuf). Les bases existantes se mettent à niveau avec : python migrations.py
 CREATE EXTENSION IF NOT EXISTS vector;
 
 CREATE TABLE IF NOT EXISTS chat_history (
     id SERIAL PRIMARY KEY,
     content TEXT,
-    content_hash VARCHAR(32) UNIQUE,
+    content_hash VARCHAR(64) UNIQUE,
     embedding vector(768),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    project_id TEXT,
+    -- Recherche lexicale des identifiants (recherche hybride, voir memory_db.recall)
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED
 );
+
+-- Index ANN (distance cosinus) : sans lui, chaque recherche est un parcours séquentiel
+CREATE INDEX IF NOT EXISTS chat_history_embedding_idx ON chat_history
+    USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+-- Recherche limitée au projet courant (voir memory_db.recall)
+CREATE INDEX IF NOT EXISTS chat_history_project_idx ON chat_history (project_id);
+CREATE INDEX IF NOT EXISTS chat_history_content_tsv_idx ON chat_history USING gin (content_tsv);
+
+-- Morceaux des échanges (voir chunker.py), un embedding par morceau
+CREATE TABLE IF NOT EXISTS chat_chunks (
+    id SERIAL PRIMARY KEY,
+    parent_id INTEGER NOT NULL REFERENCES chat_history (id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    embedding vector(768),
+    project_id TEXT,
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED,
+    UNIQUE (parent_id, chunk_index)
+);
+
+CREATE INDEX IF NOT EXISTS chat_chunks_embedding_idx ON chat_chunks
+    USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+CREATE INDEX IF NOT EXISTS chat_chunks_project_idx ON chat_chunks (project_id);
+CREATE INDEX IF NOT EXISTS chat_chunks_content_tsv_idx ON chat_chunks USING gin (content_tsv);
@@ -1,12 +1,12 @@
 import os
 import sys
-import re
-import time
-from openai import OpenAI
-from openai.types.chat import ChatCompletionUserMessageParam
 from dotenv import load_dotenv
 from rich.console import Console
 
+import response_cache
+from failover import EmptyResponse, Failover
+from streaming import ThinkFilter
+
 # --- Configuration de l'environnement ---
 load_dotenv()
 
@@ -21,64 +21,144 @@ console = Console(stderr=True)
 
 # --- Cœur du système de questionnement ---
 
-def ask_question(user_prompt):
+# Votre pile de modèles (Failover)
+MODELS = [
+    # "deepseek/deepseek-r1:freedom",  # Pour tester l'échec 402/404
+    "google/gemini-2.0-flash-001",
+    "google/gemini-2.0-pro-exp-02-05:free",
+    "meta-llama/llama-3.3-70b-instruct:free",
+    "openrouter/auto"
+]
+
+REQUEST_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "120"))  # Entre deux morceaux de la réponse
+
+PASSABLE_ERRORS = ["429", "404", "402", "NOT_FOUND", "500", "503", "CREDITS", "BALANCE"]
+
+
+def _is_passable(error):
+    """Erreurs pour lesquelles on bascule sur le modèle suivant."""
+    return isinstance(error, EmptyResponse) or any(err in str(error).upper() for err in PASSABLE_ERRORS)
+
+
+def _model_attempt(client, user_prompt):
+    """Fabrique le générateur de morceaux bruts (balises <think> comprises) pour un modèle.
+
+    La requête est toujours streamée, même si l'appelant attend la réponse d'un bloc (ask_question
+    réunit les morceaux) : le flux existe dès les en-têtes reçus et un perdant peut être interrompu.
+    """
+    from openai.types.chat import ChatCompletionUserMessageParam
+
+    def attempt(model_name, handle):
+        response = client.chat.completions.create(
+            model=model_name,
+            messages=[ChatCompletionUserMessageParam(role="user", content=user_prompt)],
+            temperature=0.7,
+            stream=True
+        )
+        handle.on_cancel(response.close)  # Perdant d'une course : connexion fermée sans attendre
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            response.close()
+
+    return attempt
+
+
+def ask_question(user_prompt, stream=False, on_token=None, strategy=None, use_cache=True):
+    """Interroge la pile de modèles. En mode stream, chaque morceau nettoyé est transmis à on_token.
+
+    strategy : sequential, hedge ou race (défaut : FAILOVER_STRATEGY).
+    use_cache : False pour ignorer le cache des réponses (option --no-cache).
+    """
+    models = list(MODELS)
+
+    # Question déjà posée à l'identique : aucune requête réseau
+    use_cache = use_cache and response_cache.ENABLED
+    cached = response_cache.lookup(models, user_prompt) if use_cache else None
+    if cached:
+        console.print(f"[bold green]⚡ Réponse en cache ({cached.get('winner')})[/bold green]")
+        if on_token:
+            on_token(cached["response"])
+        return cached["response"]
+
+    # Import différé : openai coûte près d'une seconde au démarrage
+    from openai import OpenAI
+
     client = OpenAI(
         base_url="https://openrouter.ai/api/v1",
-        api_key=os.getenv("OPENROUTER_API_KEY")
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        # Borne l'attente d'un perdant de course encore sans réponse (rien à fermer avant elle)
+        timeout=REQUEST_TIMEOUT
     )
 
-    # Votre pile de modèles (Failover)
-    models = [
-        # "deepseek/deepseek-r1:freedom",  # Pour tester l'échec 402/404
-        "google/gemini-2.0-flash-001",
-        "google/gemini-2.0-pro-exp-02-05:free",
-        "meta-llama/llama-3.3-70b-instruct:free",
-        "openrouter/auto"
-    ]
-
     with console.status("[bold blue]Initialisation de la requête...[/bold blue]", spinner="dots") as status:
-        for model_name in models:
-            # On met à jour le texte du spinner sans détruire l'objet
-            status.update(f"[bold blue]Réflexion avec {model_name}.../[bold blue]")
-
-            try:
-                response = client.chat.completions.create(
-                    model=model_name,
-                    messages=[ChatCompletionUserMessageParam(role="user", content=user_prompt)],
-                    temperature=0.7
-                )
-
-                raw_content = response.choices[0].message.content
-                clean_content = re.sub(r'<think>.*?</think>', '', raw_content, flags=re.DOTALL).strip()
-
-                # Succès ! On stocke le nom du gagnant
-                winner = model_name
-                break  # On casse la boucle for
-
-            except Exception as e:
-                error_msg = str(e)
+        def on_event(kind, model_name, detail=None):
+            if kind == "start":
+                # On met à jour le texte du spinner sans détruire l'objet
+                status.update(f"[bold blue]Réflexion avec {model_name}.../[bold blue]")
+            elif kind == "hedge":
+                console.print(f"[cyan]⏩ Aucun token après {detail:.1f} s : {model_name} lancé en parallèle...[/cyan]")
+            elif kind == "skip":
+                remaining, status_code = detail
+                console.print(f"[dim]⏭️  {model_name} ignoré (erreur {status_code}, "
+                              f"nouvel essai dans {remaining:.0f} s)[/dim]")
+            elif kind == "cancel" and detail:
+                console.print(f"[dim]✂️  Requête annulée : {model_name}[/dim]")
+            elif kind == "fail":
                 # On utilise console.print (qui va forcer le spinner à se suspendre un instant)
                 console.print(f"[bold red]⚠️  ÉCHEC : {model_name}[/bold red]")
-
-                passable_errors = ["429", "404", "402", "NOT_FOUND", "500", "503", "CREDITS", "BALANCE"]
-                if any(err in error_msg.upper() for err in passable_errors):
-                    console.print(f"[bold red]   CAUSE : {error_msg[:80]}...[/bold red]")
-                    console.print(f"[cyan]🔄 Passage au modèle suivant...[/cyan]")
-                    time.sleep(0.3)
-                    continue
-
-                raise e
-        else:
-            # Si la boucle finit sans break
-            return None
-
-    console.print(f"[bold green]✅ Réponse générée par : {winner}[/bold green]")
-    return clean_content
+                console.print(f"[bold red]   CAUSE : {str(detail)[:80]}...[/bold red]")
+                console.print(f"[cyan]🔄 Passage au modèle suivant...[/cyan]")
+
+        failover = Failover(models, _model_attempt(client, user_prompt), strategy=strategy,
+                            is_passable=_is_passable, on_event=on_event, retry_pause=0.3)
+
+        # Une réponse déjà partiellement affichée ne peut plus basculer sur un autre modèle :
+        # Failover ne bascule que tant qu'aucun morceau n'a été reçu.
+        think_filter = ThinkFilter()
+        parts = []
+        first_chunk = True
+        try:
+            for raw in failover.stream():
+                if first_chunk:
+                    first_chunk = False
+                    # Le spinner s'arrête dès que le modèle commence à répondre
+                    status.stop()
+                    if stream:
+                        console.print(f"[dim]⏱️  Premier token en "
+                                      f"{failover.first_chunk_at - failover.started_at:.2f} s "
+                                      f"({failover.winner})[/dim]")
+
+                text = think_filter.feed(raw)
+                if text:
+                    parts.append(text)
+                    if on_token:
+                        on_token(text)
+
+            text = think_filter.flush()
+            if text:
+                parts.append(text)
+                if on_token:
+                    on_token(text)
+        finally:
+            failover.record_latency()
+
+    if failover.winner is None:
+        return None
+
+    console.print(f"[bold green]✅ Réponse générée par : {failover.winner}[/bold green]")
+    answer = "".join(parts).strip()
+    if use_cache and answer:
+        response_cache.store(models, user_prompt, answer, failover.winner)
+    return answer
 
 
 # --- Gestion des entrées et du workflow ---
 
-def ask():
+def build_prompt(user_query, pipe_content):
+    """Assemble le prompt final : instructions système, contexte (pipe) et question."""
     # Lecture du prompt système (si présent)
     system_prompt_path = r"C:\Users\bulam\.local\bin\prompt_system.txt"
     system_content = ""
@@ -86,10 +166,6 @@ def ask():
         with open(system_prompt_path, 'r', encoding='utf-8') as f:
             system_content = f.read().strip()
 
-    # Capture du flux (Pipe) ou des arguments
-    pipe_content = sys.stdin.read().strip() if not sys.stdin.isatty() else ""
-    user_query = " ".join(sys.argv[1:]).strip()
-
     # Assemblage final
     parts = []
     if system_content:
@@ -99,15 +175,34 @@ def ask():
     if user_query:
         parts.append(f"### USER QUERY ###\n{user_query}")
 
-    prompt_final = "\n\n---\n\n".join(parts)
+    return "\n\n---\n\n".join(parts)
+
+
+def ask():
+    # Capture du flux (Pipe) ou des arguments
+    pipe_content = sys.stdin.read().strip() if not sys.stdin.isatty() else ""
+    # --stream : la réponse est écrite sur stdout au fil des tokens
+    # --no-cache : la question est reposée même si une réponse identique est en cache
+    stream = "--stream" in sys.argv[1:]
+    use_cache = "--no-cache" not in sys.argv[1:]
+    user_query = " ".join(arg for arg in sys.argv[1:] if arg not in ("--stream", "--no-cache")).strip()
+
+    prompt_final = build_prompt(user_query, pipe_content)
 
     if not prompt_final.strip():
         console.print("Usage: glog 'votre question' ou cat file | glog")
         return
 
     try:
-        response = ask_question(prompt_final)
-        # On utilise le print() natif, glog se chargeant d'ajouter les styles.
+        if stream:
+            response = ask_question(prompt_final, stream=True, use_cache=use_cache,
+                                    on_token=lambda t: print(t, end="", flush=True))
+            if response:
+                print()
+            return
+
+        response = ask_question(prompt_final, use_cache=use_cache)
+        # On utilise le print() natif : la sortie reste exploitable dans un pipe.
         if response:
             print(response)
     except Exception as e:
@@ -116,4 +211,8 @@ def ask():
 
 
 if __name__ == "__main__":
-    ask()
+    if "--profile-startup" in sys.argv[1:]:
+        from startup_profile import report_startup
+        report_startup("ask")
+    else:
+        ask()
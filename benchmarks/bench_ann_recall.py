@@ -0,0 +1,178 @@
+"""Rappel et latence des index ANN (HNSW, IVFFlat) face à la recherche exacte.
+
+Une table synthétique (ann_bench, 1M lignes de 768 dimensions par défaut) est générée côté serveur :
+des vecteurs bruités autour de quelques centaines de centres, pour imiter les regroupements
+thématiques de l'historique. Les requêtes (ann_bench_queries) suivent la même distribution mais
+ne figurent pas dans la table. Pour chaque réglage de session (hnsw.ef_search, ivfflat.probes),
+le rappel@k est mesuré par rapport aux k plus proches voisins exacts (parcours séquentiel).
+
+La génération d'un million de lignes prend plusieurs minutes et environ 3 Go : utilisez --reuse
+pour relancer les mesures sur la même table, et --keep pour ne pas la supprimer à la fin.
+
+Usage : python benchmarks/bench_ann_recall.py [--rows 1000000] [--method hnsw|ivfflat|both] [--queries 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from memory_db import configure_session, connect  # noqa: E402
+from migrations import HNSW_EF_CONSTRUCTION, HNSW_M, build_index, default_lists  # noqa: E402
+
+TABLE = "ann_bench"
+EF_SEARCH_VALUES = [10, 20, 40, 80, 160, 320]
+PROBES_VALUES = [1, 5, 10, 20, 50, 100]
+
+# Vecteur centre + bruit uniforme, une valeur aléatoire par composante
+NOISY_VECTOR = """(SELECT array_agg(c.x + (random() - 0.5) * %(noise)s ORDER BY c.i)::vector
+                   FROM unnest(ce.v) WITH ORDINALITY AS c(x, i))"""
+
+
+def generate(cur, rows, dim, clusters, queries, noise):
+    started = time.perf_counter()
+    for table in (TABLE, f"{TABLE}_queries", f"{TABLE}_centroids"):
+        cur.execute(f"DROP TABLE IF EXISTS {table}")
+    cur.execute(f"""CREATE TABLE {TABLE}_centroids AS
+        SELECT g AS c, array_agg(random() - 0.5) AS v
+        FROM generate_series(1, %(clusters)s) g, generate_series(1, %(dim)s) d GROUP BY g""",
+                {"clusters": clusters, "dim": dim})
+    cur.execute(f"CREATE TABLE {TABLE} (id SERIAL PRIMARY KEY, embedding vector({dim}))")
+    cur.execute(f"CREATE TABLE {TABLE}_queries (qid SERIAL PRIMARY KEY, embedding vector({dim}))")
+
+    params = {"noise": noise, "clusters": clusters}
+    batch = 50_000
+    for first in range(0, rows, batch):
+        params.update(first=first + 1, last=min(rows, first + batch))
+        cur.execute(f"""INSERT INTO {TABLE} (embedding) SELECT {NOISY_VECTOR}
+            FROM generate_series(%(first)s, %(last)s) g JOIN {TABLE}_centroids ce ON ce.c = 1 + g %% %(clusters)s""",
+                    params)
+        cur.connection.commit()
+        print(f"\r{params['last']:,} / {rows:,} lignes générées...", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+
+    params.update(queries=queries)
+    cur.execute(f"""INSERT INTO {TABLE}_queries (embedding) SELECT {NOISY_VECTOR}
+        FROM generate_series(1, %(queries)s) g
+        JOIN {TABLE}_centroids ce ON ce.c = 1 + (g * 7919) %% %(clusters)s""", params)
+    cur.execute(f"ANALYZE {TABLE}")
+    cur.connection.commit()
+    print(f"Table générée en {time.perf_counter() - started:.0f}s", file=sys.stderr)
+
+
+def search(cur, qid, k):
+    """k plus proches voisins (distance cosinus) ; la requête reste côté serveur (paramètre d'InitPlan)."""
+    started = time.perf_counter()
+    cur.execute(f"""SELECT id FROM {TABLE}
+        ORDER BY embedding <=> (SELECT embedding FROM {TABLE}_queries WHERE qid = %s) LIMIT %s""", (qid, k))
+    ids = {row[0] for row in cur.fetchall()}
+    return ids, time.perf_counter() - started
+
+
+def exact_neighbours(conn, qids, k):
+    with conn.cursor() as cur:
+        # Désactiver les parcours d'index force le calcul exact
+        cur.execute("SET enable_indexscan = off")
+        truth = {}
+        samples = []
+        for n, qid in enumerate(qids, 1):
+            truth[qid], elapsed = search(cur, qid, k)
+            samples.append(elapsed)
+            print(f"\rRecherche exacte : {n} / {len(qids)}", end="", file=sys.stderr, flush=True)
+        print(file=sys.stderr)
+        cur.execute("RESET enable_indexscan")
+    conn.commit()
+    return truth, samples
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def print_row(label, recall, samples):
+    print(f"{label:>22} | {recall:>7.1%} | {statistics.median(samples) * 1000:>8.1f} ms "
+          f"| {percentile(samples, 0.95) * 1000:>8.1f} ms")
+
+
+def measure(conn, method, settings, truth, k):
+    for value in settings:
+        if method == "hnsw":
+            configure_session(conn, ef_search=value)
+            label = f"hnsw ef_search={value}"
+        else:
+            configure_session(conn, probes=value)
+            label = f"ivfflat probes={value}"
+        found = 0
+        samples = []
+        with conn.cursor() as cur:
+            for qid, expected in truth.items():
+                ids, elapsed = search(cur, qid, k)
+                found += len(ids & expected)
+                samples.append(elapsed)
+        conn.commit()
+        print_row(label, found / (k * len(truth)), samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.3, help="Amplitude du bruit autour des centres")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=3, help="Voisins demandés (geni en utilise 3)")
+    parser.add_argument("--method", choices=["hnsw", "ivfflat", "both"], default="both")
+    parser.add_argument("--m", type=int, default=HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--lists", type=int, help="IVFFlat : défaut selon le nombre de lignes")
+    parser.add_argument("--maintenance-work-mem", default="2GB")
+    parser.add_argument("--reuse", action="store_true", help="Réutilise la table générée précédemment")
+    parser.add_argument("--keep", action="store_true", help="Conserve les tables générées")
+    args = parser.parse_args()
+
+    conn = connect(vector=False)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            cur.execute("SELECT to_regclass(%s)", (TABLE,))
+            exists = cur.fetchone()[0] is not None
+            if not (args.reuse and exists):
+                generate(cur, args.rows, args.dim, args.clusters, args.queries, args.noise)
+            cur.execute(f"SELECT qid FROM {TABLE}_queries ORDER BY qid")
+            qids = [row[0] for row in cur.fetchall()]
+            cur.execute(f"SELECT count(*) FROM {TABLE}")
+            rows = cur.fetchone()[0]
+        conn.commit()
+
+        truth, exact_samples = exact_neighbours(conn, qids, args.k)
+        print(f"\n{rows:,} lignes, {len(qids)} requêtes, rappel@{args.k}\n")
+        print(f"{'Réglage':>22} | {'Rappel':>7} | {'Médiane':>11} | {'p95':>11}")
+        print_row("exact (séquentiel)", 1.0, exact_samples)
+
+        methods = ["hnsw", "ivfflat"] if args.method == "both" else [args.method]
+        for method in methods:
+            started = time.perf_counter()
+            with conn.cursor() as cur:
+                cur.execute("SET maintenance_work_mem = %s", (args.maintenance_work_mem,))
+                lists = args.lists or default_lists(rows)
+                build_index(cur, method, args.m, args.ef_construction, lists,
+                            table=TABLE, name=f"{TABLE}_{method}_idx")
+            conn.commit()
+            print(f"{'':>22} | construction {method} : {time.perf_counter() - started:.0f}s")
+            settings = EF_SEARCH_VALUES if method == "hnsw" else [p for p in PROBES_VALUES if p <= lists]
+            measure(conn, method, settings, truth, args.k)
+    finally:
+        if not args.keep:
+            with conn.cursor() as cur:
+                for table in (TABLE, f"{TABLE}_queries", f"{TABLE}_centroids"):
+                    cur.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
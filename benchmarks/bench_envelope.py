@@ -0,0 +1,81 @@
+"""Taille et coût des enveloppes chiffrées : Fernet (v1) face à compression + AES-GCM (v2).
+
+Les charges sont des requêtes /relay réalistes : un prompt fait des fichiers source du dépôt,
+répétés jusqu'à la taille voulue, dans le JSON envoyé au relais. Pour chaque taille et chaque
+format : octets envoyés, temps de chiffrement et de déchiffrement, et durée d'envoi estimée au
+débit du proxy (--bandwidth-kbps). Aucune requête réseau n'est faite.
+
+Usage : python benchmarks/bench_envelope.py [--sizes 10,100,300,1000] [--bandwidth-kbps 2000] [--repeat 5]
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from envelope import Envelope, available_compressions  # noqa: E402
+
+
+def source_text():
+    parts = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "*.py")) + glob.glob(os.path.join(ROOT, "*.md"))):
+        with open(path, "r", encoding="utf-8") as f:
+            parts.append(f"--- {os.path.basename(path)} ---\n{f.read()}")
+    return "\n\n".join(parts)
+
+
+def build_payload(text, size_kb):
+    """Corps JSON d'une requête /relay dont le prompt fait environ size_kb Ko."""
+    target = size_kb * 1024
+    prompt = (text * (target // len(text) + 1))[:target]
+    body = {"internal_token": "x" * 32, "project_id": "bench",
+            "payload": {"model": "bench", "messages": [{"role": "user", "content": prompt}]}}
+    return json.dumps(body).encode()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,300,1000", help="Tailles de prompt en Ko")
+    parser.add_argument("--bandwidth-kbps", type=float, default=2000, help="Débit montant estimé du proxy")
+    parser.add_argument("--repeat", type=int, default=5, help="Mesures par cas (médiane)")
+    args = parser.parse_args()
+
+    key = os.getenv("ENCRYPTION_KEY") or base64.urlsafe_b64encode(os.urandom(32))
+    envelope = Envelope(key)
+    text = source_text()
+    formats = [("v1 fernet", 1, None)] + [(f"v2 {name}", 2, name) for name in reversed(available_compressions())]
+    if "zstd" not in available_compressions():
+        print("zstd absent (paquet zstandard) : seul zlib est mesuré en v2.\n")
+
+    print(f"{'Prompt':>8} | {'Format':>10} | {'Envoyé':>10} | {'Ratio':>6} | {'Chiffrer':>9} | "
+          f"{'Déchiffrer':>10} | {'Envoi estimé':>12}")
+    for size_kb in (int(size) for size in args.sizes.split(",")):
+        payload = build_payload(text, size_kb)
+        for label, version, compression in formats:
+            sealed, seal_time = timed(lambda: envelope.seal(payload, version, compression), args.repeat)
+            opened, open_time = timed(lambda: envelope.open(sealed), args.repeat)
+            assert opened == payload
+            upload = len(sealed) * 8 / (args.bandwidth_kbps * 1000)
+            print(f"{size_kb:>6} Ko | {label:>10} | {len(sealed) / 1024:>7.1f} Ko | {len(sealed) / len(payload):>6.2f} "
+                  f"| {seal_time * 1000:>6.1f} ms | {open_time * 1000:>7.1f} ms | {upload * 1000:>9.0f} ms")
+        print()
+    print(f"Envoi estimé : octets envoyés au débit de {args.bandwidth_kbps:g} kbit/s, hors latence.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Percentiles de latence par stratégie de basculement (sequential, hedge, race).
+
+Par défaut, la pile de modèles est simulée : chaque modèle a une probabilité d'échec
+rapide (429) et une latence de premier token tirée au hasard, ce qui reproduit le cas
+« le premier modèle gratuit est limité ». Avec --log, le rapport est calculé sur les
+mesures réelles enregistrées par ask.py / call_relay.py.
+
+Usage : python benchmarks/bench_failover.py [--runs 50] [--hedge-delay 1.5] [--race-size 2] [--log]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from failover import STRATEGIES, Failover, latency_report, read_latency_log  # noqa: E402
+
+# (probabilité d'échec, latence d'échec, latence moyenne du premier token, durée du flux) en secondes
+SIMULATED_MODELS = {
+    "google/gemini-2.0-flash-001": (0.35, 0.6, 1.2, 0.8),
+    "google/gemini-2.0-pro-exp-02-05:free": (0.5, 0.9, 2.5, 1.5),
+    "meta-llama/llama-3.3-70b-instruct:free": (0.2, 0.7, 1.8, 1.2),
+    "openrouter/auto": (0.05, 0.5, 1.5, 1.0),
+}
+
+
+def simulated_attempt(scale, rng):
+    def attempt(model, handle):
+        fail_rate, fail_after, ttft, duration = SIMULATED_MODELS[model]
+        if rng.random() < fail_rate:
+            time.sleep(fail_after * scale)
+            raise RuntimeError("429 Too Many Requests")
+        time.sleep(rng.expovariate(1 / ttft) * scale)
+        for _ in range(5):
+            yield "token "
+            time.sleep(duration * scale / 5)
+
+    return attempt
+
+
+def print_report(report, unit_scale=1.0):
+    print(f"{'Stratégie':<12}{'n':>5} | {'TTFT p50':>9}{'p90':>8}{'p99':>8} | {'Total p50':>10}{'p90':>8}{'p99':>8}")
+    for strategy, stats in report.items():
+        ttft = stats.get("ttft", {})
+        total = stats.get("total", {})
+        cells = [ttft.get(k, 0) / unit_scale for k in ("p50", "p90", "p99")]
+        cells += [total.get(k, 0) / unit_scale for k in ("p50", "p90", "p99")]
+        print(f"{strategy:<12}{stats['count']:>5} | {cells[0]:>8.2f}s{cells[1]:>7.2f}s{cells[2]:>7.2f}s"
+              f" | {cells[3]:>9.2f}s{cells[4]:>7.2f}s{cells[5]:>7.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--hedge-delay", type=float, default=1.5)
+    parser.add_argument("--race-size", type=int, default=2)
+    parser.add_argument("--scale", type=float, default=0.05,
+                        help="Facteur de compression du temps simulé (les résultats sont ramenés à l'échelle réelle)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log", action="store_true", help="Rapport sur les mesures réelles enregistrées")
+    args = parser.parse_args()
+
+    if args.log:
+        entries = read_latency_log()
+        if not entries:
+            print("Aucune mesure enregistrée pour l'instant.")
+            return
+        print_report(latency_report(entries))
+        return
+
+    entries = []
+    for strategy in STRATEGIES:
+        rng = random.Random(args.seed)  # Même tirage pour chaque stratégie
+        for _ in range(args.runs):
+            failover = Failover(SIMULATED_MODELS, simulated_attempt(args.scale, rng), strategy=strategy,
+                                hedge_delay=args.hedge_delay * args.scale, race_size=args.race_size,
+                                retry_pause=0.3 * args.scale, health=False)
+            for _ in failover.stream():
+                pass
+            entries.append({
+                "strategy": strategy,
+                "winner": failover.winner,
+                "ttft": failover.first_chunk_at - failover.started_at if failover.first_chunk_at else None,
+                "total": failover.finished_at - failover.started_at,
+            })
+
+    print(f"=== Pile simulée : {args.runs} requêtes par stratégie "
+          f"(hedge {args.hedge_delay}s, race {args.race_size}) ===")
+    print_report(latency_report(entries), unit_scale=args.scale)
+
+
+if __name__ == "__main__":
+    main()
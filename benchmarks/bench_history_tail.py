@@ -0,0 +1,88 @@
+"""Coût de la recherche de la dernière interaction selon la taille de historique_global.md.
+
+Compare l'ancienne méthode de consolidate.py (lecture complète + re.findall) à la lecture
+depuis la fin du fichier (history_file.iter_blocks_reverse) sur des historiques synthétiques.
+
+Usage : python benchmarks/bench_history_tail.py [--sizes 1,100,1000] [--runs 5] [--dir /tmp]
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from history_file import DELIMITER, iter_blocks_reverse  # noqa: E402
+
+ENTRY = ("\n" + DELIMITER + "\nDATE   : 2025-01-01 12:00:00\nPROMPT : Question numéro {i}\n" + "-" * 50 + "\n"
+         + "Réponse détaillée avec du **Markdown** et du code.\n" * 30)
+
+
+def build_history(path, size_mb):
+    """Écrit un historique d'environ size_mb Mo (réutilisé s'il existe déjà)."""
+    target = size_mb * 1024 * 1024
+    if os.path.exists(path) and os.path.getsize(path) >= target:
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        written = i = 0
+        while written < target:
+            chunk = "".join(ENTRY.format(i=i + k) for k in range(1000))
+            f.write(chunk)
+            written += len(chunk.encode("utf-8"))
+            i += 1000
+
+
+def last_prompt_full(path):
+    """Ancienne méthode : tout le fichier en mémoire, puis la dernière correspondance."""
+    with open(path, "r", encoding="utf-8") as f:
+        matches = re.findall(r"PROMPT : (.*?)\n", f.read())
+    return matches[-1] if matches else None
+
+
+def last_prompt_tail(path):
+    for block in iter_blocks_reverse(path):
+        matches = re.findall(r"PROMPT : (.*?)\n", block)
+        if matches:
+            return matches[-1]
+    return None
+
+
+def timed(fn, path, runs):
+    samples = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn(path)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,100,1000", help="Tailles en Mo, séparées par des virgules")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="Dossier des historiques générés")
+    parser.add_argument("--keep", action="store_true", help="Conserve les fichiers générés")
+    args = parser.parse_args()
+
+    print(f"{'Taille':>8} | {'Lecture complète':>16} | {'Depuis la fin':>13} | {'Gain':>8}")
+    for size_mb in (int(s) for s in args.sizes.split(",")):
+        path = os.path.join(args.dir, f"historique_bench_{size_mb}mo.md")
+        build_history(path, size_mb)
+        try:
+            full_time, full_result = timed(last_prompt_full, path, args.runs)
+            tail_time, tail_result = timed(last_prompt_tail, path, args.runs)
+            assert full_result == tail_result, (full_result, tail_result)
+            print(f"{size_mb:>5} Mo | {full_time * 1000:>13.1f} ms | {tail_time * 1000:>10.2f} ms "
+                  f"| {full_time / tail_time:>7.0f}x")
+        finally:
+            if not args.keep:
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
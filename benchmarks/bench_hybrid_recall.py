@@ -0,0 +1,115 @@
+"""Recherche hybride (vectorielle + lexicale, fusion RRF) face à la recherche vectorielle seule.
+
+Deux jeux de requêtes sont construits à partir de chat_history :
+- questions : la question d'origine de chaque échange (PROMPT), l'échange est la cible ;
+- identifiants : une phrase qui cite l'identifiant le plus rare de l'échange (nom de classe,
+  route, code d'erreur...), le cas que la similarité cosinus seule rate le plus souvent.
+
+Pour chaque mode : taux de cible dans les 3 souvenirs renvoyés (comme geni), rang réciproque
+moyen et latence (médiane, p95) de la requête SQL.
+
+Usage : python benchmarks/bench_hybrid_recall.py [--limit 100] [--project mon_projet] [--relay]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import memory_db  # noqa: E402
+import semantic_cache  # noqa: E402
+from semantic_cache_report import embedder  # noqa: E402
+
+IDENTIFIER_QUERY = "Où avons-nous parlé de {term} ?"
+
+
+def build_queries(entries, limit):
+    """[(jeu, texte de la requête, contenu cible)] pour les échanges les plus récents."""
+    document_frequency = Counter()
+    terms_by_entry = []
+    for content in entries:
+        terms = set(memory_db.identifier_terms(content))
+        terms_by_entry.append(terms)
+        document_frequency.update(terms)
+
+    queries = []
+    for content, terms in list(zip(entries, terms_by_entry))[:limit]:
+        parsed = semantic_cache.parse_entry(content)
+        if parsed:
+            queries.append(("questions", parsed[0], content))
+        rare = sorted((document_frequency[term], term) for term in terms if document_frequency[term] <= 3)
+        if rare:
+            queries.append(("identifiants", IDENTIFIER_QUERY.format(term=rare[0][1]), content))
+    return queries
+
+
+def evaluate(cur, queries, embed, project_id, mode):
+    memory_db.RECALL_MODE = mode
+    results = {}
+    for query_set, text, target in queries:
+        embedding = embed(text)
+        if embedding is None:
+            continue
+        started = time.perf_counter()
+        contents = memory_db.recall(cur, embedding, project_id, limit=3, fallback=False, text=text)
+        elapsed = time.perf_counter() - started
+        rank = contents.index(target) + 1 if target in contents else None
+        results.setdefault(query_set, []).append((rank, elapsed))
+    return results
+
+
+def report(results_by_mode):
+    print(f"{'Jeu':>13} | {'Mode':>7} | {'Cible top 3':>11} | {'MRR':>5} | {'Médiane':>9} | {'p95':>9}")
+    for query_set in ("questions", "identifiants"):
+        for mode, results in results_by_mode.items():
+            samples = results.get(query_set)
+            if not samples:
+                continue
+            hits = sum(1 for rank, _ in samples if rank)
+            mrr = sum(1 / rank for rank, _ in samples if rank) / len(samples)
+            latencies = sorted(elapsed for _, elapsed in samples)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(f"{query_set:>13} | {mode:>7} | {hits / len(samples):>10.0%} | {mrr:>5.2f} "
+                  f"| {statistics.median(latencies) * 1000:>6.1f} ms | {p95 * 1000:>6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=100, help="Nombre d'échanges évalués (les plus récents)")
+    parser.add_argument("--project", help="Limite l'évaluation à un projet (colonne project_id)")
+    parser.add_argument("--relay", action="store_true", help="Embeddings via le relais (/embed)")
+    args = parser.parse_args()
+
+    conn = memory_db.connect()
+    try:
+        with conn.cursor() as cur:
+            where = "WHERE project_id = %s" if args.project else ""
+            cur.execute(f"SELECT content FROM chat_history {where} ORDER BY created_at DESC",
+                        [args.project] if args.project else [])
+            entries = [row[0] for row in cur.fetchall()]
+            queries = build_queries(entries, args.limit)
+            if not queries:
+                print("Aucun échange exploitable dans chat_history.")
+                return
+
+            embed = embedder(args.relay)
+            # Embeddings calculés une fois (cache local) avant les mesures de latence
+            for _, text, _ in queries:
+                embed(text)
+
+            results_by_mode = {mode: evaluate(cur, queries, embed, args.project, mode)
+                               for mode in ("vector", "hybrid")}
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"{len(queries)} requêtes sur {len(entries)} échanges.\n")
+    report(results_by_mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Mesure le surcoût de la chaîne geni → glog → ask en sous-processus.
+
+Chaque question lançait deux interpréteurs (glog puis ask), qui réimportaient openai, rich, le
+.env... avant d'interroger le modèle. Le script compare, pour une même question servie par un
+faux OpenRouter local (réponse immédiate) :
+- chaîne   : subprocess.run([python, glog]) qui lance à son tour [python, ask] (ancien geni) ;
+- direct   : ask_question appelé dans le processus de geni, glog déjà importé (geni actuel).
+Chaque mesure part d'un interpréteur neuf où glog est déjà chargé, comme au démarrage de geni :
+seul l'aller-retour de la question est chronométré (import d'openai et requête HTTP compris).
+
+Usage : python benchmarks/bench_pipeline.py [--runs 10] [--relay]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUESTION = "Que fait ce code ?"
+CONTEXT = "def add(a, b):\n    return a + b\n" * 20
+ANSWER = "Il additionne deux nombres."
+
+
+class StubUpstream(BaseHTTPRequestHandler):
+    """Faux OpenRouter (chat completions) et faux relais (/relay, corps chiffré) : réponse immédiate."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._send(404, b"{}")  # /health : relais sans négociation d'enveloppe
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/relay"):
+            from envelope import Envelope
+
+            json.loads(Envelope(os.environ["ENCRYPTION_KEY"]).open(body))  # Déchiffré comme le vrai relais
+        reply = {"id": "bench", "object": "chat.completion", "created": 0, "model": "bench",
+                 "choices": [{"index": 0, "finish_reason": "stop",
+                              "message": {"role": "assistant", "content": ANSWER}}]}
+        self._send(200, json.dumps(reply).encode())
+
+    def _send(self, status, content):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def bench_env(stub_url):
+    """Variables des processus mesurés : faux serveur, caches et journaux dans un dossier jetable."""
+    from cryptography.fernet import Fernet
+
+    env = dict(os.environ)
+    env.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    env.setdefault("OPENROUTER_API_KEY", "bench")
+    env.update({
+        "BENCH_STUB_URL": stub_url,
+        "RELAY_URL": f"{stub_url}/relay",
+        "HOME": tempfile.mkdtemp(prefix="bench_pipeline_"),
+        "RESPONSE_CACHE": "0",
+        "MODEL_HEALTH": "0",
+        "PYTHONIOENCODING": "utf-8",
+    })
+    env["USERPROFILE"] = env["HOME"]  # Windows
+    os.environ.update(env)
+    return env
+
+
+def install_stub():
+    """ask.py vise https://openrouter.ai : le client OpenAI est redirigé vers le faux serveur."""
+    if not os.environ.get("BENCH_STUB_URL"):
+        return
+    import openai
+
+    real = openai.OpenAI
+    openai.OpenAI = lambda **kwargs: real(**{**kwargs, "base_url": os.environ["BENCH_STUB_URL"]})
+
+
+# --- Processus enfants ---
+
+def child(role, glog_module, ask_module):
+    if role == "ask":
+        # Ancien ask.py : question en argument, contexte sur stdin, réponse sur stdout
+        install_stub()
+        module = __import__(ask_module)
+        sys.argv = [ask_module, QUESTION, "--no-cache"]
+        module.ask()
+        return
+
+    if role == "glog":
+        # Ancien glog.py : ses propres imports, puis ask.py en sous-processus
+        __import__(glog_module)
+        result = subprocess.run([sys.executable, __file__, "--child", "ask", "--modules", glog_module, ask_module],
+                                input=sys.stdin.read(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                text=True, encoding="utf-8", check=True)
+        assert ANSWER in result.stdout
+        return
+
+    # Processus « geni » : glog importé au démarrage, hors mesure
+    __import__(glog_module)
+    ask = __import__(ask_module)
+    started = time.perf_counter()
+    if role == "chain":
+        subprocess.run([sys.executable, __file__, "--child", "glog", "--modules", glog_module, ask_module],
+                       input=CONTEXT, stderr=subprocess.DEVNULL, text=True, encoding="utf-8", check=True)
+    else:
+        install_stub()
+        ask.console.quiet = True
+        prompt = ask.build_prompt(QUESTION, CONTEXT)
+        args = (prompt, "bench") if ask_module == "call_relay" else (prompt,)
+        assert ask.ask_question(*args, use_cache=False) == ANSWER
+    print(json.dumps({"elapsed": time.perf_counter() - started}))
+
+
+def measure(role, modules, env):
+    result = subprocess.run([sys.executable, __file__, "--child", role, "--modules", *modules],
+                            cwd=env["HOME"], env=env, capture_output=True, text=True, encoding="utf-8")
+    if result.returncode != 0:
+        raise RuntimeError(f"Mesure {role} en échec :\n{result.stderr[-800:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])["elapsed"]
+
+
+def summarize(label, samples):
+    ms = [s * 1000 for s in samples]
+    print(f"{label:<38} médiane {statistics.median(ms):8.1f} ms | moyenne {statistics.mean(ms):8.1f} ms")
+    return statistics.median(ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--relay", action="store_true", help="Mesure glog_relay → call_relay")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--modules", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, *args.modules)
+        return
+
+    modules = ("glog_relay", "call_relay") if args.relay else ("glog", "ask")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubUpstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = bench_env(f"http://127.0.0.1:{server.server_port}")
+
+    print(f"=== {modules[0]} → {modules[1]}, faux OpenRouter local ({args.runs} exécutions) ===")
+    chain, direct = [], []
+    for _ in range(args.runs):
+        chain.append(measure("chain", modules, env))
+        direct.append(measure("direct", modules, env))
+    server.shutdown()
+
+    before = summarize("Sous-processus (2 interpréteurs)", chain)
+    after = summarize("Appel direct dans le processus", direct)
+    print(f"\n➡️  Gain par question : {before - after:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
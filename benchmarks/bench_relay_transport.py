@@ -0,0 +1,88 @@
+"""Latence par requête vers le relais : requests.post isolé face à la session partagée.
+
+Trois modes sont comparés sur la même série de requêtes :
+- bare    : un requests.post par requête, comme avant relay_transport.py (DNS + TCP + TLS à chaque fois) ;
+- session : la session partagée de relay_transport (connexions gardées ouvertes) ;
+- http2   : la même, en HTTP/2 via httpx (si httpx[http2] est installé).
+
+Par défaut, les requêtes sont de simples GET /health : seul le coût de transport est mesuré (une
+réponse 404 convient). --embed envoie de vraies requêtes /embed chiffrées, comme glog_relay.
+
+Usage : python benchmarks/bench_relay_transport.py [--requests 20] [--embed]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import relay_transport  # noqa: E402
+
+
+def build_request(embed):
+    """(méthode, url, corps) de la requête mesurée."""
+    if not embed:
+        return "GET", relay_transport.relay_url("health"), None
+
+    from cryptography.fernet import Fernet
+
+    cipher = Fernet(os.getenv("ENCRYPTION_KEY").encode())
+    body = {"internal_token": os.getenv("SECRET_TOKEN"), "text": "Mesure de latence du relais"}
+    return "POST", relay_transport.relay_url("embed"), cipher.encrypt(json.dumps(body).encode())
+
+
+def measure(send, count):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = send()
+        _ = response.text  # Corps lu en entier
+        response.close()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def report(label, samples):
+    following = samples[1:] or samples
+    p95 = sorted(following)[min(len(following) - 1, int(len(following) * 0.95))]
+    print(f"{label:>8} | {samples[0] * 1000:>9.0f} ms | {statistics.median(following) * 1000:>9.0f} ms "
+          f"| {p95 * 1000:>9.0f} ms | {sum(samples):>7.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20, help="Requêtes par mode")
+    parser.add_argument("--embed", action="store_true", help="Vraies requêtes /embed chiffrées")
+    args = parser.parse_args()
+
+    if not relay_transport.RELAY_URL:
+        print("RELAY_URL n'est pas défini.")
+        return
+
+    import requests
+
+    method, url, body = build_request(args.embed)
+    timeout = (relay_transport.CONNECT_TIMEOUT, relay_transport.READ_TIMEOUT)
+    modes = [("bare", lambda: requests.request(method, url, data=body, timeout=timeout))]
+
+    shared = relay_transport._RequestsSession()
+    modes.append(("session", lambda: shared.request(method, url, data=body)))
+    if relay_transport._http2_available():
+        multiplexed = relay_transport._HttpxSession()
+        modes.append(("http2", lambda: multiplexed.request(method, url, data=body)))
+    else:
+        print("httpx[http2] absent : mode http2 ignoré.\n")
+
+    print(f"{args.requests} requêtes {method} {url}\n")
+    print(f"{'Mode':>8} | {'1re requête':>12} | {'Médiane':>12} | {'p95':>12} | {'Total':>9}")
+    for label, send in modes:
+        report(label, measure(send, args.requests))
+    print("\nMédiane et p95 : requêtes suivant la première (connexion déjà ouverte pour session et http2).")
+
+
+if __name__ == "__main__":
+    main()
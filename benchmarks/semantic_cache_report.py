@@ -0,0 +1,116 @@
+"""Précision / rappel du cache sémantique selon le seuil de similarité.
+
+Chaque question de l'historique (chat_history) est ré-embeddée puis comparée aux questions des
+autres échanges (question_embedding), exactement comme le fait le cache avant d'appeler le LLM.
+Les échanges sans question_embedding (python semantic_cache.py --backfill) sont ignorés. Une
+réutilisation est jugée correcte si l'échange le plus proche porte sur la même question (prompt
+identique à la casse et aux espaces près) : les reformulations comptent comme des erreurs, la
+précision affichée est donc une borne basse.
+
+Usage : python benchmarks/semantic_cache_report.py [--limit 200] [--project mon_projet] [--relay]
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import semantic_cache  # noqa: E402
+
+THRESHOLDS = [0.85, 0.88, 0.90, 0.92, 0.93, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99]
+
+
+def same_question(a, b):
+    return " ".join(a.lower().split()) == " ".join(b.lower().split())
+
+
+def embedder(relay):
+    """Fonction d'embedding identique à celle utilisée par glog / glog_relay."""
+    if relay:
+        from glog_relay import get_remote_embedding
+        return get_remote_embedding
+
+    from embedding_cache import gemini_embedding
+    return gemini_embedding
+
+
+def collect(cur, embed, limit, project_id):
+    """Pour chaque question : (similarité du plus proche voisin, voisin correct ?, doublon existant ?)."""
+    where = "AND project_id = %s" if project_id else ""
+    cur.execute(f"SELECT id, content FROM chat_history WHERE question_embedding IS NOT NULL {where} "
+                "ORDER BY created_at DESC",
+                [project_id] if project_id else [])
+    entries = []
+    for row_id, content in cur.fetchall():
+        parsed = semantic_cache.parse_entry(content)
+        if parsed:
+            entries.append((row_id, parsed[0]))
+
+    samples = []
+    for row_id, question in entries[:limit]:
+        embedding = embed(question)
+        if embedding is None:
+            continue
+        params = [embedding, row_id]
+        sql = ("SELECT content, 1 - (question_embedding <=> %s::vector) FROM chat_history "
+               "WHERE id <> %s AND question_embedding IS NOT NULL")
+        if project_id:
+            sql += " AND project_id = %s"
+            params.append(project_id)
+        cur.execute(sql + " ORDER BY question_embedding <=> %s::vector LIMIT 1", params + [embedding])
+        row = cur.fetchone()
+        if not row:
+            continue
+        neighbour = semantic_cache.parse_entry(row[0])
+        correct = bool(neighbour) and same_question(neighbour[0], question)
+        has_duplicate = any(same_question(q, question) for other_id, q in entries if other_id != row_id)
+        samples.append((float(row[1]), correct, has_duplicate))
+        print(f"\r{len(samples)} questions évaluées...", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    return samples
+
+
+def report(samples, target_precision):
+    duplicates = sum(1 for _, _, dup in samples if dup)
+    print(f"{len(samples)} questions, dont {duplicates} déjà posées à l'identique.\n")
+    print(f"{'Seuil':>6} | {'Réutilisées':>11} | {'Précision':>9} | {'Rappel':>7}")
+
+    suggested = None
+    for threshold in THRESHOLDS:
+        reused = [(sim, correct) for sim, correct, _ in samples if sim >= threshold]
+        true_positives = sum(1 for _, correct in reused if correct)
+        precision = true_positives / len(reused) if reused else 1.0
+        recall = true_positives / duplicates if duplicates else 0.0
+        print(f"{threshold:>6.2f} | {len(reused):>11} | {precision:>8.0%} | {recall:>6.0%}")
+        if suggested is None and reused and precision >= target_precision:
+            suggested = threshold
+
+    if suggested is not None:
+        print(f"\nSeuil suggéré (précision ≥ {target_precision:.0%}) : SEMANTIC_CACHE_THRESHOLD={suggested:.2f}")
+    else:
+        print(f"\nAucun seuil n'atteint {target_precision:.0%} de précision : gardez SEMANTIC_CACHE=off.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=200, help="Nombre de questions évaluées (les plus récentes)")
+    parser.add_argument("--project", help="Limite l'évaluation à un projet (colonne project_id)")
+    parser.add_argument("--relay", action="store_true", help="Embeddings via le relais (/embed)")
+    parser.add_argument("--target-precision", type=float, default=0.95)
+    args = parser.parse_args()
+
+    from memory_db import connect
+
+    with connect() as conn:
+        with conn.cursor() as cur:
+            samples = collect(cur, embedder(args.relay), args.limit, args.project)
+
+    if not samples:
+        print("Aucun échange exploitable dans chat_history.")
+        return
+    report(samples, args.target_precision)
+
+
+if __name__ == "__main__":
+    main()
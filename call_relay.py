@@ -1,13 +1,13 @@
 import os
 import sys
-import re
-import time
-from cryptography.fernet import Fernet
-import requests
-import json
 from dotenv import load_dotenv
 from rich.console import Console
 
+import relay_transport
+import response_cache
+from failover import Failover
+from streaming import ThinkFilter, iter_sse_deltas
+
 # --- Configuration de l'environnement ---
 load_dotenv()
 
@@ -24,78 +24,172 @@ SECRET_TOKEN = os.getenv("SECRET_TOKEN")
 RELAY_URL = os.getenv("RELAY_URL")
 LOCAL_BIN = os.getenv("LOCAL_BIN")
 
+# Pile de modèles (failover)
+MODELS = [
+    "google/gemini-2.0-flash-001",
+    "google/gemini-2.0-pro-exp-02-05:free",
+    "meta-llama/llama-3.3-70b-instruct:free"
+]
+
 
 def get_project_id():
     """Récupère le nom du dossier courant pour isoler le contexte."""
     return os.path.basename(os.getcwd())
 
 
-def ask_question(user_prompt, project_id):
-    cipher = Fernet(ENCRYPTION_KEY)
+class RelayError(Exception):
+    """Réponse du relais inexploitable (statut HTTP, erreur OpenRouter, format inconnu)."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _retry_after(response):
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
 
-    # Pile de modèles
-    models = [
-        "google/gemini-2.0-flash-001",
-        "google/gemini-2.0-pro-exp-02-05:free",
-        "meta-llama/llama-3.3-70b-instruct:free"
-    ]
+
+def _relay_attempt(user_prompt, project_id):
+    """Fabrique le générateur de morceaux bruts (balises <think> comprises) pour un modèle.
+
+    La requête est toujours streamée, même si l'appelant attend la réponse d'un bloc (ask_question
+    réunit les morceaux) : la réponse existe dès les en-têtes reçus et un perdant peut être interrompu.
+    """
+    def attempt(model_name, handle):
+        # Construire le payload comme attendu par relay.py. On ajoute project_id pour filtrer par projet.
+        payload = {
+            "model": model_name,
+            "messages": [{"role": "user", "content": user_prompt}],
+            "project_id": project_id,
+            "max_tokens": 4000,
+            "stream": True
+        }
+
+        data_to_send = {
+            "internal_token": SECRET_TOKEN,
+            "payload": payload
+        }
+
+        # Chiffrement (enveloppe négociée avec le relais) et requête, sur une connexion gardée ouverte
+        # entre les modèles (voir relay_transport.py et envelope.py)
+        response = relay_transport.post_json(RELAY_URL, data_to_send, stream=True)
+        # Perdant d'une course : connexion fermée sans attendre le prochain morceau
+        # (l'attente des en-têtes elle-même est bornée par RELAY_READ_TIMEOUT)
+        handle.on_cancel(response.close)
+        try:
+            if response.status_code != 200:
+                raise RelayError(f"Erreur Relais ({response.status_code})", response.status_code,
+                                 _retry_after(response))
+
+            # Le relais renvoie le flux SSE d'OpenRouter tel quel (ou chiffré en enveloppe v2)
+            if relay_transport.is_stream(response):
+                yield from iter_sse_deltas(relay_transport.iter_lines(response))
+                return
+
+            resp_json = relay_transport.json_body(response)
+
+            # Traitement de la réponse (relais sans support du flux : la réponse arrive d'un bloc)
+            if "choices" in resp_json:
+                yield resp_json['choices'][0]['message']['content']
+            elif "error" in resp_json:
+                # On remonte l'erreur réelle d'OpenRouter (souvent le manque de crédits ou quota)
+                error = resp_json["error"]
+                code = error.get("code")
+                raise RelayError(error.get("message", "Erreur inconnue"), code if isinstance(code, int) else None,
+                                 _retry_after(response))
+            else:
+                raise RelayError("Format de réponse inconnu")
+        finally:
+            response.close()
+
+    return attempt
+
+
+def ask_question(user_prompt, project_id, stream=False, on_token=None, strategy=None, use_cache=True):
+    """Interroge la pile de modèles via le relais. En mode stream, chaque morceau nettoyé est transmis à on_token.
+
+    strategy : sequential, hedge ou race (défaut : FAILOVER_STRATEGY).
+    use_cache : False pour ignorer le cache des réponses (option --no-cache).
+    """
+    models = list(MODELS)
+
+    # Question déjà posée à l'identique : aucun aller-retour avec le relais
+    use_cache = use_cache and response_cache.ENABLED
+    cached = response_cache.lookup(models, user_prompt) if use_cache else None
+    if cached:
+        console.print(f"[bold green]⚡ Réponse en cache ({cached.get('winner')})[/bold green]")
+        if on_token:
+            on_token(cached["response"])
+        return cached["response"]
 
     with console.status("[bold blue]Initialisation via Relais [{project_id}]...[/bold blue]", spinner="dots") as status:
-        for model_name in models:
-            status.update(f"[bold blue]Réflexion avec {model_name}...[/bold blue]")
-
-            # Construire le payload comme attendu par relay.py. On ajoute project_id pour filtrer par projet.
-            payload = {
-                "model": model_name,
-                "messages": [{"role": "user", "content": user_prompt}],
-                "project_id": project_id,
-                "max_tokens": 4000
-            }
-
-            data_to_send = {
-                "internal_token": SECRET_TOKEN,
-                "payload": payload
-            }
-
-            try:
-                # Chiffrement
-                encrypted_data = cipher.encrypt(json.dumps(data_to_send).encode())
-
-                # Requête vers le relais
-                response = requests.post(RELAY_URL, data=encrypted_data)
-
-                if response.status_code != 200:
-                    console.print(f"[red]❌ Erreur Relais ({response.status_code})[/red]")
-                    continue
-
-                resp_json = response.json()
-
-                # Traitement de la réponse
-                if "choices" in resp_json:
-                    raw_content = resp_json['choices'][0]['message']['content']
-                    return re.sub(r'<think>.*?</think>', '', raw_content, flags=re.DOTALL).strip()
-                elif "error" in resp_json:
-                    # On affiche l'erreur réelle d'OpenRouter (souvent le manque de crédits ou quota)
-                    err_msg = resp_json["error"].get("message", "Erreur inconnue")
-                    console.print(f"[yellow]⚠️  Modèle {model_name} indisponible : {err_msg[:100]}[/yellow]")
-                else:
-                    console.print(f"[red]❓ Format de réponse inconnu pour {model_name}[/red]")
-
-            except Exception as e:
+        def on_event(kind, model_name, detail=None):
+            if kind == "start":
+                status.update(f"[bold blue]Réflexion avec {model_name}...[/bold blue]")
+            elif kind == "hedge":
+                console.print(f"[cyan]⏩ Aucun token après {detail:.1f} s : {model_name} lancé en parallèle...[/cyan]")
+            elif kind == "skip":
+                remaining, status_code = detail
+                console.print(f"[dim]⏭️  {model_name} ignoré (erreur {status_code}, "
+                              f"nouvel essai dans {remaining:.0f} s)[/dim]")
+            elif kind == "cancel" and detail:
+                console.print(f"[dim]✂️  Requête annulée : {model_name}[/dim]")
+            elif kind == "fail" and isinstance(detail, RelayError):
+                console.print(f"[yellow]⚠️  Modèle {model_name} indisponible : {str(detail)[:100]}[/yellow]")
+            elif kind == "fail":
                 # Affichage propre de la cause
-                console.print(f"[bold red]⚠️  ÉCHEC : {model_name} | Erreur: {type(e).__name__}[/bold red]")
-                time.sleep(0.5)
-                continue
-
+                console.print(f"[bold red]⚠️  ÉCHEC : {model_name} | Erreur: {type(detail).__name__}[/bold red]")
+
+        failover = Failover(models, _relay_attempt(user_prompt, project_id), strategy=strategy,
+                            on_event=on_event, retry_pause=0.5)
+
+        # Une réponse déjà partiellement affichée ne peut plus basculer sur un autre modèle :
+        # Failover ne bascule que tant qu'aucun morceau n'a été reçu.
+        think_filter = ThinkFilter()
+        parts = []
+        first_chunk = True
+        try:
+            for raw in failover.stream():
+                if first_chunk:
+                    first_chunk = False
+                    # Le spinner s'arrête dès que le modèle commence à répondre
+                    status.stop()
+                    if stream:
+                        console.print(f"[dim]⏱️  Premier token en "
+                                      f"{failover.first_chunk_at - failover.started_at:.2f} s "
+                                      f"({failover.winner})[/dim]")
+
+                text = think_filter.feed(raw)
+                if text:
+                    parts.append(text)
+                    if on_token:
+                        on_token(text)
+
+            text = think_filter.flush()
+            if text:
+                parts.append(text)
+                if on_token:
+                    on_token(text)
+        finally:
+            failover.record_latency()
+
+    if failover.winner is None:
         return None
+    answer = "".join(parts).strip()
+    if use_cache and answer:
+        response_cache.store(models, user_prompt, answer, failover.winner)
+    return answer
 
 
 # --- Gestion des entrées et du workflow ---
 
-def ask():
-    # Détection du contexte projet
-    project_id = get_project_id()
-
+def build_prompt(user_query, pipe_content):
+    """Assemble le prompt final : instructions système, contexte (pipe) et question."""
     # Lecture du prompt système (si présent)
     system_prompt_path = fr"{LOCAL_BIN}\prompt_system.txt"
     system_content = ""
@@ -103,10 +197,6 @@ def ask():
         with open(system_prompt_path, 'r', encoding='utf-8') as f:
             system_content = f.read().strip()
 
-    # Capture du flux (Pipe) ou des arguments
-    pipe_content = sys.stdin.read().strip() if not sys.stdin.isatty() else ""
-    user_query = " ".join(sys.argv[1:]).strip()
-
     # Assemblage final
     parts = []
     if system_content:
@@ -116,15 +206,40 @@ def ask():
     if user_query:
         parts.append(f"### USER QUERY ###\n{user_query}")
 
-    prompt_final = "\n\n---\n\n".join(parts)
+    return "\n\n---\n\n".join(parts)
+
+
+def ask():
+    # Connexion au relais ouverte pendant la lecture du pipe et la préparation du prompt
+    relay_transport.warm_up()
+
+    # Détection du contexte projet
+    project_id = get_project_id()
+
+    # Capture du flux (Pipe) ou des arguments
+    pipe_content = sys.stdin.read().strip() if not sys.stdin.isatty() else ""
+    # --stream : la réponse est écrite sur stdout au fil des tokens
+    # --no-cache : la question est reposée même si une réponse identique est en cache
+    stream = "--stream" in sys.argv[1:]
+    use_cache = "--no-cache" not in sys.argv[1:]
+    user_query = " ".join(arg for arg in sys.argv[1:] if arg not in ("--stream", "--no-cache")).strip()
+
+    prompt_final = build_prompt(user_query, pipe_content)
 
     if not prompt_final.strip():
         console.print("Usage: glog 'votre question' ou cat file | glog")
         return
 
     try:
-        response = ask_question(prompt_final, project_id)
-        # On utilise le print() natif, glog se chargeant d'ajouter les styles.
+        if stream:
+            response = ask_question(prompt_final, project_id, stream=True, use_cache=use_cache,
+                                    on_token=lambda t: print(t, end="", flush=True))
+            if response:
+                print()
+            return
+
+        response = ask_question(prompt_final, project_id, use_cache=use_cache)
+        # On utilise le print() natif : la sortie reste exploitable dans un pipe.
         if response:
             print(response)
     except Exception as e:
@@ -133,4 +248,8 @@ def ask():
 
 
 if __name__ == "__main__":
-    ask()
+    if "--profile-startup" in sys.argv[1:]:
+        from startup_profile import report_startup
+        report_startup("call_relay")
+    else:
+        ask()
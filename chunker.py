@@ -0,0 +1,174 @@
+"""Découpage des échanges en morceaux (chunks) Markdown pour l'indexation vectorielle.
+
+Un échange complet (en-tête + réponse de plusieurs milliers de tokens) est tronqué par l'API
+d'embedding et injecté en entier dans le prompt au rappel. Chaque échange est donc aussi découpé
+en morceaux d'environ CHUNK_CHARS caractères qui se recouvrent de CHUNK_OVERLAP caractères :
+- les blocs de code, titres et paragraphes ne sont jamais coupés au milieu (sauf bloc trop long,
+  coupé entre deux lignes et refermé proprement) ;
+- chaque morceau commence par la question d'origine et le titre de sa section, pour que son
+  embedding garde le contexte.
+
+Les morceaux sont rangés dans chat_chunks (parent_id = chat_history.id, voir migrations.py).
+
+Usage : python chunker.py --backfill [--batch-size 20]   # découpe les échanges déjà indexés
+"""
+import os
+import re
+import sys
+
+from semantic_cache import parse_entry
+
+CHUNK_CHARS = int(os.environ.get("CHUNK_CHARS", "1500"))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "200"))
+
+FENCE = re.compile(r"^\s*(```|~~~)")
+HEADING = re.compile(r"^#{1,6}\s")
+
+
+def markdown_blocks(text):
+    """Blocs insécables : bloc de code complet, titre, ou paragraphe (jusqu'à la ligne vide)."""
+    blocks = []
+    current = []
+    fence = None
+    for line in text.split("\n"):
+        if fence:
+            current.append(line)
+            if line.strip().startswith(fence):
+                blocks.append("\n".join(current))
+                current, fence = [], None
+            continue
+
+        match = FENCE.match(line)
+        if match or HEADING.match(line) or not line.strip():
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+        if match:
+            fence = match.group(1)
+            current.append(line)
+        elif HEADING.match(line):
+            blocks.append(line)
+        elif line.strip():
+            current.append(line)
+    if current:
+        blocks.append("\n".join(current))  # Bloc de code non refermé compris
+    return blocks
+
+
+def _split_block(block, max_chars):
+    """Coupe un bloc trop long entre deux lignes ; un bloc de code est refermé puis rouvert."""
+    lines = block.split("\n")
+    fence = FENCE.match(lines[0])
+    opener = lines[0] if fence else None
+    closer = fence.group(1) if fence else None
+    budget = max_chars
+    if fence:
+        lines = lines[1:-1] if lines[-1].strip().startswith(closer) else lines[1:]
+        # Lignes d'ouverture et de fermeture ajoutées à chaque morceau : comptées dans la limite
+        budget = max(1, max_chars - len(opener) - len(closer) - 2)
+
+    pieces, current, size = [], [], 0
+    for line in lines:
+        # Ligne isolée plus longue que la limite (minifié, base64...) : coupée net
+        while len(line) > budget:
+            if current:
+                # Lignes déjà réunies d'abord : l'ordre du texte est conservé
+                pieces.append(current)
+                current, size = [], 0
+            line_piece, line = line[:budget], line[budget:]
+            pieces.append([line_piece])
+        if current and size + len(line) + 1 > budget:
+            pieces.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pieces.append(current)
+
+    if fence:
+        return ["\n".join([opener] + piece + [closer]) for piece in pieces]
+    return ["\n".join(piece) for piece in pieces]
+
+
+def chunk_markdown(text, max_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP, prefix=""):
+    """Morceaux d'au plus max_chars caractères (préfixe et titre de section en plus).
+
+    Les derniers blocs d'un morceau (jusqu'à overlap caractères) sont repris au début du suivant.
+    """
+    chunks = []
+    current = []  # Blocs du morceau en cours
+    size = 0
+    heading = None  # Titre de la section en cours
+    chunk_heading = None  # Titre de la section où le morceau en cours commence
+
+    def emit():
+        body = "\n\n".join(current)
+        if chunk_heading and not current[0].startswith("#"):
+            body = f"{chunk_heading}\n\n{body}"
+        chunks.append(f"{prefix}{body}")
+
+    for block in markdown_blocks(text):
+        if HEADING.match(block):
+            heading = block.strip()
+        parts = _split_block(block, max_chars) if len(block) > max_chars else [block]
+        for part in parts:
+            if current and size + len(part) + 2 > max_chars:
+                emit()
+                # Recouvrement : les derniers blocs du morceau précédent, dans la limite d'overlap
+                kept, kept_size = [], 0
+                for previous in reversed(current):
+                    if kept_size + len(previous) + 2 > overlap or HEADING.match(previous):
+                        break
+                    kept.insert(0, previous)
+                    kept_size += len(previous) + 2
+                current, size = kept, kept_size
+                chunk_heading = heading if not HEADING.match(part) else None
+            if not current:
+                chunk_heading = heading if not HEADING.match(part) else None
+            current.append(part)
+            size += len(part) + 2
+    if current:
+        emit()
+    return chunks
+
+
+def chunk_entry(content, max_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Morceaux d'une entrée de l'historique, chacun précédé de la question d'origine."""
+    parsed = parse_entry(content)
+    if not parsed:
+        return chunk_markdown((content or "").strip(), max_chars, overlap)
+    question, answer = parsed
+    return chunk_markdown(answer, max_chars, overlap, prefix=f"PROMPT : {question}\n\n")
+
+
+def backfill(batch_size=20):
+    """Découpe les échanges de chat_history qui n'ont pas encore de morceaux."""
+    import embedding_cache
+    from memory_db import connect, store_chunks
+
+    conn = connect()
+    total = last_id = 0
+    try:
+        with conn.cursor() as cur:
+            while True:
+                cur.execute("SELECT h.id, h.content, h.project_id FROM chat_history h WHERE h.id > %s "
+                            "AND NOT EXISTS (SELECT 1 FROM chat_chunks c WHERE c.parent_id = h.id) "
+                            "ORDER BY h.id LIMIT %s", (last_id, batch_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                total += store_chunks(cur, rows, embedding_cache.gemini_embeddings)
+                conn.commit()
+                print(f"\r{total} morceaux créés...", end="", flush=True)
+    finally:
+        conn.close()
+    print(f"\n✔ {total} morceaux créés.")
+
+
+if __name__ == "__main__":
+    if "--backfill" in sys.argv[1:]:
+        size = sys.argv[sys.argv.index("--batch-size") + 1] if "--batch-size" in sys.argv else 20
+        backfill(int(size))
+    else:
+        print(__doc__)
@@ -3,6 +3,8 @@ import re
 from google import genai
 from dotenv import load_dotenv
 
+from history_file import iter_blocks_reverse
+
 load_dotenv()
 
 
@@ -13,12 +15,13 @@ def get_last_interaction():
 
     # 1. Extraire la dernière question de l'historique
     if os.path.exists('historique_global.md'):
-        with open('historique_global.md', 'r', encoding='utf-8') as f:
-            content = f.read()
+        # Lecture depuis la fin du fichier : coût constant quelle que soit la taille de l'historique
+        for block in iter_blocks_reverse('historique_global.md'):
             # On cherche le dernier bloc PROMPT : ...
-            matches = re.findall(r"PROMPT : (.*?)\n", content)
+            matches = re.findall(r"PROMPT : (.*?)\n", block)
             if matches:
                 user_query = matches[-1]
+                break
 
     # 2. Lire le dernier plan (la réponse de l'IA)
     if os.path.exists('dernier_plan.md'):
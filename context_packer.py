@@ -0,0 +1,180 @@
+"""Assemblage du prompt final de geni dans un budget de tokens.
+
+Le repo map, le résumé YAML, les fichiers choisis et les souvenirs étaient concaténés sans limite :
+un gros fichier ou un gros repo map dépassait la fenêtre d'un modèle (erreur, ou bascule sur le
+modèle suivant) et rendait chaque appel lent et coûteux. Chaque section est désormais estimée en
+tokens et ajoutée par priorité décroissante :
+1. la question (jamais tronquée) ;
+2. les plages de lignes choisies, puis les fichiers complets ;
+3. les souvenirs, dans leur ordre de pertinence ;
+4. le résumé YAML ;
+5. le repo map.
+Un morceau qui ne tient plus est tronqué entre deux lignes (avec une mention des lignes omises),
+ou supprimé s'il ne reste presque plus de place.
+
+Le budget est celui du plus petit modèle de la pile (le failover peut y basculer), moins la réserve
+pour la réponse et les instructions système, plafonné par CONTEXT_MAX_TOKENS.
+"""
+import math
+import os
+
+# Fenêtres de contexte (tokens) des modèles des piles de ask.py et call_relay.py
+CONTEXT_WINDOWS = {
+    "google/gemini-2.0-flash-001": 1_048_576,
+    "google/gemini-2.0-pro-exp-02-05:free": 2_097_152,
+    "meta-llama/llama-3.3-70b-instruct:free": 131_072,
+    "openrouter/auto": 128_000,
+}
+DEFAULT_WINDOW = 32_768  # Modèle inconnu : hypothèse prudente
+
+MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "60000"))  # 0 : fenêtre du modèle seule
+RESERVE_TOKENS = int(os.environ.get("CONTEXT_RESERVE_TOKENS", "8192"))  # Réponse + instructions système
+CHARS_PER_TOKEN = float(os.environ.get("CONTEXT_CHARS_PER_TOKEN", "3.5"))  # Estimation prudente (code, français)
+MIN_PART_TOKENS = 200  # En dessous, un morceau tronqué n'apporte plus rien : il est supprimé
+
+PROMPT_TEMPLATE = """
+[STRUCTURE_DU_PROJET]
+{repo_map}
+[/STRUCTURE_DU_PROJET]
+
+[CONTEXTE_STRUCTUREL_YAML]
+{summary}
+[/CONTEXTE_STRUCTUREL_YAML]
+
+[CONTEXTE_FICHIERS]
+{files}
+[/CONTEXTE_FICHIERS]
+
+[CONTEXTE_VECTORIEL]
+{memories}
+[/CONTEXTE_VECTORIEL]
+
+QUESTION_UTILISATEUR : {question}"""
+
+TRUNCATED_MARKER = "\n[... {chars} caractères omis : budget de contexte atteint ...]"
+
+
+def estimate_tokens(text):
+    """Estimation sans tokenizer (chaque modèle a le sien) : volontairement pessimiste."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def budget_for(models):
+    """Tokens disponibles pour le contexte avec cette pile de modèles."""
+    window = min(CONTEXT_WINDOWS.get(model, DEFAULT_WINDOW) for model in models)
+    budget = window - RESERVE_TOKENS
+    if MAX_TOKENS:
+        budget = min(budget, MAX_TOKENS)
+    return max(budget, 0)
+
+
+def truncate(text, max_tokens):
+    """Début du texte tenant dans max_tokens, coupé de préférence entre deux lignes."""
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return text
+    lines = text.splitlines(keepends=True)
+    room = max_chars - len(TRUNCATED_MARKER) - 8
+    kept, size = [], 0
+    for line in lines:
+        if size + len(line) > room:
+            # Ligne très longue (fichier minifié, souvenir sur une ligne...) : son début est gardé
+            if room - size > room // 2:
+                kept.append(line[:room - size])
+            break
+        kept.append(line)
+        size += len(line)
+    head = "".join(kept).rstrip("\n")
+    return head + TRUNCATED_MARKER.format(chars=_n(len(text) - len(head)))
+
+
+def pack(sections, budget):
+    """Garde les morceaux de chaque section par priorité décroissante dans la limite du budget.
+
+    sections : [(nom, [morceaux])] de la plus prioritaire à la moins prioritaire.
+    Renvoie ({nom: [morceaux gardés]}, rapport par section).
+    """
+    remaining = budget
+    kept = {}
+    report = []
+    for name, parts in sections:
+        entry = {"section": name, "tokens": 0, "kept": 0, "truncated": 0, "dropped": 0, "parts": len(parts)}
+        kept[name] = []
+        for part in parts:
+            tokens = estimate_tokens(part)
+            entry["tokens"] += tokens
+            if tokens <= remaining:
+                kept[name].append(part)
+            elif remaining >= MIN_PART_TOKENS:
+                part = truncate(part, remaining)
+                tokens = estimate_tokens(part)
+                kept[name].append(part)
+                entry["truncated"] += 1
+            else:
+                entry["dropped"] += 1
+                continue
+            entry["kept"] += tokens
+            remaining -= tokens
+        report.append(entry)
+    return kept, report
+
+
+def build_context(question, ranges, files, memories, summary, repo_map, models):
+    """Prompt final de geni dans le budget de la pile de modèles.
+
+    ranges : plages de lignes choisies, files : fichiers complets, memories : souvenirs déjà
+    mis en forme (du plus au moins pertinent). Renvoie (prompt, rapport).
+    """
+    budget = budget_for(models)
+    # Balises du gabarit et question : toujours présentes
+    fixed = estimate_tokens(PROMPT_TEMPLATE.format(repo_map="", summary="", files="", memories="", question=question))
+
+    sections = [
+        ("plages", ranges),
+        ("fichiers", files),
+        ("souvenirs", memories),
+        ("résumé YAML", [summary] if summary else []),
+        ("repo map", [repo_map] if repo_map else []),
+    ]
+    kept, sections_report = pack(sections, budget - fixed)
+
+    full_prompt = PROMPT_TEMPLATE.format(
+        repo_map="".join(kept["repo map"]),
+        summary="".join(kept["résumé YAML"]),
+        files="\n\n".join(kept["plages"] + kept["fichiers"]),
+        memories="\n".join(kept["souvenirs"]),
+        question=question,
+    )
+    report = {
+        "budget": budget,
+        "tokens": estimate_tokens(full_prompt),
+        "question": fixed,
+        "sections": sections_report,
+    }
+    return full_prompt, report
+
+
+def _n(value):
+    return f"{value:,}".replace(",", " ")
+
+
+def describe(report):
+    """Résumé d'une ligne (balisage rich) : tokens envoyés et sections réduites."""
+    changes = []
+    for entry in report["sections"]:
+        if entry["dropped"] == entry["parts"] and entry["parts"]:
+            changes.append(f"{entry['section']} supprimé ({_n(entry['tokens'])} tokens)")
+        elif entry["parts"] == 1 and entry["truncated"]:
+            changes.append(f"{entry['section']} tronqué ({_n(entry['tokens'])} → {_n(entry['kept'])} tokens)")
+        elif entry["dropped"] or entry["truncated"]:
+            details = []
+            if entry["truncated"]:
+                details.append(f"{entry['truncated']} tronqué(s)")
+            if entry["dropped"]:
+                details.append(f"{entry['dropped']} supprimé(s) sur {entry['parts']}")
+            changes.append(f"{entry['section']} : {', '.join(details)} ({_n(entry['tokens'])} → {_n(entry['kept'])} tokens)")
+
+    line = f"📦 Contexte : ~{_n(report['tokens'])} / {_n(report['budget'])} tokens"
+    if not changes:
+        return f"[dim]{line}[/dim]"
+    return f"[yellow]{line} — {' ; '.join(changes)}[/yellow]"
@@ -2,9 +2,9 @@ import os
 import psycopg2
 import hashlib
 from pgvector.psycopg2 import register_vector
-from google import genai
 from dotenv import load_dotenv
-from google.genai import types
+
+import embedding_cache
 
 load_dotenv()
 
@@ -26,8 +26,6 @@ def run_debug():
         print("❌ Erreur : GEMINI_API_KEY non trouvée.")
         return
 
-    client = genai.Client(api_key=api_key)
-
     # Texte de test
     test_text = input("\nEntrez un texte à indexer pour le test : ").strip()
     if not test_text:
@@ -35,17 +33,12 @@ def run_debug():
 
     print(f"\n1. 🛰️ Génération de l'embedding (Modèle 004)...")
     try:
-        # Tentative avec forçage explicite de la dimension
-        res = client.models.embed_content(
-            model="models/gemini-embedding-001",
-            contents=test_text,
-            config=types.EmbedContentConfig(
-                output_dimensionality=768
-            )
-        )
-        embedding = res.embeddings[0].values
+        # Tentative avec forçage explicite de la dimension (un vecteur de mauvaise taille n'est jamais mis en cache)
+        hits = embedding_cache.stats["hits"]
+        embedding = embedding_cache.gemini_embedding(test_text, api_key=api_key)
         dim_found = len(embedding)
-        print(f"   ✅ Dimension reçue de l'API : {dim_found}")
+        source = "du cache local" if embedding_cache.stats["hits"] > hits else "de l'API"
+        print(f"   ✅ Dimension reçue {source} : {dim_found}")
 
         if dim_found != 768:
             print(f"   ⚠️ ALERTE : Reçu {dim_found} au lieu de 768 !")
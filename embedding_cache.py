@@ -0,0 +1,196 @@
+"""Cache local des embeddings, indexé par (modèle, dimension, empreinte du texte normalisé).
+
+Le même texte est embeddé à plusieurs reprises : question de geni, entrée indexée par glog,
+blocs relus par index_history... Les vecteurs sont rangés bout à bout en float32 dans un seul
+fichier lu par mmap (vectors.f32) ; index.json donne pour chaque clé son décalage et sa taille.
+Au-delà de EMBEDDING_CACHE_MAX_ENTRIES, les vecteurs les moins récemment utilisés sont
+supprimés par compactage du fichier.
+
+Usage : python embedding_cache.py [--clear]
+"""
+import hashlib
+import mmap
+import os
+import sys
+import time
+from array import array
+
+from local_store import cache_path, file_lock, read_json, write_json_atomic
+
+ENABLED = os.environ.get("EMBEDDING_CACHE", "1") != "0"
+MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "20000"))
+
+GEMINI_MODEL = "models/gemini-embedding-001"
+GEMINI_DIM = 768
+
+CACHE_DIR = "embeddings"
+TOUCH_EVERY = 24 * 3600  # Date d'utilisation rafraîchie au plus une fois par jour (LRU approximatif)
+
+stats = {"hits": 0, "misses": 0}
+
+
+def normalize_text(text):
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def embedding_key(text, model, dim):
+    material = f"{model}|{dim or 'default'}|{normalize_text(text)}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Vecteurs float32 contigus (mmap) + index JSON {clé: [décalage, dimension, dernière utilisation]}."""
+
+    def __init__(self, folder=None):
+        self.folder = folder or os.path.dirname(cache_path(CACHE_DIR, "x"))
+        os.makedirs(self.folder, exist_ok=True)
+        self.vectors_path = os.path.join(self.folder, "vectors.f32")
+        self.index_path = os.path.join(self.folder, "index.json")
+
+    def _load_index(self):
+        return read_json(self.index_path, {"entries": {}})
+
+    def get_many(self, keys):
+        """Renvoie {clé: vecteur} pour les clés présentes."""
+        found = {}
+        with file_lock(self.index_path):
+            index = self._load_index()
+            entries = index["entries"]
+            wanted = [key for key in keys if key in entries]
+            if not wanted or not os.path.exists(self.vectors_path):
+                return found
+
+            with open(self.vectors_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for key in wanted:
+                    offset, dim, _ = entries[key]
+                    vector = array("f")
+                    vector.frombytes(mm[offset * 4:(offset + dim) * 4])
+                    found[key] = vector.tolist()
+
+            now = time.time()
+            stale = [key for key in wanted if now - entries[key][2] > TOUCH_EVERY]
+            if stale:
+                for key in stale:
+                    entries[key][2] = now
+                write_json_atomic(self.index_path, index)
+        return found
+
+    def put_many(self, vectors):
+        """Ajoute {clé: vecteur} en fin de fichier, puis compacte si le cache est plein."""
+        with file_lock(self.index_path):
+            index = self._load_index()
+            entries = index["entries"]
+            now = time.time()
+            with open(self.vectors_path, "ab") as f:
+                offset = f.tell() // 4
+                for key, vector in vectors.items():
+                    if key in entries:
+                        continue
+                    f.write(array("f", vector).tobytes())
+                    entries[key] = [offset, len(vector), now]
+                    offset += len(vector)
+            write_json_atomic(self.index_path, index)
+
+            if len(entries) > MAX_ENTRIES:
+                self._compact(index, int(MAX_ENTRIES * 0.8))
+
+    def _compact(self, index, keep):
+        """Réécrit le fichier avec les `keep` vecteurs les plus récemment utilisés."""
+        entries = index["entries"]
+        kept = sorted(entries, key=lambda key: entries[key][2], reverse=True)[:keep]
+        tmp_path = f"{self.vectors_path}.{os.getpid()}.tmp"
+        new_entries = {}
+        with open(self.vectors_path, "rb") as src, open(tmp_path, "wb") as dst:
+            offset = 0
+            for key in sorted(kept, key=lambda k: entries[k][0]):
+                old_offset, dim, last_used = entries[key]
+                src.seek(old_offset * 4)
+                dst.write(src.read(dim * 4))
+                new_entries[key] = [offset, dim, last_used]
+                offset += dim
+        os.replace(tmp_path, self.vectors_path)
+        index["entries"] = new_entries
+        write_json_atomic(self.index_path, index)
+
+    def info(self):
+        entries = self._load_index()["entries"]
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        return len(entries), size
+
+    def clear(self):
+        with file_lock(self.index_path):
+            for path in (self.vectors_path, self.index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def cached_embeddings(texts, embed_many, model, dim):
+    """Embeddings de texts dans l'ordre ; seuls les textes absents du cache sont transmis à embed_many."""
+    keys = [embedding_key(text, model, dim) for text in texts]
+    found = {}
+    store = EmbeddingStore() if ENABLED else None
+    if store:
+        try:
+            found = store.get_many(keys)
+        except (OSError, TimeoutError, ValueError):
+            found = {}  # Le cache ne doit jamais empêcher l'embedding
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    stats["hits"] += len(texts) - len(missing)
+    stats["misses"] += len(missing)
+
+    if missing:
+        vectors = embed_many(list(missing.values()))
+        fresh = dict(zip(missing, vectors))
+        # Un vecteur de taille inattendue (SDK qui ignore la dimension demandée) n'est pas mis en cache
+        valid = {key: vector for key, vector in fresh.items() if not dim or len(vector) == dim}
+        if store and valid:
+            try:
+                store.put_many(valid)
+            except (OSError, TimeoutError, ValueError):
+                pass
+        found.update(fresh)
+
+    return [found[key] for key in keys]
+
+
+def gemini_embeddings(texts, model=GEMINI_MODEL, dim=GEMINI_DIM, api_key=None, client=None):
+    """Embeddings Gemini (un seul appel pour tous les textes absents du cache).
+
+    client : genai.Client déjà construit (démon mémoire), sinon créé à la demande.
+    """
+
+    def embed_many(missing):
+        nonlocal client
+        if client is None:
+            # Import différé : inutile si tout est en cache
+            from google import genai
+
+            client = genai.Client(api_key=api_key or os.environ.get("GEMINI_API_KEY"))
+        res = client.models.embed_content(
+            model=model,
+            contents=missing,
+            config={'output_dimensionality': dim} if dim else None
+        )
+        return [embedding.values for embedding in res.embeddings]
+
+    return cached_embeddings(texts, embed_many, model, dim)
+
+
+def gemini_embedding(text, model=GEMINI_MODEL, dim=GEMINI_DIM, api_key=None):
+    return gemini_embeddings([text], model, dim, api_key)[0]
+
+
+if __name__ == "__main__":
+    store = EmbeddingStore()
+    if "--clear" in sys.argv[1:]:
+        store.clear()
+        print("Cache des embeddings vidé.")
+    else:
+        count, size = store.info()
+        print(f"Vecteurs : {count} / {MAX_ENTRIES}")
+        print(f"Fichier  : {size / 1024 / 1024:.1f} Mo ({store.vectors_path})")
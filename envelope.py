@@ -0,0 +1,166 @@
+"""Enveloppe chiffrée des échanges avec le relais.
+
+v1 (historique) : JSON chiffré par Fernet. Fernet ne compresse pas et encode le résultat en
+base64 : un prompt de 300 Ko (fichiers + repo map) part en plus de 400 Ko sur le proxy bridé.
+
+v2 : compression puis chiffrement authentifié, en binaire :
+    "TAI2" | compression (1 octet) | nonce (12 octets) | AES-256-GCM(données compressées)
+L'en-tête est authentifié avec les données (AAD). La clé AES est dérivée de ENCRYPTION_KEY par
+HKDF-SHA256 : la même clé partagée sert aux deux versions, rien à redistribuer.
+Compression : zstd si disponible des deux côtés (module zstandard, ou compression.zstd en
+Python 3.14), sinon zlib ; rien en dessous de MIN_COMPRESS octets.
+
+Réponses en flux (SSE) : suite d'enregistrements [longueur sur 4 octets][enveloppe v2], un par
+morceau reçu d'OpenRouter.
+
+Un message v1 se reconnaît à son préfixe base64 Fernet ("gAAAAA"), un message v2 à "TAI2" :
+open() accepte les deux, ce qui permet au relais de servir anciens et nouveaux clients.
+"""
+import base64
+import os
+import struct
+import zlib
+
+MAGIC = b"TAI2"
+CONTENT_TYPE = "application/x-terminai-envelope"
+STREAM_CONTENT_TYPE = "application/x-terminai-stream"
+
+NONE, ZLIB, ZSTD = 0, 1, 2
+COMPRESSIONS = {"none": NONE, "zlib": ZLIB, "zstd": ZSTD}
+MIN_COMPRESS = 256  # En dessous, l'en-tête de compression coûte plus qu'il ne rapporte
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+HEADER = struct.Struct(">4sB12s")
+RECORD_LENGTH = struct.Struct(">I")
+HKDF_INFO = b"terminai envelope v2"
+
+
+class EnvelopeError(Exception):
+    """Message illisible : format inconnu, clé différente, données altérées ou compression absente."""
+
+
+def _zstd():
+    """Module zstd (compress/decompress), ou None s'il n'est pas installé."""
+    try:
+        from compression import zstd  # Python 3.14+
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        return None
+
+    class _Zstandard:
+        @staticmethod
+        def compress(data, level=ZSTD_LEVEL):
+            return zstandard.ZstdCompressor(level=level).compress(data)
+
+        @staticmethod
+        def decompress(data):
+            return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+    return _Zstandard
+
+
+def available_compressions():
+    """Compressions utilisables par ce processus, de la préférée à la moins bonne."""
+    return (["zstd"] if _zstd() else []) + ["zlib"]
+
+
+def _compress(data, compression):
+    if compression == ZSTD:
+        return _zstd().compress(data, ZSTD_LEVEL)
+    if compression == ZLIB:
+        return zlib.compress(data, ZLIB_LEVEL)
+    return data
+
+
+def _decompress(data, compression):
+    if compression == NONE:
+        return data
+    if compression == ZLIB:
+        return zlib.decompress(data)
+    if compression == ZSTD:
+        zstd = _zstd()
+        if zstd is None:
+            raise EnvelopeError("message compressé en zstd : installez le paquet zstandard")
+        return zstd.decompress(data)
+    raise EnvelopeError(f"compression inconnue ({compression})")
+
+
+class Envelope:
+    """Chiffrement des messages v1 (Fernet) et v2 (compression + AES-GCM) avec la clé partagée."""
+
+    def __init__(self, key):
+        from cryptography.fernet import Fernet
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+        key = key.encode() if isinstance(key, str) else key
+        self.fernet = Fernet(key)
+        derived = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=HKDF_INFO).derive(
+            base64.urlsafe_b64decode(key))
+        self.aead = AESGCM(derived)
+
+    def seal(self, data, version=2, compression="zlib"):
+        """Chiffre des octets ; compression : nom parmi COMPRESSIONS (v2 seulement)."""
+        if version == 1:
+            return self.fernet.encrypt(data)
+
+        algorithm = COMPRESSIONS[compression] if len(data) >= MIN_COMPRESS else NONE
+        if algorithm == ZSTD and _zstd() is None:
+            algorithm = ZLIB
+        payload = _compress(data, algorithm)
+        if len(payload) >= len(data):
+            algorithm, payload = NONE, data  # Données déjà compressées ou aléatoires
+
+        header = HEADER.pack(MAGIC, algorithm, os.urandom(12))
+        return header + self.aead.encrypt(header[-12:], payload, header)
+
+    def open(self, message):
+        """Octets en clair d'un message v1 ou v2."""
+        if message[:4] != MAGIC:
+            from cryptography.fernet import InvalidToken
+            try:
+                return self.fernet.decrypt(message)
+            except InvalidToken:
+                raise EnvelopeError("message v1 illisible (clé différente ou données altérées)") from None
+
+        from cryptography.exceptions import InvalidTag
+
+        if len(message) < HEADER.size + 16:
+            raise EnvelopeError("message v2 tronqué")
+        header = message[:HEADER.size]
+        _, algorithm, nonce = HEADER.unpack(header)
+        try:
+            payload = self.aead.decrypt(nonce, message[HEADER.size:], header)
+        except InvalidTag:
+            raise EnvelopeError("message v2 illisible (clé différente ou données altérées)") from None
+        return _decompress(payload, algorithm)
+
+    @staticmethod
+    def version(message):
+        return 2 if message[:4] == MAGIC else 1
+
+    def seal_record(self, data, compression="zlib"):
+        """Enregistrement d'un flux v2 : longueur puis enveloppe."""
+        sealed = self.seal(data, 2, compression)
+        return RECORD_LENGTH.pack(len(sealed)) + sealed
+
+    def open_stream(self, chunks):
+        """Octets en clair de chaque enregistrement d'un flux v2, au fil des morceaux reçus."""
+        buffer = b""
+        for chunk in chunks:
+            buffer += chunk
+            while len(buffer) >= RECORD_LENGTH.size:
+                (length,) = RECORD_LENGTH.unpack_from(buffer)
+                if len(buffer) < RECORD_LENGTH.size + length:
+                    break
+                record = buffer[RECORD_LENGTH.size:RECORD_LENGTH.size + length]
+                buffer = buffer[RECORD_LENGTH.size + length:]
+                yield self.open(record)
+        if buffer:
+            raise EnvelopeError("flux v2 interrompu au milieu d'un enregistrement")
@@ -0,0 +1,245 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from local_store import cache_path
+from model_health import ENABLED as HEALTH_ENABLED, HealthBoard
+
+# --- Stratégies de basculement entre modèles ---
+# sequential : un modèle après l'autre (comportement historique)
+# hedge      : le modèle suivant est lancé en parallèle si le courant n'a pas produit
+#              de premier token après HEDGE_DELAY secondes
+# race       : les RACE_SIZE premiers modèles sont interrogés en même temps
+STRATEGIES = ("sequential", "hedge", "race")
+
+STRATEGY = os.environ.get("FAILOVER_STRATEGY", "sequential")
+HEDGE_DELAY = float(os.environ.get("HEDGE_DELAY", "4"))
+RACE_SIZE = int(os.environ.get("RACE_SIZE", "2"))
+
+LATENCY_LOG = os.environ.get("FAILOVER_LATENCY_LOG", "latency.jsonl")
+
+
+class EmptyResponse(Exception):
+    """Le modèle a répondu sans aucun contenu."""
+
+
+class Attempt:
+    """Requête en cours vers un modèle, que le coordinateur peut interrompre.
+
+    La tentative enregistre par on_cancel(close) la réponse ou le flux qu'elle attend : un
+    perdant bloqué sur la réponse ou son premier morceau voit sa connexion fermée aussitôt,
+    au lieu de garder fil et connexion jusqu'à ce que le serveur réponde.
+    """
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self._closers = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, close):
+        """close() sera appelé à l'annulation (tout de suite si elle a déjà eu lieu)."""
+        with self._lock:
+            if not self.cancelled.is_set():
+                self._closers.append(close)
+                return
+        close()
+
+    def cancel(self):
+        """Annule la tentative ; renvoie True si une requête en cours a vraiment été interrompue."""
+        with self._lock:
+            self.cancelled.set()
+            closers, self._closers = self._closers, []
+        for close in closers:
+            try:
+                close()
+            except Exception:
+                pass  # Connexion déjà fermée : rien à interrompre
+        return bool(closers)
+
+
+class Failover:
+    """Interroge une pile de modèles et ne garde que le premier qui répond.
+
+    attempt_fn(model, attempt) est un générateur de morceaux de texte bruts pour un modèle ;
+    attempt (Attempt) reçoit la réponse HTTP à fermer en cas d'annulation. Le gagnant est le
+    premier modèle qui produit un morceau : les requêtes des autres sont interrompues et leurs
+    éventuels morceaux tardifs ignorés. L'événement "cancel" indique (detail) si une requête en
+    cours a été interrompue.
+
+    health : tableau de santé partagé (par défaut celui de model_health, False pour
+    le désactiver). Les modèles dont le circuit est ouvert ne sont pas interrogés.
+    """
+
+    def __init__(self, models, attempt_fn, strategy=None, hedge_delay=None, race_size=None,
+                 is_passable=lambda e: True, on_event=None, retry_pause=0.0, health=None):
+        self.models = list(models)
+        self.attempt_fn = attempt_fn
+        self.strategy = strategy or STRATEGY
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"Stratégie inconnue : {self.strategy} (attendu : {', '.join(STRATEGIES)})")
+        self.hedge_delay = HEDGE_DELAY if hedge_delay is None else hedge_delay
+        self.race_size = RACE_SIZE if race_size is None else race_size
+        self.is_passable = is_passable
+        self.on_event = on_event or (lambda kind, model, detail=None: None)
+        self.retry_pause = retry_pause
+        if health is None:
+            health = HealthBoard() if HEALTH_ENABLED else False
+        self.health = health or None
+
+        self.winner = None
+        self.started_at = None
+        self.first_chunk_at = None
+        self.finished_at = None
+
+    def _worker(self, idx, model, attempt, events):
+        try:
+            chunks = self.attempt_fn(model, attempt)
+            try:
+                for chunk in chunks:
+                    if attempt.cancelled.is_set():
+                        break
+                    if chunk:
+                        events.put((idx, "chunk", chunk))
+            finally:
+                # Ferme la réponse HTTP sous-jacente (annulation d'un perdant)
+                chunks.close()
+            events.put((idx, "done", None))
+        except Exception as e:
+            events.put((idx, "error", e))
+
+    def stream(self):
+        """Générateur des morceaux du modèle gagnant (aucun si tous les modèles échouent)."""
+        events = queue.Queue()
+        pending = list(self.models)
+        launched = []
+        launched_at = []
+        running = {}
+        self.started_at = time.perf_counter()
+        next_hedge_at = None
+
+        if self.health:
+            # Les modèles connus comme indisponibles ne coûtent aucun aller-retour
+            pending, skipped = self.health.order(pending)
+            for model, remaining, status in skipped:
+                self.on_event("skip", model, (remaining, status))
+
+        def launch():
+            model = pending.pop(0)
+            idx = len(launched)
+            launched.append(model)
+            launched_at.append(time.perf_counter())
+            running[idx] = Attempt()
+            threading.Thread(target=self._worker, args=(idx, model, running[idx], events), daemon=True).start()
+            self.on_event("start", model)
+            return time.perf_counter() + self.hedge_delay
+
+        try:
+            for _ in range(min(self.race_size if self.strategy == "race" else 1, len(pending))):
+                next_hedge_at = launch()
+
+            while running:
+                timeout = None
+                if self.winner is None and self.strategy == "hedge" and pending:
+                    timeout = max(0.0, next_hedge_at - time.perf_counter())
+
+                try:
+                    idx, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    self.on_event("hedge", pending[0], self.hedge_delay)
+                    next_hedge_at = launch()
+                    continue
+
+                if idx not in running:
+                    continue  # Morceau tardif d'une requête annulée
+
+                if self.winner is None:
+                    if kind == "chunk":
+                        self.winner = launched[idx]
+                        self.first_chunk_at = time.perf_counter()
+                        if self.health:
+                            self.health.record_success(self.winner, self.first_chunk_at - launched_at[idx])
+                        for other, attempt in list(running.items()):
+                            if other != idx:
+                                del running[other]
+                                self.on_event("cancel", launched[other], attempt.cancel())
+                        self.on_event("win", self.winner)
+                        yield payload
+                        continue
+
+                    del running[idx]
+                    error = payload if kind == "error" else EmptyResponse("Réponse vide")
+                    if self.health:
+                        self.health.record_failure(launched[idx], error)
+                    if not self.is_passable(error):
+                        raise error
+                    self.on_event("fail", launched[idx], error)
+
+                    if pending and (self.strategy != "sequential" or not running):
+                        if self.strategy == "sequential" and self.retry_pause:
+                            time.sleep(self.retry_pause)
+                        next_hedge_at = launch()
+                    continue
+
+                # Suite du flux du modèle gagnant
+                if kind == "chunk":
+                    yield payload
+                elif kind == "done":
+                    del running[idx]
+                else:
+                    if self.health:
+                        self.health.record_failure(launched[idx], payload)
+                    raise payload
+        finally:
+            self.finished_at = time.perf_counter()
+            for attempt in running.values():
+                attempt.cancel()
+
+    def record_latency(self):
+        """Ajoute la mesure de cette requête au journal des latences (rapport par stratégie)."""
+        if self.started_at is None or self.finished_at is None:
+            return
+        entry = {
+            "at": time.time(),
+            "strategy": self.strategy,
+            "winner": self.winner,
+            "ttft": None if self.first_chunk_at is None else round(self.first_chunk_at - self.started_at, 4),
+            "total": round(self.finished_at - self.started_at, 4),
+        }
+        try:
+            with open(cache_path(LATENCY_LOG), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError:
+            pass  # Les statistiques ne doivent jamais bloquer une réponse
+
+
+def percentile(values, pct):
+    """Percentile par interpolation linéaire (values non vide)."""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_report(entries):
+    """Percentiles p50/p90/p99 du premier token et du total, par stratégie."""
+    report = {}
+    for strategy in STRATEGIES:
+        rows = [e for e in entries if e["strategy"] == strategy and e.get("winner")]
+        if not rows:
+            continue
+        report[strategy] = {"count": len(rows)}
+        for field in ("ttft", "total"):
+            values = [e[field] for e in rows if e.get(field) is not None]
+            report[strategy][field] = {f"p{p}": percentile(values, p) for p in (50, 90, 99)} if values else {}
+    return report
+
+
+def read_latency_log():
+    path = cache_path(LATENCY_LOG)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
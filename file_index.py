@@ -0,0 +1,197 @@
+"""Index persistant des noms de fichiers du projet (nom → chemins).
+
+find_file_recursive parcourait tout l'arbre (os.walk) à chaque nom saisi et ne renvoyait que le
+premier fichier trouvé. L'index est gardé dans ~/.cache/terminai/file_index/ (un par dossier de
+travail) avec la date de modification de chaque dossier : un ajout, une suppression ou un
+renommage modifie la date du dossier parent, seuls les dossiers concernés sont donc relus. Une
+mise à jour se limite à un stat par dossier.
+
+Il sert aussi à :
+- lister tous les fichiers d'un même nom (plusieurs Kernel.php, index.html...) ;
+- proposer des noms approchés en cas de faute de frappe ;
+- compléter un nom de fichier sans chemin (TAB) dans geni et geni_relay.
+
+Usage : python file_index.py [--rebuild] [nom]
+"""
+import hashlib
+import os
+import sys
+import time
+
+from local_store import cache_path, read_json, write_json_atomic
+
+ENABLED = os.environ.get("FILE_INDEX", "1") != "0"
+EXCLUDED_DIRS = {'.git', 'vendor', 'node_modules', 'var', 'cache'} | {
+    d for d in os.environ.get("FILE_INDEX_EXCLUDE", "").split(",") if d
+}
+MAX_COMPLETIONS = 50
+
+CACHE_DIR = "file_index"
+
+
+class FileIndex:
+    """Fichiers du dossier root, par dossier : {dossier relatif: [mtime_ns, [fichiers], [sous-dossiers]]}."""
+
+    def __init__(self, root="."):
+        self.root = os.path.abspath(root)
+        key = hashlib.sha256(self.root.encode("utf-8")).hexdigest()[:16]
+        self.path = cache_path(CACHE_DIR, f"{key}.json")
+        self.dirs = {}
+        self.names = {}  # Nom de fichier → chemins relatifs
+        self.paths = []
+
+    def _scan(self, rel):
+        """Relit le dossier rel ; les sous-dossiers apparus sont indexés, ceux disparus oubliés."""
+        pending = [rel]
+        while pending:
+            current = pending.pop()
+            full = os.path.join(self.root, current)
+            try:
+                mtime = os.stat(full).st_mtime_ns  # Lue avant la liste : un ajout pendant la lecture sera revu
+                entries = list(os.scandir(full))
+            except OSError:
+                self._drop(current)
+                continue
+
+            files, subdirs = [], []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in EXCLUDED_DIRS:
+                            subdirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                except OSError:
+                    continue
+
+            previous = self.dirs.get(current)
+            for name in set(previous[2] if previous else ()) - set(subdirs):
+                self._drop(os.path.join(current, name))
+            self.dirs[current] = [mtime, sorted(files), sorted(subdirs)]
+            pending.extend(os.path.join(current, name) for name in subdirs
+                           if os.path.join(current, name) not in self.dirs)
+
+    def _drop(self, rel):
+        prefix = rel + os.sep
+        for key in [k for k in self.dirs if k == rel or k.startswith(prefix)]:
+            del self.dirs[key]
+
+    def refresh(self, rebuild=False):
+        """Charge l'index et relit les dossiers modifiés depuis ; renvoie le nombre de dossiers relus."""
+        data = None if rebuild or not ENABLED else read_json(self.path)
+        self.dirs = data["dirs"] if data and data.get("root") == self.root else {}
+
+        rescanned = 0
+        if not self.dirs:
+            self._scan("")
+            rescanned = len(self.dirs)
+        else:
+            for rel in list(self.dirs):
+                if rel not in self.dirs:
+                    continue  # Oublié avec un dossier parent supprimé
+                try:
+                    mtime = os.stat(os.path.join(self.root, rel)).st_mtime_ns
+                except OSError:
+                    self._drop(rel)
+                    rescanned += 1
+                    continue
+                if mtime != self.dirs[rel][0]:
+                    self._scan(rel)
+                    rescanned += 1
+
+        if rescanned and ENABLED:
+            write_json_atomic(self.path, {"root": self.root, "updated": time.time(), "dirs": self.dirs})
+
+        self.names = {}
+        self.paths = []
+        for rel, (_, files, _) in self.dirs.items():
+            for name in files:
+                path = os.path.join(rel, name)
+                self.names.setdefault(name, []).append(path)
+                self.paths.append(path)
+        self.paths.sort()
+        return rescanned
+
+    def find(self, query):
+        """(chemins, exact) : fichiers de ce nom ou se terminant par ce chemin, sinon noms approchés."""
+        query = query.strip().replace("/", os.sep).strip(os.sep)
+        name = os.path.basename(query)
+        suffix = os.sep + query
+
+        exact = [p for p in self.names.get(name, []) if p == query or p.endswith(suffix)]
+        if exact:
+            return sorted(exact), True
+
+        # Casse différente, puis fautes de frappe
+        lowered = name.lower()
+        matches = [p for n, paths in self.names.items() if n.lower() == lowered for p in paths]
+        if not matches:
+            import difflib
+            close = difflib.get_close_matches(name, list(self.names), n=10, cutoff=0.6)
+            matches = [p for n in close for p in self.names[n]]
+        return matches[:MAX_COMPLETIONS], False
+
+    def complete(self, text, limit=MAX_COMPLETIONS):
+        """Chemins dont le nom commence par text, puis le contient, puis en contient les lettres dans l'ordre."""
+        lowered = text.lower()
+        scored = []
+        for path in self.paths:
+            name = os.path.basename(path).lower()
+            if name.startswith(lowered):
+                rank = 0
+            elif lowered in name:
+                rank = 1
+            elif lowered in path.lower():
+                rank = 2
+            elif _subsequence(lowered, name):
+                rank = 3
+            else:
+                continue
+            scored.append((rank, len(path), path))
+        scored.sort()
+        return [path for _, _, path in scored[:limit]]
+
+
+def _subsequence(letters, text):
+    remaining = iter(text)
+    return all(letter in remaining for letter in letters)
+
+
+def completer(index):
+    """Compléteur prompt_toolkit : chemins réels (PathCompleter), ou noms de fichiers de l'index."""
+    from prompt_toolkit.completion import Completer, Completion, PathCompleter
+
+    class IndexCompleter(Completer):
+        def __init__(self):
+            self.path_completer = PathCompleter()
+
+        def get_completions(self, document, complete_event):
+            paths = list(self.path_completer.get_completions(document, complete_event))
+            text = document.text_before_cursor.replace('"', '').replace("'", "").strip()
+            if paths or not text:
+                yield from paths
+                return
+            for path in index.complete(text):
+                yield Completion(path, start_position=-len(document.text_before_cursor),
+                                 display=os.path.basename(path), display_meta=os.path.dirname(path))
+
+    return IndexCompleter()
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--rebuild"]
+    index = FileIndex()
+    started = time.perf_counter()
+    rescanned = index.refresh(rebuild="--rebuild" in sys.argv[1:])
+    elapsed = time.perf_counter() - started
+    if args:
+        matches, exact = index.find(args[0])
+        if not exact and matches:
+            print("Aucun fichier de ce nom. Noms approchés :")
+        for path in matches:
+            print(path)
+        if not matches:
+            print("Aucun fichier trouvé.")
+    else:
+        print(f"{len(index.paths)} fichiers dans {len(index.dirs)} dossiers "
+              f"({rescanned} relus, {elapsed * 1000:.0f} ms) — {index.path}")
@@ -1,14 +1,10 @@
 import os
-import subprocess
 import sys
-import psycopg2
-from pgvector.psycopg2 import register_vector
-from google import genai
+import time
 from dotenv import load_dotenv
 
 # --- Importations Saisie (prompt_toolkit) ---
 from prompt_toolkit import prompt
-from prompt_toolkit.completion import PathCompleter
 from prompt_toolkit.formatted_text import HTML
 from prompt_toolkit.styles import Style
 
@@ -17,54 +13,41 @@ from rich.console import Console
 from rich.console import Group
 from rich.panel import Panel
 
+import context_packer
+import embedding_cache
+import semantic_cache
+from ask import MODELS
+from file_index import FileIndex, completer
+from glog import get_project_id, lookup_similar, process_question, show_reused_answer
+from prefetch import in_background, read_text
+from range_reader import extract_ranges
+from repo_map_cache import get_repo_map
+
 # --- Initialisation ---
 console = Console()
 load_dotenv()
 
-# --- Configuration et Chemins ---
-GLOG_PATH = os.path.expanduser("~/.local/bin/glog.py")
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT"),
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD")
-}
-PYTHON_BIN = sys.executable
-
 
 # --- Fonctions Utilitaires ---
 
-def find_file_recursive(filename):
-    exclude_dirs = {'.git', 'vendor', 'node_modules', 'var', 'cache'}
-    for root, dirs, files in os.walk('.'):
-        dirs[:] = [d for d in dirs if d not in exclude_dirs]
-        if filename in files:
-            return os.path.join(root, filename)
+def find_file_recursive(index, filename):
+    """Chemin du fichier via l'index des noms ; choix à faire si plusieurs fichiers correspondent."""
+    matches, exact = index.find(filename)
+    if not matches:
+        return None
+    if exact and len(matches) == 1:
+        return matches[0]
+
+    title = "Plusieurs fichiers portent ce nom" if exact else "Fichier introuvable, noms approchés"
+    console.print(f"[yellow]  {title} :[/yellow]")
+    for i, path in enumerate(matches, 1):
+        console.print(f"  [cyan]{i}[/cyan]. {path}")
+    choice = prompt("  Numéro (Entrée pour annuler) : ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(matches):
+        return matches[int(choice) - 1]
     return None
 
 
-def extract_single_range(lines, r_string, file_path):
-    try:
-        start, end = map(int, r_string.split('-'))
-        part = lines[start - 1:end]
-        return f"--- {file_path} (Lignes {r_string}) ---\n" + "".join(part)
-    except Exception as e:
-        return f"  [!] Erreur sur la plage {r_string}: {e}"
-
-
-def get_repo_map():
-    """Génère ou récupère la carte du projet via Aider."""
-    try:
-        result = subprocess.run(
-            ["aider", "--show-repo-map"],
-            capture_output=True, text=True, encoding='utf-8'
-        )
-        return result.stdout
-    except subprocess.SubprocessError:
-        return "Impossible de générer le repo-map."
-
-
 def get_user_input():
     style = Style.from_dict({
         'prompt': '#00ffff bold',
@@ -84,6 +67,38 @@ def get_user_input():
     return text.strip()
 
 
+def recall_memories(question, embedding=None, similar_future=None):
+    """Souvenirs mis en forme pour le prompt (exécuté en arrière-plan, sans affichage)."""
+    try:
+        # Mode auto du cache sémantique : l'embedding qu'il calcule est réutilisé
+        if embedding is None and similar_future is not None:
+            embedding = similar_future.result()[0]
+
+        # Imports différés : la saisie de la question n'en a pas besoin
+        import memory_daemon
+
+        # Démon mémoire lancé : pool de connexions et client Gemini déjà ouverts (None sinon)
+        memories = memory_daemon.recall(get_project_id(), embedding=embedding, text=question)
+        if memories is None:
+            from memory_db import connect, recall
+
+            # Embedding déjà calculé par le cache sémantique (sinon servi par le cache local si possible)
+            if embedding is None:
+                embedding = embedding_cache.gemini_embedding(question)
+
+            # Connexion réglée pour l'index ANN (hnsw.ef_search / ivfflat.probes, voir migrations.py)
+            conn = connect()
+            cur = conn.cursor()
+
+            # Souvenirs du projet courant d'abord (index partiel), complétés par les autres projets si besoin
+            memories = recall(cur, embedding, get_project_id(), limit=3, text=question)
+            cur.close()
+            conn.close()
+        return [f"--- Souvenir {i + 1} ---\n{m}" for i, m in enumerate(memories)]
+    except Exception as e:
+        return [f"Erreur mémoire : {e}"]
+
+
 # --- Fonction Principale ---
 
 def run():
@@ -96,11 +111,31 @@ def run():
         console.print("[bold red]Erreur : Question obligatoire.[/bold red]")
         return
 
+    # Collecte du contexte lancée dès la question saisie : elle avance pendant l'ajout des fichiers
+    repo_map_future = in_background(get_repo_map)
+    summary_future = in_background(read_text, "resume_contexte.yaml", "Aucun résumé disponible.")
+
+    # Cache sémantique : une question quasi identique a peut-être déjà une réponse
+    embedding, similar, similar_future = None, [], None
+    if semantic_cache.MODE == "offer":
+        with console.status("[bold blue]Recherche d'une réponse similaire...[/bold blue]", spinner="dots"):
+            embedding, similar = lookup_similar(main_prompt)
+        reused = semantic_cache.choose(console, similar)
+        if reused:
+            show_reused_answer(reused)
+            return
+    elif semantic_cache.MODE == "auto":
+        # La réponse similaire n'est reprise qu'après l'ajout des fichiers : recherche en arrière-plan
+        similar_future = in_background(lookup_similar, main_prompt)
+
+    # Souvenirs : embedding de la question puis recherche pgvector, également en arrière-plan
+    memories_future = in_background(recall_memories, main_prompt, embedding, similar_future)
+
     # 2. Affichage du panneau d'instruction pour la phase de fichiers
     instruction_panel = Panel(
         Group(
             "[white]Saisissez les chemins des fichiers à inclure dans le contexte.[/white]",
-            "[dim]• TAB pour auto-compléter[/dim]",
+            "[dim]• TAB pour auto-compléter (chemin, ou simple nom de fichier)[/dim]",
             "[dim]• ENTRÉE à vide pour valider et envoyer la requête[/dim]"
         ),
         title="[bold cyan]AJOUT DE FICHIERS[/bold cyan]",
@@ -111,10 +146,17 @@ def run():
     )
     console.print(instruction_panel)
 
-    context_blocks = []
+    # Plages de lignes et fichiers complets : les plages restent prioritaires si le budget est atteint
+    range_blocks = []
+    file_blocks = []
 
-    # Préparation du compléteur de fichiers
-    file_completer = PathCompleter()
+    # Index des noms de fichiers (seuls les dossiers modifiés depuis le dernier appel sont relus)
+    with console.status("[bold blue]Indexation des fichiers...[/bold blue]", spinner="dots"):
+        index = FileIndex()
+        index.refresh()
+
+    # Préparation du compléteur de fichiers (chemins, ou noms de fichiers de l'index)
+    file_completer = completer(index)
 
     while True:
         # Saisie du fichier avec auto-complétion intelligente
@@ -128,7 +170,7 @@ def run():
 
         f_path = f_input.replace('"', '').replace("'", "")
         if not os.path.exists(f_path):
-            found = find_file_recursive(f_path)
+            found = find_file_recursive(index, f_path)
             if found:
                 f_path = found
             else:
@@ -140,94 +182,60 @@ def run():
             continue
 
         try:
-            with open(f_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-
             file_parts = []
             while True:
                 r_input = prompt(
-                    f"  Plage pour '{os.path.basename(f_path)}' (ex: 10-50 / Entrée pour tout) : ").strip()
+                    f"  Plage(s) pour '{os.path.basename(f_path)}' (ex: 10-50,200-240,-20 / Entrée pour tout) : ").strip()
 
                 if not r_input:
                     if not file_parts:
-                        context_blocks.append(f"--- FICHIER COMPLET : {f_path} ---\n" + "".join(lines))
+                        with open(f_path, 'r', encoding='utf-8') as f:
+                            file_blocks.append(f"--- FICHIER COMPLET : {f_path} ---\n" + f.read())
                         console.print(f"[green]  [+] Fichier complet ajouté.[/green]")
                     break
 
-                part = extract_single_range(lines, r_input, f_path)
-                file_parts.append(part)
-                console.print(f"[green]  [+] Plage {r_input} ajoutée.[/green]")
+                # Seules les lignes demandées sont lues (mmap + index des lignes, voir range_reader.py)
+                try:
+                    parts = extract_ranges(f_path, r_input)
+                except ValueError as e:
+                    console.print(f"[bold red]  [!] {e}[/bold red]")
+                    continue
+                file_parts.extend(parts)
+                console.print(f"[green]  [+] Plage(s) {r_input} ajoutée(s).[/green]")
 
             if file_parts:
-                context_blocks.append("\n\n[...]\n\n".join(file_parts))
+                range_blocks.append("\n\n[...]\n\n".join(file_parts))
 
         except Exception as e:
             console.print(f"[bold red]  [!] Erreur de lecture : {e}[/bold red]")
 
-    # --- Récupération des contextes (RepoMap + YAML + Vectoriel) ---
+    # Mode auto : réponse reprise sans confirmation, sauf si des fichiers ont été ajoutés au contexte
+    if similar_future is not None:
+        with console.status("[bold blue]Recherche d'une réponse similaire...[/bold blue]", spinner="dots"):
+            embedding, similar = similar_future.result()
+        reused = semantic_cache.choose(console, similar, files_added=bool(range_blocks or file_blocks))
+        if reused:
+            show_reused_answer(reused)
+            return
+
+    # --- Récupération des contextes (RepoMap + YAML + Vectoriel), lancée en arrière-plan ---
+    waiting = time.perf_counter()
     with console.status("[bold blue]Consultation de la mémoire et du projet...[/bold blue]", spinner="dots"):
-
-        # --- Récupération du repo_map d'Aider ---
-        repo_map = get_repo_map()
-
-        # --- Récupération Mémoires ---
-        summary_content = "Aucun résumé disponible."
-        if os.path.exists("resume_contexte.yaml"):
-            with open("resume_contexte.yaml", "r", encoding='utf-8') as f:
-                summary_content = f.read()
-
-        console.print("[bold cyan]\n🔍 Consultation de la mémoire à long terme...[/bold cyan]")
-        try:
-            api_key = os.environ.get("GEMINI_API_KEY")
-            client = genai.Client(api_key=api_key)
-
-            res = client.models.embed_content(
-                model="models/gemini-embedding-001",
-                contents=main_prompt,
-                config={'output_dimensionality': 768}
-            )
-            embedding = res.embeddings[0].values
-
-            conn = psycopg2.connect(**DB_CONFIG)
-            register_vector(conn)
-            cur = conn.cursor()
-
-            cur.execute("SELECT content FROM chat_history ORDER BY embedding <=> %s::vector LIMIT 3", (embedding,))
-            rows = cur.fetchall()
-            context_vectoriel = "\n".join([f"--- Souvenir {i + 1} ---\n{r[0]}" for i, r in enumerate(rows)])
-            cur.close()
-            conn.close()
-        except Exception as e:
-            context_vectoriel = f"Erreur mémoire : {e}"
+        repo_map = repo_map_future.result()
+        summary_content = summary_future.result()
+        context_vectoriel = memories_future.result()
+    console.print(f"[dim]⏱️  Contexte prêt {time.perf_counter() - waiting:.2f} s après la saisie des fichiers[/dim]")
 
     # --- Construction du Prompt Final ---
-    files_context_string = "\n\n".join(context_blocks)
-    full_prompt = f"""
-[STRUCTURE_DU_PROJET]
-{repo_map}
-[/STRUCTURE_DU_PROJET]
-
-[CONTEXTE_STRUCTUREL_YAML]
-{summary_content}
-[/CONTEXTE_STRUCTUREL_YAML]
-
-[CONTEXTE_FICHIERS]
-{files_context_string}
-[/CONTEXTE_FICHIERS]
-
-[CONTEXTE_VECTORIEL]
-{context_vectoriel}
-[/CONTEXTE_VECTORIEL]
-
-QUESTION_UTILISATEUR : {main_prompt}"""
+    # Sections ajoutées par priorité dans le budget de la pile de modèles (voir context_packer.py)
+    full_prompt, report = context_packer.build_context(
+        main_prompt, range_blocks, file_blocks, context_vectoriel, summary_content, repo_map, MODELS
+    )
+    console.print(context_packer.describe(report))
 
     try:
-        subprocess.run(
-            [PYTHON_BIN, GLOG_PATH, main_prompt],
-            input=full_prompt,
-            text=True,
-            encoding='utf-8'
-        )
+        # Appel direct de glog dans le même processus (pas de nouvel interpréteur)
+        process_question(main_prompt, full_prompt)
     except KeyboardInterrupt:
         console.print("\n[yellow]Interrompu par l'utilisateur.[/yellow]")
     except Exception as e:
@@ -235,4 +243,8 @@ QUESTION_UTILISATEUR : {main_prompt}"""
 
 
 if __name__ == "__main__":
-    run()
+    if "--profile-startup" in sys.argv[1:]:
+        from startup_profile import report_startup
+        report_startup("geni")
+    else:
+        run()
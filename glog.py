@@ -1,19 +1,17 @@
 import sys
-import subprocess
 import datetime
 import os
-import hashlib
 import re
 import time
-import psycopg2
-from pgvector.psycopg2 import register_vector
-from google import genai
-from openai import OpenAI
 from dotenv import load_dotenv
 from rich.console import Console
-from rich.panel import Panel
-from rich.markdown import Markdown
-from rich.rule import Rule
+
+from ask import ask_question, build_prompt
+import embedding_cache
+import postprocess_queue
+import semantic_cache
+from model_health import ENABLED as HEALTH_ENABLED, HealthBoard
+from streaming import LiveAnswer
 
 
 # --- INITIALISATION ---
@@ -22,65 +20,93 @@ load_dotenv()
 # On utilise stderr pour que les logs ne soient pas capturés dans la réponse finale
 console = Console(stderr=True)
 
-# Configuration DB
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT"),
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD")
-}
-
-# Configuration Chemins
-LOCAL_BIN = os.environ.get('LOCAL_BIN', os.path.expanduser(r'~\.local\bin'))
-ASK_SCRIPT = os.path.join(LOCAL_BIN, 'ask.py')
-PYTHON_BIN = os.environ.get('PYTHON_BIN', 'python')
+# Affichage progressif de la réponse (GLOG_STREAM=0 pour revenir à l'affichage en fin de réponse)
+STREAM_MODE = os.environ.get('GLOG_STREAM', '1') != '0'
 
 
 # --- FONCTIONS DE SERVICE ---
 
-def index_interaction(full_text):
-    """Calcule le hash, l'embedding et insère dans Postgres."""
+def get_project_id():
+    """Identifie le projet par le nom du dossier courant."""
+    return os.path.basename(os.getcwd())
+
+
+def index_interactions(full_texts, project_id=None):
+    """Calcule hash et embeddings d'un lot d'échanges (un seul appel) et les insère avec l'ID du projet.
+
+    Renvoie False en cas d'échec, pour que la file de post-traitement retente plus tard.
+    """
     try:
         api_key = os.environ.get("GEMINI_API_KEY")
         if not api_key:
-            return
+            return True
+
+        project_id = project_id or get_project_id()
 
-        client = genai.Client(api_key=api_key)
-        content_hash = hashlib.md5(full_text.encode('utf-8')).hexdigest()
+        # Démon mémoire lancé : connexion et client Gemini déjà ouverts (None sinon)
+        import memory_daemon
+        if memory_daemon.index(full_texts, project_id) is not None:
+            console.print("[bold green]✔[/bold green] [bold cyan]Mémoire vectorielle synchronisée.[/bold cyan]")
+            return True
 
-        with psycopg2.connect(**DB_CONFIG) as conn:
-            register_vector(conn)
+        # Imports différés : seulement si l'indexation a réellement lieu
+        from memory_db import connect, store_interactions
+
+        with connect() as conn:
             with conn.cursor() as cur:
-                # Vérification unicité
-                cur.execute("SELECT id FROM chat_history WHERE content_hash = %s", (content_hash,))
-                if cur.fetchone(): return
-
-                # Génération Embedding
-                res = client.models.embed_content(
-                    model="models/gemini-embedding-001",
-                    contents=full_text,
-                    config={'output_dimensionality': 768}
-                )
-
-                cur.execute(
-                    "INSERT INTO chat_history (content, content_hash, embedding) VALUES (%s, %s, %s)",
-                    (full_text, content_hash, res.embeddings[0].values)
-                )
+                # Échanges déjà connus ignorés ; embeddings en un appel par lot (hors cache local), morceaux compris
+                store_interactions(cur, full_texts, project_id,
+                                   lambda texts: embedding_cache.gemini_embeddings(texts, api_key=api_key))
         console.print("[bold green]✔[/bold green] [bold cyan]Mémoire vectorielle synchronisée.[/bold cyan]")
+        return True
     except Exception as e:
         console.print(f"[bold red]⚠️ Note: Échec de l'indexation vectorielle ({str(e)[:100]})[/bold red]")
+        return False
+
+
+def index_interaction(full_text, project_id=None):
+    """Calcule le hash, l'embedding et insère dans Postgres avec l'ID du projet."""
+    return index_interactions([full_text], project_id)
+
+
+def lookup_similar(user_question, project_id=None):
+    """Cache sémantique : renvoie (embedding de la question, échanges passés quasi identiques du projet)."""
+    try:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            return None, []
+
+        from memory_db import connect
+
+        embedding = embedding_cache.gemini_embedding(user_question, api_key=api_key)
+
+        with connect() as conn:
+            with conn.cursor() as cur:
+                return embedding, semantic_cache.find_similar(cur, embedding, project_id or get_project_id())
+    except Exception as e:
+        console.print(f"[dim]Cache sémantique indisponible ({str(e)[:80]})[/dim]")
+        return None, []
+
+
+def show_reused_answer(answer):
+    """Affiche une réponse reprise du cache sémantique, sans nouvel appel ni post-traitement."""
+    from rich.markdown import Markdown
+    from rich.panel import Panel
+
+    console.print(Panel(Markdown(answer), title="[bold green]Analyse du Modèle (réponse réutilisée)[/bold green]",
+                        border_style="green", expand=False))
+    try:
+        with open('dernier_plan.md', 'w', encoding='utf-8') as p:
+            p.write(answer)
+    except OSError as e:
+        console.print(f"[bold red]❌ Erreur disque : {e}[/bold red]")
 
 
 def update_global_summary(user_query, ai_response):
-    """Consolide la mémoire normative YAML avec basculement intelligent."""
-    # Petite pause pour éviter le Rate Limit (429) juste après la réponse principale
-    time.sleep(1)
+    """Consolide la mémoire normative YAML avec basculement intelligent (False si tous les modèles échouent)."""
+    import memory_daemon
 
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=os.getenv("OPENROUTER_API_KEY")
-    )
+    client = None
 
     # Pile de modèles pour la consolidation
     archive_models = [
@@ -137,66 +163,86 @@ Utilisateur : {user_query}
 IA : {ai_response[:2000]}
 """
 
+    # Les modèles dont le circuit est ouvert (429, crédits...) sont ignorés sans appel réseau
+    health = HealthBoard() if HEALTH_ENABLED else None
+    if health:
+        archive_models, _ = health.order(archive_models)
+
     for model in archive_models:
+        started_at = time.perf_counter()
         try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "system", "content": "Tu es un archiviste YAML."},
-                          {"role": "user", "content": prompt_consolidation}],
-                temperature=0.1
-            )
-            raw = response.choices[0].message.content
+            messages = [{"role": "system", "content": "Tu es un archiviste YAML."},
+                        {"role": "user", "content": prompt_consolidation}]
+            # Client OpenRouter du démon mémoire s'il est lancé, sinon client construit une seule fois ici
+            raw = memory_daemon.complete(model, messages, temperature=0.1)
+            if raw is None:
+                if client is None:
+                    from openai import OpenAI
+
+                    client = OpenAI(
+                        base_url="https://openrouter.ai/api/v1",
+                        api_key=os.getenv("OPENROUTER_API_KEY")
+                    )
+                response = client.chat.completions.create(model=model, messages=messages, temperature=0.1)
+                raw = response.choices[0].message.content
+            if health:
+                health.record_success(model, time.perf_counter() - started_at)
             clean_yaml = re.sub(r'```yaml|```', '', raw).strip()
 
             with open(summary_file, 'w', encoding='utf-8') as f:
                 f.write(clean_yaml)
             console.print("[bold green]✔[/bold green] [bold cyan]Mémoire normative (YAML) consolidée.[/bold cyan]")
-            return
+            return True
         except Exception as e:
+            if health:
+                health.record_failure(model, e)
             # Plus de transparence sur l'échec de consolidation
             err_msg = str(e)
             console.print(f"[bold red]⚠️ Échec consolidation avec {model} : {err_msg[:60]}[/bold red]...")
             continue
 
+    return False
+
 
 # --- LOGIQUE PRINCIPALE ---
 
-def run():
-    # 1. Collecte des entrées (Arguments + Pipe)
-    user_question = " ".join(sys.argv[1:])
-    context_data = sys.stdin.read() if not sys.stdin.isatty() else ""
+def process_question(user_question, context_data, use_cache=True):
+    """Interroge l'IA dans le processus courant, affiche la réponse puis lance le post-traitement."""
+    from rich.rule import Rule
 
-    if not user_question and not context_data:
-        console.print("[bold red]❌ Erreur :[/bold red] Aucun contenu fourni.[/bold red")
-        return
-
-    # 2. Exécution d'ask.py avec un indicateur visuel global
+    # 2. Interrogation de l'IA avec un indicateur visuel global
     console.print(Rule("[bold green]Requête IA[/bold green]"))
 
     try:
-        result = subprocess.run(
-            [PYTHON_BIN, ASK_SCRIPT, user_question],
-            input=context_data,
-            stdout=subprocess.PIPE,
-            stderr=None,  # Stream direct du spinner et du debug de ask.py
-            text=True,
-            encoding='utf-8'
-        )
-
-        if result.returncode != 0:
-            console.print("\n[bold red]🛑 L'IA a rencontré une erreur fatale.[/bold red]")
+        prompt_final = build_prompt(user_question.strip(), context_data.strip())
+
+        try:
+            if STREAM_MODE:
+                # Rendu progressif de la réponse en Markdown au fil des tokens
+                answer = LiveAnswer(console)
+                try:
+                    ai_response = ask_question(prompt_final, stream=True, on_token=answer.update, use_cache=use_cache)
+                finally:
+                    answer.close()
+            else:
+                ai_response = ask_question(prompt_final, use_cache=use_cache)
+        except Exception as e:
+            console.print(f"\n[bold red]🛑 L'IA a rencontré une erreur fatale :[/bold red] {e}")
             return
 
-        ai_response = result.stdout.strip()
         if not ai_response:
             print("⚠️ Réponse vide reçue de l'IA.")
             return
 
         # 3. Rendu de la réponse en Markdown dans un Panel
-        console.print("\n")
-        render_md = Markdown(ai_response)
-        console.print(
-            Panel(render_md, title="[bold green]Analyse du Modèle[/bold green]", border_style="green", expand=False))
+        if not STREAM_MODE:
+            from rich.markdown import Markdown
+            from rich.panel import Panel
+
+            console.print("\n")
+            render_md = Markdown(ai_response)
+            console.print(
+                Panel(render_md, title="[bold green]Analyse du Modèle[/bold green]", border_style="green", expand=False))
 
         # 4. Écriture des fichiers de sortie
         console.print(Rule("[bold green]Post-traitement[/bold green]"))
@@ -215,9 +261,18 @@ def run():
             console.print(f"[bold red]❌ Erreur disque : {e}[/bold red]")
             return
 
-        # 5. Lancement des indexations et résumés
-        index_interaction(full_entry)
-        update_global_summary(user_question, ai_response)
+        # 5. Lancement des indexations et résumés (confiés au worker de post-traitement par défaut)
+        if postprocess_queue.MODE == "async":
+            postprocess_queue.enqueue("glog", "index", {"full_text": full_entry, "project_id": get_project_id()})
+            postprocess_queue.enqueue("glog", "summary", {"user_query": user_question, "ai_response": ai_response})
+            postprocess_queue.ensure_worker()
+            console.print("[bold green]✔[/bold green] [bold cyan]Indexation et consolidation confiées au worker "
+                          "(python postprocess_queue.py pour suivre).[/bold cyan]")
+        else:
+            index_interaction(full_entry, get_project_id())
+            # Petite pause pour éviter le Rate Limit (429) juste après la réponse principale
+            time.sleep(1)
+            update_global_summary(user_question, ai_response)
 
         console.print("[bold green]✔[/bold green] [bold cyan]Workflow terminé avec succès.[/bold cyan]")
 
@@ -225,5 +280,31 @@ def run():
         console.print(f"[bold red]❌ Erreur système :[/bold red] {e}")
 
 
+def run():
+    # 1. Collecte des entrées (Arguments + Pipe)
+    # --no-cache : la question est reposée même si une réponse identique est en cache
+    use_cache = "--no-cache" not in sys.argv[1:]
+    user_question = " ".join(arg for arg in sys.argv[1:] if arg != "--no-cache")
+    context_data = sys.stdin.read() if not sys.stdin.isatty() else ""
+
+    if not user_question and not context_data:
+        console.print("[bold red]❌ Erreur :[/bold red] Aucun contenu fourni.[/bold red")
+        return
+
+    # Question seule (sans contenu pipé) : une réponse quasi identique a peut-être déjà été donnée
+    if semantic_cache.enabled() and user_question.strip() and not context_data.strip():
+        _, matches = lookup_similar(user_question.strip())
+        reused = semantic_cache.choose(console, matches, interactive=sys.stdin.isatty())
+        if reused:
+            show_reused_answer(reused)
+            return
+
+    process_question(user_question, context_data, use_cache)
+
+
 if __name__ == "__main__":
-    run()
+    if "--profile-startup" in sys.argv[1:]:
+        from startup_profile import report_startup
+        report_startup("glog")
+    else:
+        run()
@@ -5,6 +5,21 @@ import glob
 import threading
 import time
 
+from file_index import FileIndex
+from range_reader import extract_ranges
+
+_index = None
+
+
+def file_index():
+    """Index des noms de fichiers, chargé au premier besoin."""
+    global _index
+    if _index is None:
+        _index = FileIndex()
+        _index.refresh()
+    return _index
+
+
 # --- Configuration de l'auto-complétion ---
 try:
     import readline
@@ -12,6 +27,9 @@ try:
 
     def completer(text, state):
         options = glob.glob(text + '*')
+        if not options and text and os.sep not in text and '/' not in text:
+            # Simple nom de fichier : complété depuis l'index du projet
+            options = file_index().complete(text)
         if state < len(options):
             option = options[state]
             return option + os.sep if os.path.isdir(option) else option
@@ -28,12 +46,19 @@ except ImportError:
 # --- Fonctions utilitaires ---
 
 def find_file_recursive(filename):
-    """Cherche un fichier dans les sous-dossiers (exclut les dossiers lourds)"""
-    exclude_dirs = {'.git', 'vendor', 'node_modules', 'var', 'cache'}
-    for root, dirs, files in os.walk('.'):
-        dirs[:] = [d for d in dirs if d not in exclude_dirs]
-        if filename in files:
-            return os.path.join(root, filename)
+    """Cherche un fichier dans l'index du projet ; choix à faire si plusieurs fichiers correspondent"""
+    matches, exact = file_index().find(filename)
+    if not matches:
+        return None
+    if exact and len(matches) == 1:
+        return matches[0]
+
+    print("  Plusieurs fichiers portent ce nom :" if exact else "  Fichier introuvable, noms approchés :")
+    for i, path in enumerate(matches, 1):
+        print(f"    {i}. {path}")
+    choice = input("  Numéro (Entrée pour annuler) : ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(matches):
+        return matches[int(choice) - 1]
     return None
 
 
@@ -48,16 +73,6 @@ def spinner_task(stop_event):
     print("\r" + " " * 30 + "\r", end="", flush=True)
 
 
-def extract_single_range(lines, r_string, file_path):
-    """Extrait une seule plage de lignes"""
-    try:
-        start, end = map(int, r_string.split('-'))
-        part = lines[start - 1:end]
-        return f"--- {file_path} (Lignes {r_string}) ---\n" + "".join(part)
-    except Exception as e:
-        return f"  [!] Erreur sur la plage {r_string}: {e}"
-
-
 def run():
     print("=== ASSISTANT DE CONTEXTE GEMINI ===")
 
@@ -84,28 +99,27 @@ def run():
                 print(f"  Erreur : Impossible de localiser le fichier.")
                 continue
 
-        # Lecture du fichier une seule fois pour toutes ses plages
-        try:
-            with open(f_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-        except Exception as e:
-            print(f"  Erreur de lecture : {e}")
-            continue
-
-        # --- Sous-boucle pour les plages (Ranges) ---
+        # --- Sous-boucle pour les plages (Ranges) : seules les lignes demandées sont lues ---
         file_parts = []
         while True:
             r_input = input(
-                f"  Ajouter une plage pour '{os.path.basename(f_path)}' (ex: 10-50 / Entrée si fini) : ").strip()
+                f"  Ajouter une plage pour '{os.path.basename(f_path)}' (ex: 10-50,200-240,-20 / Entrée si fini) : ").strip()
             if not r_input:
                 # Si aucune plage n'a été saisie du tout, on prend tout le fichier
                 if not file_parts:
-                    context_blocks.append("".join(lines))
-                    print(f"  -> Fichier complet ajouté.")
+                    try:
+                        with open(f_path, 'r', encoding='utf-8') as f:
+                            context_blocks.append(f.read())
+                        print(f"  -> Fichier complet ajouté.")
+                    except Exception as e:
+                        print(f"  Erreur de lecture : {e}")
                 break
 
-            part = extract_single_range(lines, r_input, f_path)
-            file_parts.append(part)
+            try:
+                file_parts.extend(extract_ranges(f_path, r_input))
+            except (OSError, ValueError) as e:
+                print(f"  Erreur : {e}")
+                continue
             print(f"  [+] Plage {r_input} ajoutée.")
 
         if file_parts:
@@ -1,22 +1,18 @@
 import sys
-import subprocess
 import datetime
 import os
-import hashlib
 import re
 import time
-import psycopg2
-from google.genai import types
-from pgvector.psycopg2 import register_vector
-from google import genai
 from dotenv import load_dotenv
 from rich.console import Console
-from rich.panel import Panel
-from rich.markdown import Markdown
-from rich.rule import Rule
-from cryptography.fernet import Fernet
-import requests
-import json
+
+from call_relay import RelayError, ask_question, build_prompt
+import embedding_cache
+import postprocess_queue
+import relay_transport
+import semantic_cache
+from model_health import ENABLED as HEALTH_ENABLED, HealthBoard
+from streaming import LiveAnswer
 
 # --- INITIALISATION ---
 load_dotenv()
@@ -28,19 +24,8 @@ RELAY_URL = os.getenv("RELAY_URL")
 # On utilise stderr pour que les logs ne soient pas capturés dans la réponse finale
 console = Console(stderr=True)
 
-# Configuration DB
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT"),
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD")
-}
-
-# Configuration Chemins
-LOCAL_BIN = os.environ.get('LOCAL_BIN', os.path.expanduser(r'~\.local\bin'))
-ASK_SCRIPT = os.path.join(LOCAL_BIN, 'call_relay.py')
-PYTHON_BIN = os.environ.get('PYTHON_BIN', 'python')
+# Affichage progressif de la réponse (GLOG_STREAM=0 pour revenir à l'affichage en fin de réponse)
+STREAM_MODE = os.environ.get('GLOG_STREAM', '1') != '0'
 
 
 # --- FONCTIONS DE SERVICE ---
@@ -50,56 +35,116 @@ def get_project_id():
     return os.path.basename(os.getcwd())
 
 
-def index_interaction(full_text, project_id):
-    """Calcule le hash, l'embedding et insère dans Postgres avec l'ID du projet."""
+def index_interactions(full_texts, project_id):
+    """Calcule hash et embeddings d'un lot d'échanges (un seul appel) et les insère avec l'ID du projet.
+
+    Renvoie False en cas d'échec, pour que la file de post-traitement retente plus tard.
+    """
     try:
         api_key = os.environ.get("GEMINI_API_KEY")
         if not api_key:
-            return
+            return True
 
-        client = genai.Client(api_key=api_key)
-        content_hash = hashlib.md5(full_text.encode('utf-8')).hexdigest()
+        # Démon mémoire lancé : connexion et client Gemini déjà ouverts (None sinon)
+        import memory_daemon
+        if memory_daemon.index(full_texts, project_id) is not None:
+            console.print("[bold green]✔[/bold green] [bold cyan]Mémoire vectorielle synchronisée "
+                          f"({project_id}).[/bold cyan]")
+            return True
 
-        with psycopg2.connect(**DB_CONFIG) as conn:
-            register_vector(conn)
-            with conn.cursor() as cur:
-                # Vérification unicité
-                cur.execute("SELECT id FROM chat_history WHERE content_hash = %s", (content_hash,))
-                if cur.fetchone(): return
+        # Imports différés : seulement si l'indexation a réellement lieu
+        from memory_db import connect, store_interactions
 
-                # Génération Embedding
+        with connect() as conn:
+            with conn.cursor() as cur:
+                # Échanges déjà connus ignorés ; embeddings en un appel par lot (hors cache local), morceaux compris
                 try:
-                    res = client.models.embed_content(
-                        model="models/gemini-embedding-001",
-                        contents=full_text,
-                        config=types.EmbedContentConfig(
-                            output_dimensionality=768
-                        )
-                    )
-
-                    cur.execute(
-                        "INSERT INTO chat_history (content, content_hash, embedding, project_id) "
-                        "VALUES (%s, %s, %s, %s)",
-                        (full_text, content_hash, res.embeddings[0].values, project_id)
-                    )
+                    store_interactions(cur, full_texts, project_id,
+                                       lambda texts: embedding_cache.gemini_embeddings(texts, api_key=api_key))
                     console.print("[bold green]✔[/bold green] [bold cyan]Mémoire vectorielle synchronisée "
-                                  "({project_id}).[/bold cyan]")
+                                  f"({project_id}).[/bold cyan]")
+                    return True
                 except MemoryError as e:
                     console.print(f"[bold red]⚠️ Mémoire insuffisante pour l'embedding : {e}[/bold red]")
-                    return
+                    return False
                 except Exception as e:
                     console.print(f"[bold red]⚠️ Erreur lors de la génération de l'embedding : {e}[/bold red]")
-                    return
+                    return False
 
     except Exception as e:
         console.print(f"[bold red]⚠️ Note: Échec de l'indexation vectorielle ({str(e)[:100]})[/bold red]")
+        return False
 
 
-def update_global_summary(user_query, ai_response, project_id):
-    """Consolide la mémoire normative YAML avec basculement intelligent."""
-    # Petite pause pour éviter le Rate Limit (429) juste après la réponse principale
-    time.sleep(1)
+def index_interaction(full_text, project_id):
+    """Calcule le hash, l'embedding et insère dans Postgres avec l'ID du projet."""
+    return index_interactions([full_text], project_id)
+
+
+# Appel le relais pour piloter l'embedding
+def get_remote_embedding(text):
+    """Embedding calculé par le relais (/embed), servi par le cache local s'il est déjà connu."""
+
+    def embed_many(texts):
+        embeddings = []
+        for item in texts:
+            # Payload pour le relais
+            data_to_send = {
+                "internal_token": SECRET_TOKEN,
+                "text": item
+            }
+
+            # Supprime /relay de l'URL pour y ajouter /embed (connexion partagée avec les appels au modèle)
+            response = relay_transport.post_json(relay_transport.relay_url("embed"), data_to_send)
+            if response.status_code != 200:
+                raise Exception(f"Erreur lors de la génération de l'embedding distant: {response.status_code} - {response.text}")
+            embeddings.append(relay_transport.json_body(response)['embedding'])
+        return embeddings
 
+    # Appel vers l'endpoint /embed sur le relais
+    try:
+        return embedding_cache.cached_embeddings([text], embed_many, "relay/embed", embedding_cache.GEMINI_DIM)[0]
+    except MemoryError as e:
+        console.print(f"[bold red]⚠️ Mémoire insuffisante lors de la requête d'embedding distant : {e}[/bold red]")
+        return None  # Ou une valeur par défaut, selon le cas
+    except Exception as e:
+        console.print(f"[bold red]⚠️ Erreur lors de la requête d'embedding distant : {e}[/bold red]")
+        return None
+
+
+def lookup_similar(user_question, project_id):
+    """Cache sémantique : renvoie (embedding de la question, échanges passés quasi identiques du projet)."""
+    embedding = get_remote_embedding(user_question)
+    if embedding is None:
+        return None, []
+
+    try:
+        from memory_db import connect
+
+        with connect() as conn:
+            with conn.cursor() as cur:
+                return embedding, semantic_cache.find_similar(cur, embedding, project_id)
+    except Exception as e:
+        console.print(f"[dim]Cache sémantique indisponible ({str(e)[:80]})[/dim]")
+        return embedding, []
+
+
+def show_reused_answer(answer):
+    """Affiche une réponse reprise du cache sémantique, sans nouvel appel ni post-traitement."""
+    from rich.markdown import Markdown
+    from rich.panel import Panel
+
+    console.print(Panel(Markdown(answer), title="[bold green]Analyse du Modèle (réponse réutilisée)[/bold green]",
+                        border_style="green", expand=False))
+    try:
+        with open('dernier_plan.md', 'w', encoding='utf-8') as p:
+            p.write(answer)
+    except OSError as e:
+        console.print(f"[bold red]❌ Erreur disque : {e}[/bold red]")
+
+
+def update_global_summary(user_query, ai_response, project_id):
+    """Consolide la mémoire normative YAML avec basculement intelligent (False si tous les modèles échouent)."""
     # Pile de modèles pour la consolidation
     archive_models = [
         "google/gemini-2.0-flash-001",
@@ -108,8 +153,6 @@ def update_global_summary(user_query, ai_response, project_id):
         "openrouter/auto"
     ]
 
-    cipher = Fernet(ENCRYPTION_KEY)
-
     summary_file = 'resume_contexte.yaml'
 
     if os.path.exists(summary_file):
@@ -157,7 +200,13 @@ Utilisateur : {user_query}
 IA : {ai_response[:2000]}
 """
 
+    # Les modèles dont le circuit est ouvert (429, crédits...) sont ignorés sans appel réseau
+    health = HealthBoard() if HEALTH_ENABLED else None
+    if health:
+        archive_models, _ = health.order(archive_models)
+
     for model in archive_models:
+        started_at = time.perf_counter()
         try:
             # Construction du payload pour le relais
             payload = {
@@ -172,72 +221,80 @@ IA : {ai_response[:2000]}
             }
 
             data_to_send = {"internal_token": SECRET_TOKEN, "payload": payload}
-            encrypted_data = cipher.encrypt(json.dumps(data_to_send).encode())
-
-            # Appel via relais
-            response = requests.post(RELAY_URL, data=encrypted_data)
-
-            if response.status_code == 200:
-                resp_json = response.json()
-                if 'choices' in resp_json:
-                    raw = resp_json['choices'][0]['message']['content']
-                    clean_yaml = re.sub(r'```yaml|```', '', raw).strip()
-
-                    with open(summary_file, 'w', encoding='utf-8') as f:
-                        f.write(clean_yaml)
-                    console.print(
-                        "[bold green]✔[/bold green] [bold cyan]Mémoire normative consolidée (via Relais).[/bold cyan]")
-                    return
-                else:
-                    raise KeyError("Clé 'choices' manquante dans la réponse du relais")
+
+            # Appel via relais (enveloppe chiffrée négociée, voir relay_transport.py)
+            response = relay_transport.post_json(RELAY_URL, data_to_send)
+
+            if response.status_code != 200:
+                raise RelayError(f"Erreur Relais ({response.status_code})", response.status_code)
+
+            resp_json = relay_transport.json_body(response)
+            if 'choices' in resp_json:
+                raw = resp_json['choices'][0]['message']['content']
+                if health:
+                    health.record_success(model, time.perf_counter() - started_at)
+                clean_yaml = re.sub(r'```yaml|```', '', raw).strip()
+
+                with open(summary_file, 'w', encoding='utf-8') as f:
+                    f.write(clean_yaml)
+                console.print(
+                    "[bold green]✔[/bold green] [bold cyan]Mémoire normative consolidée (via Relais).[/bold cyan]")
+                return True
+            else:
+                raise KeyError("Clé 'choices' manquante dans la réponse du relais")
         except Exception as e:
+            if health:
+                health.record_failure(model, e)
             # Plus de transparence sur l'échec de consolidation
             err_msg = str(e)
             console.print(f"[bold red]⚠️ Échec consolidation avec {model} : {err_msg[:60]}[/bold red]...")
             continue
 
+    return False
+
 
 # --- LOGIQUE PRINCIPALE ---
 
-def run():
-    # 1. Collecte des entrées (Arguments + Pipe) et détection du projet
-    project_id = get_project_id()
-    user_question = " ".join(sys.argv[1:])
-    context_data = sys.stdin.read() if not sys.stdin.isatty() else ""
+def process_question(user_question, context_data, project_id=None, use_cache=True):
+    """Interroge l'IA via le relais dans le processus courant, affiche la réponse puis lance le post-traitement."""
+    from rich.rule import Rule
 
-    if not user_question and not context_data:
-        console.print("[bold red]❌ Erreur :[/bold red] Aucun contenu fourni.[/bold red")
-        return
+    project_id = project_id or get_project_id()
 
-    # 2. Exécution d'ask.py avec un indicateur visuel global
+    # 2. Interrogation du relais avec un indicateur visuel global
     console.print(Rule("[bold green]Requête IA[/bold green]"))
 
     try:
-        result = subprocess.run(
-            [PYTHON_BIN, ASK_SCRIPT, user_question],
-            input=context_data,
-            stdout=subprocess.PIPE,
-            stderr=None,  # Stream direct du spinner et du debug de ask.py
-            text=True,
-            encoding='utf-8'
-        )
-
-        if result.returncode != 0:
-            console.print(f"\n[bold red]🛑 Erreur fatale (Code {result.returncode})[/bold red]")
-            console.print(f"DEBUG STDOUT: {result.stdout}")
-            console.print(f"DEBUG STDERR: {result.stderr}")
+        prompt_final = build_prompt(user_question.strip(), context_data.strip())
+
+        try:
+            if STREAM_MODE:
+                # Rendu progressif de la réponse en Markdown au fil des tokens
+                answer = LiveAnswer(console)
+                try:
+                    ai_response = ask_question(prompt_final, project_id, stream=True, on_token=answer.update,
+                                               use_cache=use_cache)
+                finally:
+                    answer.close()
+            else:
+                ai_response = ask_question(prompt_final, project_id, use_cache=use_cache)
+        except Exception as e:
+            console.print(f"\n[bold red]🛑 Erreur fatale :[/bold red] {e}")
             return
 
-        ai_response = result.stdout.strip()
         if not ai_response:
             print("⚠️ Réponse vide reçue de l'IA.")
             return
 
         # 3. Rendu de la réponse en Markdown dans un Panel
-        console.print("\n")
-        render_md = Markdown(ai_response)
-        console.print(
-            Panel(render_md, title="[bold green]Analyse du Modèle[/bold green]", border_style="green", expand=False))
+        if not STREAM_MODE:
+            from rich.markdown import Markdown
+            from rich.panel import Panel
+
+            console.print("\n")
+            render_md = Markdown(ai_response)
+            console.print(
+                Panel(render_md, title="[bold green]Analyse du Modèle[/bold green]", border_style="green", expand=False))
 
         # 4. Écriture des fichiers de sortie
         console.print(Rule("[bold green]Post-traitement[/bold green]"))
@@ -256,9 +313,20 @@ def run():
             console.print(f"[bold red]❌ Erreur disque : {e}[/bold red]")
             return
 
-        # 5. Lancement des indexations et résumés
-        index_interaction(full_entry, project_id)
-        update_global_summary(user_question, ai_response, project_id)
+        # 5. Lancement des indexations et résumés (confiés au worker de post-traitement par défaut)
+        if postprocess_queue.MODE == "async":
+            postprocess_queue.enqueue("glog_relay", "index", {"full_text": full_entry, "project_id": project_id})
+            postprocess_queue.enqueue("glog_relay", "summary", {
+                "user_query": user_question, "ai_response": ai_response, "project_id": project_id
+            })
+            postprocess_queue.ensure_worker()
+            console.print("[bold green]✔[/bold green] [bold cyan]Indexation et consolidation confiées au worker "
+                          "(python postprocess_queue.py pour suivre).[/bold cyan]")
+        else:
+            index_interaction(full_entry, project_id)
+            # Petite pause pour éviter le Rate Limit (429) juste après la réponse principale
+            time.sleep(1)
+            update_global_summary(user_question, ai_response, project_id)
 
         console.print("[bold green]✔[/bold green] [bold cyan]Workflow terminé avec succès [{project_id}].[/bold cyan]")
 
@@ -266,5 +334,35 @@ def run():
         console.print(f"[bold red]❌ Erreur système :[/bold red] {e}")
 
 
+def run():
+    # Connexion au relais ouverte pendant la lecture du pipe
+    relay_transport.warm_up()
+
+    # 1. Collecte des entrées (Arguments + Pipe) et détection du projet
+    project_id = get_project_id()
+    # --no-cache : la question est reposée même si une réponse identique est en cache
+    use_cache = "--no-cache" not in sys.argv[1:]
+    user_question = " ".join(arg for arg in sys.argv[1:] if arg != "--no-cache")
+    context_data = sys.stdin.read() if not sys.stdin.isatty() else ""
+
+    if not user_question and not context_data:
+        console.print("[bold red]❌ Erreur :[/bold red] Aucun contenu fourni.[/bold red")
+        return
+
+    # Question seule (sans contenu pipé) : une réponse quasi identique a peut-être déjà été donnée
+    if semantic_cache.enabled() and user_question.strip() and not context_data.strip():
+        _, matches = lookup_similar(user_question.strip(), project_id)
+        reused = semantic_cache.choose(console, matches, interactive=sys.stdin.isatty())
+        if reused:
+            show_reused_answer(reused)
+            return
+
+    process_question(user_question, context_data, project_id, use_cache)
+
+
 if __name__ == "__main__":
-    run()
+    if "--profile-startup" in sys.argv[1:]:
+        from startup_profile import report_startup
+        report_startup("glog_relay")
+    else:
+        run()
@@ -0,0 +1,111 @@
+"""Lecture de historique_global.md sans le charger en mémoire.
+
+Les entrées sont séparées par une ligne de 50 « = » (voir glog.process_question). Le fichier est
+lu en binaire par morceaux : le délimiteur est en ASCII, il ne peut donc pas couper un caractère
+UTF-8 et chaque bloc se décode isolément, avec le même découpage que `content.split(DELIMITER)`.
+"""
+import hashlib
+import os
+import time
+
+from local_store import cache_path, file_lock, read_json, write_json_atomic
+
+DELIMITER = "=" * 50
+CHUNK_SIZE = 1024 * 1024
+TAIL_CHUNK_SIZE = 64 * 1024
+TAIL_SIZE = 4096  # Octets hachés juste avant le point de reprise
+
+CHECKPOINT_FILE = "index_checkpoints.json"
+
+
+def iter_blocks(path, start=0, chunk_size=CHUNK_SIZE):
+    """Génère (position du délimiteur qui précède le bloc, texte du bloc) à partir de l'octet start.
+
+    Le premier bloc a pour position start (aucun délimiteur devant lui dans la zone lue).
+    """
+    delimiter = DELIMITER.encode("ascii")
+    with open(path, "rb") as f:
+        f.seek(start)
+        buffer = b""
+        buffer_start = start  # Position dans le fichier du premier octet de buffer
+        block_offset = start
+        scanned = 0  # Octets de buffer déjà examinés sans trouver de délimiteur
+        while True:
+            chunk = f.read(chunk_size)
+            buffer += chunk
+            while True:
+                idx = buffer.find(delimiter, scanned)
+                if idx < 0:
+                    scanned = max(0, len(buffer) - len(delimiter) + 1)
+                    break
+                yield block_offset, buffer[:idx].decode("utf-8")
+                block_offset = buffer_start + idx
+                buffer_start += idx + len(delimiter)
+                buffer = buffer[idx + len(delimiter):]
+                scanned = 0
+            if not chunk:
+                yield block_offset, buffer.decode("utf-8")
+                return
+
+
+def iter_blocks_reverse(path, chunk_size=TAIL_CHUNK_SIZE):
+    """Génère les blocs du dernier au premier en remontant depuis la fin du fichier.
+
+    Seuls les octets des blocs effectivement consommés sont lus : le coût de lecture de la
+    dernière entrée ne dépend pas de la taille de l'historique.
+    """
+    delimiter = DELIMITER.encode("ascii")
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        buffer = b""
+        while True:
+            idx = buffer.rfind(delimiter)
+            if idx >= 0:
+                # Dans une suite de « = » plus longue, le découpage de gauche à droite (str.split) place les
+                # délimiteurs depuis le début de la suite : on remonte jusqu'à lui avant de couper
+                run_start = idx
+                while run_start > 0 and buffer[run_start - 1] == delimiter[0]:
+                    run_start -= 1
+                if run_start > 0 or position == 0:
+                    cut = run_start + ((idx - run_start) // len(delimiter)) * len(delimiter)
+                    yield buffer[cut + len(delimiter):].decode("utf-8")
+                    buffer = buffer[:cut]
+                    continue
+            if position == 0:
+                yield buffer.decode("utf-8")
+                return
+            read_size = min(chunk_size, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + buffer
+
+
+def _tail_hash(path, offset):
+    with open(path, "rb") as f:
+        f.seek(max(0, offset - TAIL_SIZE))
+        return hashlib.sha256(f.read(offset - max(0, offset - TAIL_SIZE))).hexdigest()
+
+
+def load_checkpoint(path):
+    """Position de reprise pour ce fichier, ou 0 si le fichier a été tronqué ou remplacé depuis."""
+    checkpoint = read_json(cache_path(CHECKPOINT_FILE), {}).get(os.path.abspath(path))
+    if not checkpoint:
+        return 0
+    offset = checkpoint["offset"]
+    try:
+        if os.path.getsize(path) < offset or _tail_hash(path, offset) != checkpoint["tail_hash"]:
+            return 0  # Fichier tronqué, réécrit ou remplacé (rotation) : relecture complète
+    except OSError:
+        return 0
+    return offset
+
+
+def save_checkpoint(path, offset):
+    """Mémorise la position de reprise et l'empreinte des octets qui la précèdent."""
+    checkpoints_path = cache_path(CHECKPOINT_FILE)
+    with file_lock(checkpoints_path):
+        checkpoints = read_json(checkpoints_path, {})
+        checkpoints[os.path.abspath(path)] = {
+            "offset": offset, "tail_hash": _tail_hash(path, offset), "at": time.time()
+        }
+        write_json_atomic(checkpoints_path, checkpoints)
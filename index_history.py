@@ -1,12 +1,21 @@
-import os
+import argparse
 import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import psycopg2
+from psycopg2.extras import execute_values
 from pgvector.psycopg2 import register_vector
-from google import genai
+
+import embedding_cache
+import memory_db
+from history_file import iter_blocks, load_checkpoint, save_checkpoint
 
 # NOTE : Port 5433 si tu as choisi la Solution 1
 DB_CONFIG = "host=localhost port=5433 dbname=gemini_history user=bulam password=your_secure_password"
-client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+
+EMBEDDING_MODEL = "text-embedding-004"
 
 
 def get_hash(text):
@@ -14,7 +23,28 @@ def get_hash(text):
     return hashlib.md5(text.encode('utf-8')).hexdigest()
 
 
-def index_file(filepath):
+def store_chunks(cur, parents, embed_many=embedding_cache.gemini_embeddings):
+    """Morceaux des échanges importés [(id, contenu, project_id)] : dès qu'il existe des morceaux,
+    le rappel ne cherche plus que dans chat_chunks."""
+    if not memory_db.CHUNKS or not parents:
+        return
+    cur.execute("SAVEPOINT chunks")
+    try:
+        memory_db.store_chunks(cur, parents, embed_many)
+    except Exception as e:
+        if type(e).__name__ != "UndefinedTable":
+            raise
+        cur.execute("ROLLBACK TO SAVEPOINT chunks")  # Base non migrée : le rappel lit chat_history
+
+
+def default_project(filepath):
+    """Projet d'un historique : le dossier qui le contient (comme glog, qui l'écrit dans le dossier courant)."""
+    return os.path.basename(os.path.dirname(os.path.abspath(filepath)))
+
+
+def index_file(filepath, incremental=False, project_id=None):
+    """Indexation bloc par bloc ; incremental : reprise après le dernier bloc indexé (point de reprise local)."""
+    project_id = project_id or default_project(filepath)
     conn = psycopg2.connect(DB_CONFIG)
     register_vector(conn)
     cur = conn.cursor()
@@ -23,47 +53,193 @@ def index_file(filepath):
     cur.execute("ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS content_hash TEXT UNIQUE;")
     conn.commit()
 
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
-        # On sépare par le délimiteur exact
-        blocks = content.split("==================================================")
+    start = load_checkpoint(filepath) if incremental else 0
+    if start:
+        print(f"⏩ Reprise à l'octet {start} : seule la fin du fichier est relue.")
+
+    resume_at = None  # Premier bloc en échec : la prochaine reprise repartira de lui
+    last_offset = start
+    # Lecture bloc par bloc, découpés sur le délimiteur exact
+    for offset, block in iter_blocks(filepath, start):
+        last_offset = offset
+        text = block.strip()
+        if not text or len(text) < 10:
+            continue  # On ignore les blocs vides ou trop courts
+
+        content_hash = get_hash(text)
+
+        # Vérification de l'existence
+        cur.execute("SELECT id FROM chat_history WHERE content_hash = %s", (content_hash,))
+        if cur.fetchone():
+            continue  # Déjà indexé, on passe au suivant
+
+        print(f"✨ Nouvel extrait trouvé. Indexation vectorielle...")
+
+        try:
+            # 1. Génération de l'embedding (768 dim pour text-embedding-004), déjà connu si le bloc a été réindexé
+            embedding = embedding_cache.gemini_embedding(text, model=EMBEDDING_MODEL, dim=None)
+
+            # 2. Insertion, avec les morceaux de l'échange dans la même transaction
+            cur.execute(
+                "INSERT INTO chat_history (content, content_hash, embedding, project_id) VALUES (%s, %s, %s, %s) "
+                "RETURNING id",
+                (text, content_hash, embedding, project_id)
+            )
+            parent_id = cur.fetchone()[0]
+            # Question embeddée comme celles du cache sémantique (modèle de glog, pas EMBEDDING_MODEL)
+            memory_db.store_questions(cur, [(parent_id, text)], embedding_cache.gemini_embeddings)
+            store_chunks(cur, [(parent_id, text, project_id)])
+            conn.commit()
+        except MemoryError as e:
+            print(f"❌ Mémoire insuffisante pour l'embedding : {e}")
+            conn.rollback()
+            resume_at = offset if resume_at is None else resume_at
+        except Exception as e:
+            print(f"❌ Erreur sur ce bloc : {e}")
+            conn.rollback()
+            resume_at = offset if resume_at is None else resume_at
 
-        for block in blocks:
-            text = block.strip()
-            if not text or len(text) < 10:
-                continue  # On ignore les blocs vides ou trop courts
+    cur.close()
+    conn.close()
+    if incremental:
+        # Le dernier bloc est toujours relu : il a pu être lu pendant son écriture
+        save_checkpoint(filepath, last_offset if resume_at is None else resume_at)
+    print("🚀 Base de données synchronisée !")
 
-            content_hash = get_hash(text)
 
-            # Vérification de l'existence
-            cur.execute("SELECT id FROM chat_history WHERE content_hash = %s", (content_hash,))
-            if cur.fetchone():
-                continue  # Déjà indexé, on passe au suivant
+def read_blocks(filepath, start=0):
+    """Blocs indexables à partir de l'octet start, dédoublonnés : ({hash: (position, texte)}, dernière position)."""
+    unique = {}
+    last_offset = start
+    for offset, block in iter_blocks(filepath, start):
+        last_offset = offset
+        text = block.strip()
+        if text and len(text) >= 10:
+            unique.setdefault(get_hash(text), (offset, text))
+    return unique, last_offset
+
+
+def _with_retries(embed, texts, attempts=3):
+    """Un seul appel d'embedding pour tous les textes, avec quelques essais espacés (429...)."""
+    for attempt in range(attempts):
+        try:
+            return embed(texts)
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(2 ** (attempt + 1))
+
+
+def _embed_batch(texts):
+    """Embeddings du lot, et ceux de ses questions et de ses morceaux ({texte: vecteur}) calculés dans le même fil."""
+    from semantic_cache import parse_entry
+
+    embeddings = _with_retries(lambda items: embedding_cache.gemini_embeddings(items, model=EMBEDDING_MODEL, dim=None),
+                               texts)
+    questions = list(dict.fromkeys(parsed[0] for parsed in map(parse_entry, texts) if parsed and parsed[0]))
+    question_embeddings = {}
+    if questions:
+        question_embeddings = dict(zip(questions, _with_retries(embedding_cache.gemini_embeddings, questions)))
+    chunk_embeddings = {}
+    if memory_db.CHUNKS:
+        from chunker import chunk_entry
+
+        chunks = list(dict.fromkeys(chunk for text in texts for chunk in chunk_entry(text)))
+        if chunks:
+            chunk_embeddings = dict(zip(chunks, _with_retries(embedding_cache.gemini_embeddings, chunks)))
+    return embeddings, question_embeddings, chunk_embeddings
+
+
+def index_file_bulk(filepath, batch_size=50, concurrency=4, incremental=False, project_id=None):
+    """Réindexation en masse : hashes connus lus en une requête, embeddings par lots en parallèle
+    (au plus `concurrency` appels simultanés) et insertions groupées avec execute_values."""
+    project_id = project_id or default_project(filepath)
+    started = time.perf_counter()
+    conn = psycopg2.connect(DB_CONFIG)
+    register_vector(conn)
+    cur = conn.cursor()
 
-            print(f"✨ Nouvel extrait trouvé. Indexation vectorielle...")
+    cur.execute("ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS content_hash TEXT UNIQUE;")
+    conn.commit()
 
+    start = load_checkpoint(filepath) if incremental else 0
+    if start:
+        print(f"⏩ Reprise à l'octet {start} : seule la fin du fichier est relue.")
+    blocks, last_offset = read_blocks(filepath, start)
+
+    # 1. Hashes déjà indexés, en une seule requête (limitée aux blocs relus en mode incrémental)
+    if start:
+        cur.execute("SELECT content_hash FROM chat_history WHERE content_hash = ANY(%s)", (list(blocks),))
+    else:
+        cur.execute("SELECT content_hash FROM chat_history WHERE content_hash IS NOT NULL")
+    known = {row[0] for row in cur.fetchall()}
+
+    new_blocks = [(h, offset, text) for h, (offset, text) in blocks.items() if h not in known]
+    print(f"📚 {len(blocks)} blocs lus dans {filepath}, {len(new_blocks)} à indexer.")
+    if not new_blocks:
+        cur.close()
+        conn.close()
+        if incremental:
+            save_checkpoint(filepath, last_offset)
+        print("🚀 Base de données déjà synchronisée !")
+        return
+
+    batches = [new_blocks[i:i + batch_size] for i in range(0, len(new_blocks), batch_size)]
+    done = failed = 0
+    resume_at = None
+    embed_started = time.perf_counter()
+
+    # 2. Embeddings par lots, 3. insertion de chaque lot dès qu'il est prêt
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(_embed_batch, [text for _, _, text in batch]): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
             try:
-                # 1. Génération de l'embedding (768 dim pour text-embedding-004)
-                res = client.models.embed_content(model="text-embedding-004", contents=text)
-                embedding = res.embeddings[0].values
-
-                # 2. Insertion
-                cur.execute(
-                    "INSERT INTO chat_history (content, content_hash, embedding) VALUES (%s, %s, %s)",
-                    (text, content_hash, embedding)
+                embeddings, question_embeddings, chunk_embeddings = future.result()
+                inserted = execute_values(
+                    cur,
+                    "INSERT INTO chat_history (content, content_hash, embedding, project_id) VALUES %s "
+                    "ON CONFLICT (content_hash) DO NOTHING RETURNING id, content",
+                    [(text, h, embedding, project_id) for (h, _, text), embedding in zip(batch, embeddings)],
+                    template="(%s, %s, %s::vector, %s)",
+                    fetch=True
                 )
+                memory_db.store_questions(cur, inserted, lambda questions: [question_embeddings[q] for q in questions])
+                store_chunks(cur, [(parent_id, content, project_id) for parent_id, content in inserted],
+                             lambda chunks: [chunk_embeddings[chunk] for chunk in chunks])
                 conn.commit()
-            except MemoryError as e:
-                print(f"❌ Mémoire insuffisante pour l'embedding : {e}")
-                conn.rollback()
+                done += len(batch)
             except Exception as e:
-                print(f"❌ Erreur sur ce bloc : {e}")
                 conn.rollback()
+                failed += len(batch)
+                resume_at = batch[0][1] if resume_at is None else min(resume_at, batch[0][1])
+                print(f"\n❌ Erreur sur un lot de {len(batch)} blocs : {str(e)[:120]}")
+
+            elapsed = time.perf_counter() - embed_started
+            print(f"\r⏳ {done + failed}/{len(new_blocks)} blocs | {done / elapsed:.1f} blocs/s", end="", flush=True)
 
     cur.close()
     conn.close()
-    print("🚀 Base de données synchronisée !")
+    if incremental:
+        # Le dernier bloc est toujours relu : il a pu être lu pendant son écriture
+        save_checkpoint(filepath, last_offset if resume_at is None else resume_at)
+    total = time.perf_counter() - started
+    print(f"\n🚀 {done} blocs indexés en {total:.1f} s ({done / total:.1f} blocs/s)"
+          + (f", {failed} en échec (relancer pour réessayer)." if failed else "."))
 
 
 if __name__ == "__main__":
-    index_file("historique_global.md")
+    parser = argparse.ArgumentParser(description="Indexation vectorielle de l'historique de conversation.")
+    parser.add_argument("file", nargs="?", default="historique_global.md")
+    parser.add_argument("--bulk", action="store_true", help="Réindexation en masse (lots, appels parallèles)")
+    parser.add_argument("--batch-size", type=int, default=50, help="Blocs par appel d'embedding (mode --bulk)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Appels d'embedding simultanés (mode --bulk)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Ne relit que la fin du fichier depuis le dernier passage (relecture complète si tronqué)")
+    parser.add_argument("--project", help="Projet associé aux souvenirs (défaut : dossier du fichier)")
+    args = parser.parse_args()
+
+    if args.bulk:
+        index_file_bulk(args.file, args.batch_size, args.concurrency, args.incremental, args.project)
+    else:
+        index_file(args.file, args.incremental, args.project)
@@ -1,18 +1,33 @@
 import httpx
 from fastapi import FastAPI, Request
+from fastapi.responses import Response
+from contextlib import asynccontextmanager
 from cryptography.fernet import Fernet
+import json
 import os
 import uvicorn
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI()
 cipher = Fernet(os.getenv("ENCRYPTION_KEY").encode())
-RELAY_URL = "https://openrouter.webtrader.fr/relay"
+RELAY_URL = os.getenv("RELAY_URL", "https://openrouter.webtrader.fr/relay")
 SECRET_TOKEN = os.getenv("SECRET_TOKEN")
 
 
+@asynccontextmanager
+async def lifespan(app):
+    # Un seul client pour toute la session Aider : la connexion vers le relais reste ouverte
+    app.state.client = httpx.AsyncClient(timeout=httpx.Timeout(300, connect=10))
+    try:
+        yield
+    finally:
+        await app.state.client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
 @app.post("/{path:path}")
 async def handle_proxy(request: Request, path: str):
     # 1. Recevoir le JSON d'Aider
@@ -24,13 +39,12 @@ async def handle_proxy(request: Request, path: str):
         "payload": payload
     }
 
-    # 3. Chiffrer
-    encrypted_data = cipher.encrypt(str(data_to_encrypt).replace("'", '"').encode())
+    # 3. Chiffrer (json.dumps : guillemets et caractères spéciaux du prompt échappés correctement)
+    encrypted_data = cipher.encrypt(json.dumps(data_to_encrypt).encode())
 
     # 4. Envoyer au LXC (via HTTPS standard, sans headers suspects)
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(RELAY_URL, content=encrypted_data)
-        return resp.json()
+    resp = await request.app.state.client.post(RELAY_URL, content=encrypted_data)
+    return Response(resp.content, resp.status_code, media_type=resp.headers.get("Content-Type"))
 
 
 if __name__ == "__main__":
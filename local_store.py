@@ -0,0 +1,60 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Dossier des données locales partagées entre les commandes (caches, statistiques...)
+CACHE_DIR = os.environ.get("TERMINAI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "terminai"))
+
+
+def cache_path(*parts):
+    """Chemin dans le dossier de cache, en créant les dossiers parents si besoin."""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+@contextmanager
+def file_lock(path, timeout=5.0, stale_after=30.0):
+    """Verrou inter-processus basé sur un fichier <path>.lock (portable Windows/Linux)."""
+    lock_path = f"{path}.lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                # Verrou abandonné par un processus interrompu
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Verrou occupé : {lock_path}")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def read_json(path, default=None):
+    """Lit un fichier JSON, ou renvoie default s'il est absent ou illisible."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json_atomic(path, data):
+    """Écrit un fichier JSON sans jamais laisser de version à moitié écrite."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
@@ -0,0 +1,262 @@
+"""Démon mémoire local : pool de connexions Postgres et clients API gardés au chaud.
+
+Sans lui, chaque recherche ou indexation ouvre une connexion vers la base distante, refait la
+requête de type de register_vector et reconstruit un genai.Client. Le démon écoute sur
+127.0.0.1 (protocole : une requête JSON par ligne, une réponse JSON par ligne) et expose :
+- embed  : embeddings Gemini (via le cache local) ;
+- recall : souvenirs les plus proches (memory_db.recall), à partir d'un embedding et/ou de la question ;
+- index  : insertion d'échanges dans chat_history ;
+- complete : appel non streamé d'un modèle OpenRouter (consolidation YAML) ;
+- ping.
+
+Son port et un jeton aléatoire sont publiés dans ~/.cache/terminai/memory_daemon.json. geni,
+glog et glog_relay l'utilisent s'il répond, et reviennent aux connexions directes sinon.
+
+Usage : python memory_daemon.py [--start | --stop | --status]   (sans option : au premier plan)
+"""
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from local_store import cache_path, read_json, write_json_atomic
+
+ENABLED = os.environ.get("MEMORY_DAEMON", "1") != "0"
+PORT = int(os.environ.get("MEMORY_DAEMON_PORT", "0"))  # 0 : port libre choisi au démarrage
+POOL_SIZE = int(os.environ.get("MEMORY_DAEMON_POOL", "4"))
+CONNECT_TIMEOUT = 0.2  # Un démon absent ne doit pas retarder la commande
+TIMEOUT = float(os.environ.get("MEMORY_DAEMON_TIMEOUT", "60"))
+
+STATE_FILE = "memory_daemon.json"
+
+
+class DaemonError(Exception):
+    """Opération refusée ou en échec côté démon (le démon, lui, répond)."""
+
+
+# --- Client ---
+
+def _state():
+    return read_json(cache_path(STATE_FILE))
+
+
+def request(op, **params):
+    """Résultat de l'opération, ou None si le démon n'est pas lancé (l'appelant passe en direct)."""
+    if not ENABLED:
+        return None
+    state = _state()
+    if not state:
+        return None
+    try:
+        sock = socket.create_connection(("127.0.0.1", state["port"]), timeout=CONNECT_TIMEOUT)
+    except OSError:
+        return None
+
+    with sock:
+        sock.settimeout(TIMEOUT)
+        message = {"token": state["token"], "op": op, "params": params}
+        try:
+            sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as stream:
+                line = stream.readline()
+        except ConnectionError:
+            line = b""
+    if not line:
+        return None  # Démon arrêté pendant la requête
+    reply = json.loads(line)
+    if not reply.get("ok"):
+        raise DaemonError(reply.get("error", "erreur inconnue"))
+    return reply["result"]
+
+
+def embed(texts):
+    return request("embed", texts=texts)
+
+
+def recall(project_id=None, embedding=None, text=None, limit=3):
+    return request("recall", project_id=project_id, embedding=embedding, text=text, limit=limit)
+
+
+def index(texts, project_id):
+    return request("index", texts=texts, project_id=project_id)
+
+
+def complete(model, messages, temperature=None):
+    return request("complete", model=model, messages=messages, temperature=temperature)
+
+
+def running():
+    try:
+        return request("ping") is not None
+    except (DaemonError, OSError, ValueError):
+        return False
+
+
+# --- Serveur ---
+
+class MemoryService:
+    """Ressources partagées par les requêtes : pool Postgres, clients Gemini et OpenRouter."""
+
+    def __init__(self, pool_size=POOL_SIZE):
+        import memory_db
+        from pgvector.psycopg2 import register_vector
+        from psycopg2.pool import ThreadedConnectionPool
+
+        class VectorPool(ThreadedConnectionPool):
+            # Type vector et réglages ANN appliqués une seule fois, à l'ouverture de chaque connexion
+            def _connect(self, key=None):
+                conn = super()._connect(key)
+                register_vector(conn)
+                memory_db.configure_session(conn)
+                return conn
+
+        self.memory_db = memory_db
+        self.pool = VectorPool(1, pool_size, **memory_db.DB_CONFIG)
+        self.started = time.time()
+        self.requests = 0
+
+        from google import genai
+        from openai import OpenAI
+
+        self.genai = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.openai = OpenAI(base_url="https://openrouter.ai/api/v1", api_key=os.getenv("OPENROUTER_API_KEY"))
+
+    def _run(self, work):
+        """Exécute work(cur) sur une connexion du pool ; une connexion rompue est écartée du pool."""
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                result = work(cur)
+            conn.commit()
+            return result
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn, close=bool(conn.closed))
+
+    def embed(self, texts):
+        import embedding_cache
+        return embedding_cache.gemini_embeddings(texts, client=self.genai)
+
+    def recall(self, project_id=None, embedding=None, text=None, limit=3):
+        if embedding is None:
+            embedding = self.embed([text])[0]
+        return self._run(lambda cur: self.memory_db.recall(cur, embedding, project_id, limit, text=text))
+
+    def index(self, texts, project_id=None):
+        return self._run(lambda cur: self.memory_db.store_interactions(cur, texts, project_id, self.embed))
+
+    def complete(self, model, messages, temperature=None):
+        kwargs = {"temperature": temperature} if temperature is not None else {}
+        response = self.openai.chat.completions.create(model=model, messages=messages, **kwargs)
+        return response.choices[0].message.content
+
+    def ping(self):
+        return {"pid": os.getpid(), "uptime": time.time() - self.started, "requests": self.requests}
+
+    def dispatch(self, op, params):
+        if op not in ("embed", "recall", "index", "complete", "ping"):
+            raise DaemonError(f"Opération inconnue : {op}")
+        self.requests += 1
+        return getattr(self, op)(**params)
+
+
+def serve(port=PORT):
+    import socketserver
+
+    service = MemoryService()
+    token = secrets.token_hex(16)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            # Plusieurs requêtes possibles sur une même connexion
+            for line in self.rfile:
+                try:
+                    message = json.loads(line)
+                    if not secrets.compare_digest(str(message.get("token", "")), token):
+                        raise DaemonError("Jeton invalide")
+                    if message.get("op") == "shutdown":
+                        # shutdown() attend la fin de serve_forever : appelé depuis un autre fil
+                        threading.Thread(target=self.server.shutdown, daemon=True).start()
+                        reply = {"ok": True, "result": True}
+                    else:
+                        reply = {"ok": True,
+                                 "result": service.dispatch(message.get("op"), message.get("params") or {})}
+                except Exception as e:
+                    reply = {"ok": False, "error": f"{type(e).__name__}: {str(e)[:300]}"}
+                self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+    class Server(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    with Server(("127.0.0.1", port), Handler) as server:
+        state_path = cache_path(STATE_FILE)
+        write_json_atomic(state_path, {"pid": os.getpid(), "port": server.server_address[1], "token": token,
+                                       "started": time.time()})
+        try:
+            os.chmod(state_path, 0o600)  # Le jeton ne doit être lisible que par l'utilisateur
+        except OSError:
+            pass
+
+        print(f"Démon mémoire à l'écoute sur 127.0.0.1:{server.server_address[1]} (pid {os.getpid()})", flush=True)
+        try:
+            server.serve_forever()
+        finally:
+            service.pool.closeall()
+            if (read_json(state_path) or {}).get("pid") == os.getpid():
+                os.remove(state_path)
+
+
+def start():
+    """Lance le démon en arrière-plan (sortie dans memory_daemon.log) et attend qu'il réponde."""
+    if running():
+        return True
+
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+
+    with open(cache_path("memory_daemon.log"), "a", encoding="utf-8") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdin=subprocess.DEVNULL, stdout=log, stderr=log, **kwargs
+        )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if running():
+            return True
+        time.sleep(0.2)
+    return False
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if "--start" in args:
+        print("Démon mémoire actif." if start() else "Échec du démarrage : voir ~/.cache/terminai/memory_daemon.log")
+    elif "--stop" in args:
+        try:
+            stopped = request("shutdown")
+        except DaemonError:
+            stopped = None
+        print("Démon mémoire arrêté." if stopped else "Aucun démon mémoire actif.")
+    elif "--status" in args:
+        try:
+            info = request("ping")
+        except DaemonError:
+            info = None
+        if info:
+            print(f"Démon actif (pid {info['pid']}), {info['requests']} requête(s) depuis {info['uptime'] / 60:.0f} min")
+        else:
+            print("Démon mémoire arrêté.")
+    else:
+        serve()
@@ -0,0 +1,274 @@
+"""Connexion à la base vectorielle (mémoire à long terme) avec les réglages de session.
+
+Les index ANN de chat_history (voir migrations.py) se règlent par session :
+- hnsw.ef_search (DB_HNSW_EF_SEARCH) : taille de la liste de candidats, plus grand = meilleur rappel
+- ivfflat.probes (DB_IVFFLAT_PROBES) : nombre de listes parcourues pour un index IVFFlat
+- hnsw.iterative_scan (DB_HNSW_ITERATIVE_SCAN, pgvector >= 0.8) : poursuit le parcours de l'index
+  tant qu'un filtre (project_id) n'a pas fourni assez de lignes
+
+La recherche est limitée au projet courant (MEMORY_SCOPE=project) et complétée par les autres
+projets si celui-ci compte trop peu de souvenirs (MEMORY_GLOBAL_FALLBACK). En mode hybride
+(MEMORY_RECALL), les identifiants de la question sont aussi cherchés dans content_tsv.
+"""
+import hashlib
+import os
+import re
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST"),
+    "port": os.getenv("DB_PORT"),
+    "dbname": os.getenv("DB_NAME"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD")
+}
+
+HNSW_EF_SEARCH = int(os.getenv("DB_HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("DB_IVFFLAT_PROBES", "10"))
+HNSW_ITERATIVE_SCAN = os.getenv("DB_HNSW_ITERATIVE_SCAN", "")  # off, relaxed_order ou strict_order
+
+SCOPE = os.getenv("MEMORY_SCOPE", "project")
+GLOBAL_FALLBACK = os.getenv("MEMORY_GLOBAL_FALLBACK", "1") != "0"
+
+# hybrid : classements vectoriel et lexical (content_tsv) fusionnés | vector : similarité cosinus seule
+RECALL_MODE = os.getenv("MEMORY_RECALL", "hybrid")
+# Rappel par morceaux (chat_chunks, voir chunker.py) : meilleur morceau de chaque échange
+CHUNKS = os.getenv("MEMORY_CHUNKS", "1") != "0"
+HYBRID_CANDIDATES = 20  # Candidats retenus par chaque classement avant fusion
+RRF_K = 60  # Constante de la fusion par rang réciproque : score = somme de 1 / (RRF_K + rang)
+MAX_TERMS = 8
+
+TOKEN = re.compile(r"[\w.:\\/\[\]-]+")
+IDENTIFIER = re.compile(r"\d|_|[a-z][A-Z]|[A-Z]{2,}[a-z]|\w[.:\\/\[-]\w")
+
+# Une seule requête : k plus proches voisins (index ANN) et meilleures correspondances lexicales
+# (index GIN), fusionnés côté serveur ; {final} choisit les contenus à partir des scores
+HYBRID_SQL = """
+WITH q AS (SELECT {query} AS query),
+vector AS (
+    SELECT id, row_number() OVER (ORDER BY distance) AS rank FROM (
+        SELECT id, embedding <=> %(embedding)s::vector AS distance FROM {table} WHERE {scope}
+        ORDER BY embedding <=> %(embedding)s::vector LIMIT %(candidates)s
+    ) nearest
+),
+lexical AS (
+    SELECT id, row_number() OVER (ORDER BY ts_rank_cd(content_tsv, q.query) DESC) AS rank
+    FROM {table}, q WHERE {scope} AND content_tsv @@ q.query
+    ORDER BY ts_rank_cd(content_tsv, q.query) DESC LIMIT %(candidates)s
+),
+fused AS (
+    SELECT id, sum(1.0 / (%(k)s + rank)) AS score
+    FROM (SELECT * FROM vector UNION ALL SELECT * FROM lexical) ranked GROUP BY id
+)
+{final}
+"""
+
+HYBRID_FINAL = """SELECT c.content FROM fused JOIN chat_history c USING (id)
+ORDER BY fused.score DESC LIMIT %(limit)s"""
+
+# Morceaux : le mieux classé de chaque échange, pour ne pas injecter trois fois le même
+HYBRID_CHUNKS_FINAL = """SELECT content FROM (
+    SELECT DISTINCT ON (c.parent_id) c.content, fused.score FROM fused JOIN chat_chunks c USING (id)
+    ORDER BY c.parent_id, fused.score DESC
+) best ORDER BY score DESC LIMIT %(limit)s"""
+
+VECTOR_CHUNKS_SQL = """
+SELECT content FROM (
+    SELECT DISTINCT ON (parent_id) content, distance FROM (
+        SELECT parent_id, content, embedding <=> %(embedding)s::vector AS distance FROM chat_chunks WHERE {scope}
+        ORDER BY embedding <=> %(embedding)s::vector LIMIT %(candidates)s
+    ) nearest ORDER BY parent_id, distance
+) best ORDER BY distance LIMIT %(limit)s
+"""
+
+
+def configure_session(conn, ef_search=None, probes=None):
+    """Applique les paramètres de recherche ANN à la session (sans effet si l'index n'existe pas)."""
+    with conn.cursor() as cur:
+        cur.execute("SET hnsw.ef_search = %s", (ef_search or HNSW_EF_SEARCH,))
+        cur.execute("SET ivfflat.probes = %s", (probes or IVFFLAT_PROBES,))
+        if HNSW_ITERATIVE_SCAN:
+            # Paramètre inconnu avant pgvector 0.8 : réglage optionnel
+            cur.execute("SET hnsw.iterative_scan = %s", (HNSW_ITERATIVE_SCAN,))
+    conn.commit()
+
+
+def connect(vector=True):
+    """Connexion prête pour la recherche vectorielle (type vector enregistré, session réglée)."""
+    import psycopg2
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    if vector:
+        from pgvector.psycopg2 import register_vector
+        register_vector(conn)
+    configure_session(conn)
+    return conn
+
+
+def identifier_terms(text):
+    """Termes du texte qui ressemblent à des identifiants : la recherche vectorielle les rate souvent.
+
+    Noms de classes (CamelCase), routes et variables (snake_case, app.route), codes d'erreur (E_1234,
+    SQLSTATE[23000]), espaces de noms (App\\Entity), sigles (HTTP) : tout jeton qui contient un
+    chiffre, un _, un séparateur interne (. : \\ / -) ou plusieurs majuscules.
+    """
+    terms = []
+    for token in TOKEN.findall(text):
+        token = token.strip(".:/-\\")
+        if len(token) < 3 or token in terms:
+            continue
+        if IDENTIFIER.search(token) or (token.isupper() and token.isalpha()):
+            terms.append(token)
+    return terms[:MAX_TERMS]
+
+
+def _search(cur, embedding, limit, scope="TRUE", project_id=None, terms=(), chunks=False):
+    """Recherche vectorielle seule, ou hybride (fusion RRF des classements vectoriel et lexical) si terms.
+
+    chunks : recherche dans chat_chunks, un seul morceau (le meilleur) par échange.
+    """
+    params = {"embedding": embedding, "limit": limit, "project_id": project_id,
+              "candidates": max(HYBRID_CANDIDATES, limit * 5) if chunks else HYBRID_CANDIDATES}
+    if terms:
+        # Un groupe par identifiant (ses lexèmes liés par ET), les groupes liés par OU
+        query = " || ".join(f"plainto_tsquery('simple', %(term{i})s)" for i in range(len(terms)))
+        params.update({f"term{i}": term for i, term in enumerate(terms)}, k=RRF_K)
+        sql = HYBRID_SQL.format(query=query, scope=scope, table="chat_chunks" if chunks else "chat_history",
+                                final=HYBRID_CHUNKS_FINAL if chunks else HYBRID_FINAL)
+    elif chunks:
+        sql = VECTOR_CHUNKS_SQL.format(scope=scope)
+    else:
+        sql = (f"SELECT content FROM chat_history WHERE {scope} "
+               "ORDER BY embedding <=> %(embedding)s::vector LIMIT %(limit)s")
+    cur.execute(sql, params)
+    return [row[0] for row in cur.fetchall()]
+
+
+def recall(cur, embedding, project_id=None, limit=3, fallback=None, text=None):
+    """Contenus des souvenirs les plus proches, d'abord ceux du projet.
+
+    Le filtre project_id = '...' est écrit en littéral : le planificateur peut ainsi utiliser
+    l'index partiel du projet (migrations.py project-indexes). Sans projet, ou avec
+    MEMORY_SCOPE=global, toute la table est parcourue. Avec text (la question) et
+    MEMORY_RECALL=hybrid, les identifiants de la question sont aussi cherchés tels quels.
+    """
+    fallback = GLOBAL_FALLBACK if fallback is None else fallback
+    terms = identifier_terms(text) if text and RECALL_MODE == "hybrid" else []
+    chunks = CHUNKS
+    while True:
+        try:
+            contents = _recall(cur, embedding, project_id, limit, fallback, terms, chunks)
+            if contents or not chunks:
+                return contents
+            chunks = False  # Morceaux pas encore créés (python chunker.py --backfill) : échanges complets
+        except Exception as e:
+            # Base non migrée (table chat_chunks ou colonne content_tsv absente) : mode plus simple
+            if type(e).__name__ not in ("UndefinedTable", "UndefinedColumn") or not (chunks or terms):
+                raise
+            cur.connection.rollback()
+            if chunks:
+                chunks = False
+            else:
+                terms = []
+
+
+def _recall(cur, embedding, project_id, limit, fallback, terms, chunks):
+    if not project_id or SCOPE == "global":
+        return _search(cur, embedding, limit, terms=terms, chunks=chunks)
+
+    contents = _search(cur, embedding, limit, "project_id = %(project_id)s", project_id, terms, chunks)
+    if fallback and len(contents) < limit:
+        # Projet récent ou peu documenté : on complète avec les autres projets
+        contents += _search(cur, embedding, limit - len(contents), "project_id IS DISTINCT FROM %(project_id)s",
+                            project_id, terms, chunks)
+    return contents
+
+
+def store_chunks(cur, parents, embed_many):
+    """Découpe et insère dans chat_chunks les échanges [(id, contenu, project_id)]. Renvoie le nombre de morceaux."""
+    from psycopg2.extras import execute_values
+    from chunker import chunk_entry
+
+    rows = [(parent_id, index, chunk, project_id)
+            for parent_id, content, project_id in parents
+            for index, chunk in enumerate(chunk_entry(content))]
+    if not rows:
+        return 0
+    embeddings = embed_many([chunk for _, _, chunk, _ in rows])
+    execute_values(
+        cur,
+        "INSERT INTO chat_chunks (parent_id, chunk_index, content, embedding, project_id) VALUES %s "
+        "ON CONFLICT (parent_id, chunk_index) DO NOTHING",
+        [(parent_id, index, chunk, embedding, project_id)
+         for (parent_id, index, chunk, project_id), embedding in zip(rows, embeddings)],
+        template="(%s, %s, %s, %s::vector, %s)"
+    )
+    return len(rows)
+
+
+def store_questions(cur, parents, embed_many):
+    """Embedding de la seule question (ligne PROMPT) des échanges [(id, contenu)], pour le cache sémantique.
+
+    Renvoie le nombre de questions embeddées ; 0 sur une base sans la migration 7 (question_embedding).
+    """
+    from psycopg2.extras import execute_values
+    from semantic_cache import parse_entry
+
+    rows = []
+    for parent_id, content in parents:
+        parsed = parse_entry(content)
+        if parsed and parsed[0]:
+            rows.append((parent_id, parsed[0]))
+    if not rows:
+        return 0
+    embeddings = embed_many([question for _, question in rows])
+    cur.execute("SAVEPOINT questions")
+    try:
+        execute_values(
+            cur,
+            "UPDATE chat_history AS h SET question_embedding = v.embedding FROM (VALUES %s) AS v (id, embedding) "
+            "WHERE h.id = v.id",
+            [(parent_id, embedding) for (parent_id, _), embedding in zip(rows, embeddings)],
+            template="(%s, %s::vector)"
+        )
+    except Exception as e:
+        if type(e).__name__ != "UndefinedColumn":
+            raise
+        cur.execute("ROLLBACK TO SAVEPOINT questions")  # Base non migrée : le cache sémantique reste inactif
+        return 0
+    return len(rows)
+
+
+def store_interactions(cur, full_texts, project_id, embed_many):
+    """Insère les échanges absents de chat_history (empreinte md5), embeddés en un appel, leurs questions
+    (cache sémantique) et leurs morceaux.
+
+    Renvoie le nombre d'échanges ajoutés.
+    """
+    from psycopg2.extras import execute_values
+
+    pending = {hashlib.md5(text.encode('utf-8')).hexdigest(): text for text in full_texts}
+    cur.execute("SELECT content_hash FROM chat_history WHERE content_hash = ANY(%s)", (list(pending),))
+    for (known_hash,) in cur.fetchall():
+        pending.pop(known_hash, None)
+    if not pending:
+        return 0
+
+    embeddings = embed_many(list(pending.values()))
+    inserted = execute_values(
+        cur,
+        "INSERT INTO chat_history (content, content_hash, embedding, project_id) VALUES %s "
+        "ON CONFLICT (content_hash) DO NOTHING RETURNING id, content",
+        [(text, content_hash, embedding, project_id)
+         for (content_hash, text), embedding in zip(pending.items(), embeddings)],
+        template="(%s, %s, %s::vector, %s)",
+        fetch=True
+    )
+    if inserted:
+        store_questions(cur, inserted, embed_many)
+    if CHUNKS and inserted:
+        store_chunks(cur, [(parent_id, content, project_id) for parent_id, content in inserted], embed_many)
+    return len(inserted or [])  # Un processus concurrent a pu insérer une partie des échanges entre-temps
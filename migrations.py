@@ -0,0 +1,267 @@
+"""Migrations versionnées du schéma de la mémoire à long terme (chat_history).
+
+Chaque migration est appliquée une seule fois et consignée dans schema_migrations. Les
+instructions sont idempotentes : une base créée à la main (VECTOR_DB.md) ou par 01-setup.sql
+est mise à niveau sans perte.
+
+Usage :
+    python migrations.py                       # applique les migrations en attente
+    python migrations.py status                # version du schéma et index ANN présents
+    python migrations.py index hnsw [--m 16] [--ef-construction 64]
+    python migrations.py index ivfflat [--lists N]
+    python migrations.py project-indexes [--min-rows 2000]   # index partiels par projet
+"""
+import argparse
+import hashlib
+import math
+import time
+
+from rich.console import Console
+
+from memory_db import connect
+
+console = Console(stderr=True)
+
+INDEX_NAME = "chat_history_embedding_idx"
+LOCK_ID = 7310  # Verrou consultatif : une seule migration à la fois
+
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+PROJECT_INDEX_MIN_ROWS = 2000  # En dessous, le parcours exact des lignes du projet reste rapide
+
+
+def ann_indexes(cur, table="chat_history", partial=None):
+    """Index ANN existants sur la table : [(nom, définition)].
+
+    partial=False ne garde que les index globaux, partial=True que les index partiels (par projet).
+    """
+    cur.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s "
+        "AND (indexdef ILIKE '%%USING hnsw%%' OR indexdef ILIKE '%%USING ivfflat%%') ORDER BY indexname",
+        (table,)
+    )
+    indexes = cur.fetchall()
+    if partial is None:
+        return indexes
+    return [(name, definition) for name, definition in indexes if (" WHERE " in definition) == partial]
+
+
+def default_lists(rows):
+    """Nombre de listes IVFFlat recommandé par pgvector : lignes / 1000 jusqu'à 1M, puis sqrt(lignes)."""
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def build_index(cur, method, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, lists=None,
+                table="chat_history", name=INDEX_NAME):
+    """(Re)construit l'index ANN global (distance cosinus) ; l'index global précédent est supprimé."""
+    for index_name, _ in ann_indexes(cur, table, partial=False):
+        cur.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+
+    if method == "hnsw":
+        cur.execute(f'CREATE INDEX "{name}" ON {table} USING hnsw (embedding vector_cosine_ops) '
+                    f'WITH (m = {int(m)}, ef_construction = {int(ef_construction)})')
+    elif method == "ivfflat":
+        # IVFFlat apprend ses centroïdes sur les données présentes : à construire une fois la table remplie
+        if lists is None:
+            cur.execute(f"SELECT count(*) FROM {table}")
+            lists = default_lists(cur.fetchone()[0])
+        cur.execute(f'CREATE INDEX "{name}" ON {table} USING ivfflat (embedding vector_cosine_ops) '
+                    f'WITH (lists = {int(lists)})')
+    else:
+        raise ValueError(f"Méthode d'index inconnue : {method}")
+
+
+def project_index_name(project_id, table="chat_history"):
+    return f"{table}_embedding_p{hashlib.md5(project_id.encode('utf-8')).hexdigest()[:12]}_idx"
+
+
+def build_project_indexes(cur, min_rows=PROJECT_INDEX_MIN_ROWS, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION,
+                          table="chat_history"):
+    """Index HNSW partiel (WHERE project_id = '...') pour chaque projet d'au moins min_rows lignes.
+
+    Chaque recherche filtrée sur un projet ne parcourt que le graphe de ce projet : la latence
+    ne dépend plus du nombre de projets. Renvoie les projets nouvellement indexés.
+    """
+    cur.execute(f"SELECT project_id, count(*) FROM {table} WHERE project_id IS NOT NULL "
+                "GROUP BY project_id HAVING count(*) >= %s ORDER BY project_id", (min_rows,))
+    projects = cur.fetchall()
+    existing = {name for name, _ in ann_indexes(cur, table, partial=True)}
+    created = []
+    for project_id, rows in projects:
+        name = project_index_name(project_id, table)
+        if name in existing:
+            continue
+        predicate = cur.mogrify("project_id = %s", (project_id,)).decode("utf-8")
+        cur.execute(f'CREATE INDEX "{name}" ON {table} USING hnsw (embedding vector_cosine_ops) '
+                    f'WITH (m = {int(m)}, ef_construction = {int(ef_construction)}) WHERE {predicate}')
+        created.append((project_id, rows))
+    return created
+
+
+def _default_index(cur):
+    # Aucun index ANN : chaque recherche geni était un parcours séquentiel
+    if not ann_indexes(cur, partial=False):
+        build_index(cur, "hnsw")
+
+
+MIGRATIONS = [
+    (1, "Table chat_history", [
+        "CREATE EXTENSION IF NOT EXISTS vector",
+        """CREATE TABLE IF NOT EXISTS chat_history (
+            id SERIAL PRIMARY KEY,
+            content TEXT,
+            content_hash VARCHAR(64) UNIQUE,
+            embedding vector(768),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        # Tables créées selon d'anciennes versions de VECTOR_DB.md
+        "ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64) UNIQUE",
+        "ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+    ]),
+    (2, "Colonne project_id (glog_relay)", [
+        "ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS project_id TEXT",
+    ]),
+    (3, "Index HNSW par défaut sur embedding", [_default_index]),
+    (4, "Index sur project_id (recherche par projet)", [
+        # Petits projets : lecture de leurs seules lignes puis tri exact, plutôt que le graphe global
+        "CREATE INDEX IF NOT EXISTS chat_history_project_idx ON chat_history (project_id)",
+    ]),
+    (5, "Colonne content_tsv et index GIN (recherche hybride)", [
+        # Configuration simple : pas de racinisation, les identifiants restent intacts (PostgreSQL >= 12)
+        "ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS chat_history_content_tsv_idx ON chat_history USING gin (content_tsv)",
+    ]),
+    (6, "Table chat_chunks (morceaux des échanges, voir chunker.py)", [
+        """CREATE TABLE IF NOT EXISTS chat_chunks (
+            id SERIAL PRIMARY KEY,
+            parent_id INTEGER NOT NULL REFERENCES chat_history (id) ON DELETE CASCADE,
+            chunk_index INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            embedding vector(768),
+            project_id TEXT,
+            content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED,
+            UNIQUE (parent_id, chunk_index)
+        )""",
+        f"CREATE INDEX IF NOT EXISTS chat_chunks_embedding_idx ON chat_chunks USING hnsw (embedding vector_cosine_ops) "
+        f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})",
+        "CREATE INDEX IF NOT EXISTS chat_chunks_project_idx ON chat_chunks (project_id)",
+        "CREATE INDEX IF NOT EXISTS chat_chunks_content_tsv_idx ON chat_chunks USING gin (content_tsv)",
+    ]),
+    (7, "Colonne question_embedding (cache sémantique, voir semantic_cache.py)", [
+        "ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS question_embedding vector(768)",
+        f"CREATE INDEX IF NOT EXISTS chat_history_question_embedding_idx ON chat_history "
+        f"USING hnsw (question_embedding vector_cosine_ops) WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})",
+    ]),
+]
+
+
+def _ensure_table(cur):
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""")
+
+
+def applied_versions(cur):
+    _ensure_table(cur)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(conn):
+    """Applique les migrations en attente, chacune dans sa propre transaction. Renvoie leur nombre."""
+    with conn.cursor() as cur:
+        _ensure_table(cur)
+    conn.commit()
+
+    count = 0
+    for version, name, steps in MIGRATIONS:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_ID,))
+            if version in applied_versions(cur):
+                conn.rollback()
+                continue
+            started = time.perf_counter()
+            for step in steps:
+                if callable(step):
+                    step(cur)
+                else:
+                    cur.execute(step)
+            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        conn.commit()
+        count += 1
+        console.print(f"[green]✔[/green] {version:03d} {name} [dim]({time.perf_counter() - started:.1f}s)[/dim]")
+    return count
+
+
+def print_status(conn):
+    with conn.cursor() as cur:
+        done = applied_versions(cur)
+        for version, name, _ in MIGRATIONS:
+            mark = "[green]✔[/green]" if version in done else "[yellow]…[/yellow]"
+            console.print(f"{mark} {version:03d} {name}")
+        indexes = ann_indexes(cur)
+    conn.commit()
+    if not indexes:
+        console.print("[yellow]Aucun index ANN : recherche exacte (parcours séquentiel).[/yellow]")
+    for name, definition in indexes:
+        console.print(f"[cyan]{name}[/cyan] [dim]{definition}[/dim]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrations du schéma chat_history")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("migrate", help="Applique les migrations en attente (défaut)")
+    sub.add_parser("status", help="Migrations appliquées et index ANN présents")
+    index_parser = sub.add_parser("index", help="Reconstruit l'index ANN de chat_history")
+    index_parser.add_argument("method", choices=["hnsw", "ivfflat"])
+    index_parser.add_argument("--m", type=int, default=HNSW_M, help="HNSW : voisins par nœud")
+    index_parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION,
+                              help="HNSW : taille de la liste de candidats à la construction")
+    index_parser.add_argument("--lists", type=int, help="IVFFlat : nombre de listes (défaut selon le volume)")
+    index_parser.add_argument("--maintenance-work-mem", default="512MB",
+                              help="Mémoire allouée à la construction de l'index")
+    project_parser = sub.add_parser("project-indexes", help="Index HNSW partiels pour les projets volumineux")
+    project_parser.add_argument("--min-rows", type=int, default=PROJECT_INDEX_MIN_ROWS,
+                                help="Nombre minimal de lignes pour indexer un projet")
+    project_parser.add_argument("--m", type=int, default=HNSW_M)
+    project_parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+    args = parser.parse_args()
+
+    conn = connect(vector=False)
+    try:
+        if args.command == "status":
+            print_status(conn)
+        elif args.command == "index":
+            migrate(conn)
+            started = time.perf_counter()
+            with conn.cursor() as cur:
+                cur.execute("SET maintenance_work_mem = %s", (args.maintenance_work_mem,))
+                build_index(cur, args.method, args.m, args.ef_construction, args.lists)
+            conn.commit()
+            console.print(f"[bold green]✔ Index {args.method} construit en {time.perf_counter() - started:.1f}s[/bold green]")
+        elif args.command == "project-indexes":
+            migrate(conn)
+            created = []
+            with conn.cursor() as cur:
+                for table in ("chat_history", "chat_chunks"):
+                    created += [(table, project_id, rows) for project_id, rows
+                                in build_project_indexes(cur, args.min_rows, args.m, args.ef_construction, table)]
+            conn.commit()
+            for table, project_id, rows in created:
+                console.print(f"[green]✔[/green] {project_id} [dim]({table}, {rows} lignes)[/dim]")
+            if not created:
+                console.print(f"[dim]Aucun nouveau projet d'au moins {args.min_rows} lignes.[/dim]")
+        else:
+            if not migrate(conn):
+                console.print("[dim]Schéma à jour.[/dim]")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
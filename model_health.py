@@ -0,0 +1,166 @@
+"""Tableau de santé des modèles, partagé entre tous les processus (ask, call_relay, glog...).
+
+Pour chaque modèle : taux de succès (moyenne mobile), latence EWMA du premier token
+et dernières erreurs 429/402/404/5xx avec leur Retry-After. Un modèle en erreur voit
+son circuit ouvert pendant une durée qui croît avec les échecs consécutifs : il est
+alors ignoré par les piles de failover, sans aucun aller-retour réseau.
+
+Usage : python model_health.py [--reset]
+"""
+import os
+import re
+import sys
+import time
+
+from local_store import cache_path, file_lock, read_json, write_json_atomic
+
+HEALTH_FILE = os.environ.get("MODEL_HEALTH_FILE", "model_health.json")
+ENABLED = os.environ.get("MODEL_HEALTH", "1") != "0"
+
+EWMA_ALPHA = 0.3
+MAX_ERRORS_KEPT = 5
+
+# Durée d'ouverture du circuit par statut : (durée de base, plafond) en secondes
+CIRCUIT_RULES = {
+    429: (30, 600),  # Limite de débit : doublée à chaque échec consécutif
+    402: (3600, 3600),  # Crédits épuisés
+    404: (3600, 3600),  # Modèle retiré / inexistant
+    500: (15, 300),
+}
+
+
+def describe_error(error):
+    """Renvoie (statut HTTP, Retry-After en secondes) à partir d'une exception de requête."""
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    retry_after = getattr(error, "retry_after", None)
+
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if status is None:
+        status = getattr(response, "status_code", None)
+    if retry_after is None and headers.get("retry-after"):
+        try:
+            retry_after = float(headers.get("retry-after"))
+        except ValueError:
+            retry_after = None
+
+    message = str(error).upper()
+    if not isinstance(status, int):
+        match = re.search(r"\b(429|402|404|5\d\d)\b", message)
+        status = int(match.group(1)) if match else None
+    if status is None and ("CREDITS" in message or "BALANCE" in message):
+        status = 402
+    if retry_after is None:
+        match = re.search(r"RETRY[ _-]?(?:AFTER|IN)\D{0,3}([\d.]+)", message)
+        retry_after = float(match.group(1)) if match else None
+
+    return status, retry_after
+
+
+def circuit_duration(status, retry_after, consecutive_failures):
+    """Durée d'ouverture du circuit (0 si l'erreur ne justifie pas de mise à l'écart)."""
+    if retry_after:
+        return retry_after
+    if status is None:
+        return 0
+    base, cap = CIRCUIT_RULES.get(status, CIRCUIT_RULES[500] if status >= 500 else (0, 0))
+    return min(base * 2 ** max(consecutive_failures - 1, 0), cap)
+
+
+class HealthBoard:
+    """Accès au fichier de santé partagé (verrouillé pour chaque mise à jour)."""
+
+    def __init__(self, path=None):
+        self.path = path or cache_path(HEALTH_FILE)
+
+    def load(self):
+        return read_json(self.path, {})
+
+    def _update(self, model, apply):
+        # Le suivi de santé ne doit jamais empêcher une réponse d'arriver
+        try:
+            with file_lock(self.path):
+                board = self.load()
+                entry = board.setdefault(model, {
+                    "success": 0, "failure": 0, "success_rate": 1.0, "ewma_latency": None,
+                    "consecutive_failures": 0, "open_until": 0, "last_errors": []
+                })
+                apply(entry)
+                write_json_atomic(self.path, board)
+        except (OSError, TimeoutError):
+            pass
+
+    def record_success(self, model, latency):
+        def apply(entry):
+            entry["success"] += 1
+            entry["success_rate"] = (1 - EWMA_ALPHA) * entry["success_rate"] + EWMA_ALPHA
+            previous = entry["ewma_latency"]
+            entry["ewma_latency"] = latency if previous is None else (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * latency
+            entry["consecutive_failures"] = 0
+            entry["open_until"] = 0
+
+        self._update(model, apply)
+
+    def record_failure(self, model, error):
+        status, retry_after = describe_error(error)
+
+        def apply(entry):
+            entry["failure"] += 1
+            entry["success_rate"] = (1 - EWMA_ALPHA) * entry["success_rate"]
+            entry["consecutive_failures"] += 1
+            duration = circuit_duration(status, retry_after, entry["consecutive_failures"])
+            if duration:
+                entry["open_until"] = max(entry["open_until"], time.time() + duration)
+            entry["last_errors"] = (entry["last_errors"] + [{
+                "at": time.time(), "status": status, "retry_after": retry_after, "message": str(error)[:200]
+            }])[-MAX_ERRORS_KEPT:]
+
+        self._update(model, apply)
+
+    def order(self, models):
+        """Renvoie (modèles à essayer dans l'ordre, [(modèle ignoré, secondes restantes, statut)]).
+
+        L'ordre configuré est conservé, les modèles dégradés (taux de succès < 50 %) passent
+        en fin de pile et les circuits ouverts sont ignorés. Si tous les circuits sont ouverts,
+        toute la pile est renvoyée, celui qui rouvre le plus tôt en tête.
+        """
+        board = self.load()
+        now = time.time()
+        available, skipped = [], []
+        for model in models:
+            entry = board.get(model, {})
+            if entry.get("open_until", 0) > now:
+                last_status = (entry.get("last_errors") or [{}])[-1].get("status")
+                skipped.append((model, entry["open_until"] - now, last_status))
+            else:
+                available.append(model)
+
+        if not available:
+            return sorted(models, key=lambda m: board[m]["open_until"]), []
+
+        def degraded(model):
+            entry = board.get(model, {})
+            return entry.get("success", 0) + entry.get("failure", 0) >= 3 and entry.get("success_rate", 1.0) < 0.5
+
+        return sorted(available, key=degraded), skipped
+
+
+def print_board(board):
+    now = time.time()
+    print(f"{'Modèle':<45}{'OK':>5}{'KO':>5}{'Succès':>8}{'Latence':>9}  État")
+    for model, entry in sorted(board.items()):
+        latency = f"{entry['ewma_latency']:.2f}s" if entry.get("ewma_latency") is not None else "-"
+        state = "disponible"
+        if entry.get("open_until", 0) > now:
+            last = (entry.get("last_errors") or [{}])[-1]
+            state = f"ignoré encore {entry['open_until'] - now:.0f}s ({last.get('status')})"
+        print(f"{model:<45}{entry['success']:>5}{entry['failure']:>5}{entry['success_rate']:>7.0%}{latency:>9}  {state}")
+
+
+if __name__ == "__main__":
+    health = HealthBoard()
+    if "--reset" in sys.argv[1:]:
+        write_json_atomic(health.path, {})
+        print("Tableau de santé réinitialisé.")
+    else:
+        print_board(health.load())
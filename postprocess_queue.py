@@ -0,0 +1,273 @@
+"""File d'attente durable du post-traitement (indexation vectorielle, consolidation YAML).
+
+glog / glog_relay déposent une tâche par fichier JSON dans ~/.cache/terminai/postprocess/pending
+et rendent la main dès la réponse affichée. Un worker détaché, unique, vide la file :
+- les indexations en attente d'un même projet sont regroupées (un seul appel d'embedding) ;
+- deux appels réseau sont espacés d'au moins POSTPROCESS_MIN_INTERVAL secondes ;
+- une tâche en échec est retentée avec un délai croissant, puis déplacée dans failed/.
+
+Usage : python postprocess_queue.py [--worker | --drain | --retry-failed]
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from local_store import cache_path, read_json, write_json_atomic
+
+# async : tâches confiées au worker (défaut) | sync : exécution immédiate, comme avant
+MODE = os.environ.get("POSTPROCESS_MODE", "async")
+MIN_INTERVAL = float(os.environ.get("POSTPROCESS_MIN_INTERVAL", "1"))
+MAX_ATTEMPTS = int(os.environ.get("POSTPROCESS_MAX_ATTEMPTS", "5"))
+RETRY_DELAY = 10  # Secondes, doublées à chaque nouvel échec
+BATCH_SIZE = 20
+IDLE_EXIT = 30  # Le worker s'arrête après 30 s sans tâche
+HEARTBEAT_EVERY = 5
+HEARTBEAT_STALE = 30
+
+QUEUE_DIR = "postprocess"
+VARIANTS = ("glog", "glog_relay")  # Modules autorisés à traiter une tâche
+
+
+def _dir(state):
+    return os.path.dirname(cache_path(QUEUE_DIR, state, "x"))
+
+
+def _jobs(state):
+    """Fichiers de tâches d'un état, du plus ancien au plus récent."""
+    folder = _dir(state)
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith(".json")]
+
+
+def enqueue(variant, kind, args):
+    """Dépose une tâche (kind : index ou summary) exécutée par variant (glog ou glog_relay)."""
+    job = {
+        "id": f"{time.time_ns()}-{uuid.uuid4().hex[:8]}",
+        "variant": variant,
+        "kind": kind,
+        "args": args,
+        "cwd": os.getcwd(),  # Les fichiers du projet (resume_contexte.yaml...) sont relatifs au dossier courant
+        "attempts": 0,
+        "not_before": 0,
+        "created": time.time(),
+    }
+    write_json_atomic(os.path.join(_dir("pending"), f"{job['id']}.json"), job)
+    return job["id"]
+
+
+# --- Worker unique ---
+
+def _pid_path():
+    return cache_path(QUEUE_DIR, "worker.pid")
+
+
+def worker_alive():
+    """Un worker est actif si son fichier pid a été touché récemment (battement de cœur)."""
+    try:
+        return time.time() - os.path.getmtime(_pid_path()) < HEARTBEAT_STALE
+    except OSError:
+        return False
+
+
+def _acquire_worker():
+    path = _pid_path()
+    if os.path.exists(path) and not worker_alive():
+        try:
+            os.remove(path)  # Worker interrompu sans nettoyage
+        except OSError:
+            pass
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.write(fd, str(os.getpid()).encode())
+    os.close(fd)
+    return True
+
+
+def _release_worker():
+    try:
+        os.remove(_pid_path())
+    except OSError:
+        pass
+
+
+def _heartbeat(stop):
+    while not stop.wait(HEARTBEAT_EVERY):
+        try:
+            os.utime(_pid_path())
+        except OSError:
+            pass
+
+
+def ensure_worker():
+    """Lance un worker détaché si aucun n'est actif (sa sortie va dans postprocess/worker.log)."""
+    if worker_alive():
+        return
+
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+
+    with open(cache_path(QUEUE_DIR, "worker.log"), "a", encoding="utf-8") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdin=subprocess.DEVNULL, stdout=log, stderr=log, **kwargs
+        )
+
+
+# --- Traitement des tâches ---
+
+def _claim(now):
+    """Réserve la prochaine tâche prête (et les indexations du même lot) par renommage atomique."""
+    batch = []
+    for path in _jobs("pending"):
+        job = read_json(path)
+        if not job or job.get("not_before", 0) > now:
+            continue
+        if batch:
+            first = batch[0][0]
+            same_batch = (first["kind"] == "index" and job["kind"] == "index"
+                          and job["variant"] == first["variant"] and job["args"].get("project_id") ==
+                          first["args"].get("project_id"))
+            if not same_batch:
+                continue
+
+        running_path = os.path.join(_dir("running"), os.path.basename(path))
+        try:
+            os.rename(path, running_path)
+        except OSError:
+            continue  # Déjà réservée
+        batch.append((job, running_path))
+
+        if job["kind"] != "index" or len(batch) >= BATCH_SIZE:
+            break
+    return batch
+
+
+def _execute(jobs):
+    """Exécute un lot de tâches de même nature ; renvoie True si tout s'est bien passé."""
+    first = jobs[0]
+    if first["variant"] not in VARIANTS:
+        raise ValueError(f"Module de post-traitement inconnu : {first['variant']}")
+    module = __import__(first["variant"])
+    os.chdir(first["cwd"])
+
+    if first["kind"] == "index":
+        extra = {k: v for k, v in first["args"].items() if k != "full_text"}
+        return module.index_interactions([job["args"]["full_text"] for job in jobs], **extra)
+    if first["kind"] == "summary":
+        return module.update_global_summary(**first["args"])
+    raise ValueError(f"Type de tâche inconnu : {first['kind']}")
+
+
+def _finish(batch, ok, error=None):
+    for job, running_path in batch:
+        if ok:
+            os.remove(running_path)
+            continue
+
+        job["attempts"] += 1
+        job["last_error"] = str(error)[:300] if error else "échec signalé par la tâche"
+        if job["attempts"] >= MAX_ATTEMPTS:
+            target = os.path.join(_dir("failed"), os.path.basename(running_path))
+            print(f"❌ Tâche {job['id']} ({job['kind']}) abandonnée après {job['attempts']} essais.", flush=True)
+        else:
+            job["not_before"] = time.time() + RETRY_DELAY * 2 ** (job["attempts"] - 1)
+            target = os.path.join(_dir("pending"), os.path.basename(running_path))
+        write_json_atomic(target, job)
+        os.remove(running_path)
+
+
+def drain(idle_exit=IDLE_EXIT):
+    """Vide la file ; s'arrête après idle_exit secondes sans tâche prête (0 : dès que la file est vide)."""
+    last_call = 0.0
+    idle_since = time.monotonic()
+    while True:
+        batch = _claim(time.time())
+        if not batch:
+            if not _jobs("pending") and time.monotonic() - idle_since >= idle_exit:
+                return
+            time.sleep(1)
+            continue
+
+        # Limitation de débit entre deux appels réseau (remplace l'ancienne pause fixe d'une seconde)
+        wait = last_call + MIN_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+        jobs = [job for job, _ in batch]
+        print(f"[{time.strftime('%H:%M:%S')}] {jobs[0]['kind']} x{len(jobs)} ({jobs[0]['cwd']})", flush=True)
+        try:
+            ok, error = _execute(jobs), None
+        except Exception as e:
+            ok, error = False, e
+            print(f"⚠️ {type(e).__name__} : {e}", flush=True)
+        last_call = time.monotonic()
+        _finish(batch, ok, error)
+        idle_since = time.monotonic()
+
+
+def run_worker(idle_exit=IDLE_EXIT):
+    """Boucle du worker ; renvoie False si un autre worker est déjà actif."""
+    if not _acquire_worker():
+        return False
+
+    # Tâches d'un worker interrompu en cours de route (aucun autre worker ne peut les traiter)
+    for path in _jobs("running"):
+        os.replace(path, os.path.join(_dir("pending"), os.path.basename(path)))
+
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(stop,), daemon=True).start()
+    try:
+        while True:
+            drain(idle_exit)
+            _release_worker()
+            # Une tâche déposée pendant l'arrêt n'aurait déclenché aucun nouveau worker
+            if not _jobs("pending") or not _acquire_worker():
+                return True
+    except BaseException:
+        _release_worker()
+        raise
+    finally:
+        stop.set()
+
+
+def retry_failed():
+    count = 0
+    for path in _jobs("failed"):
+        job = read_json(path)
+        job.update(attempts=0, not_before=0)
+        write_json_atomic(os.path.join(_dir("pending"), os.path.basename(path)), job)
+        os.remove(path)
+        count += 1
+    return count
+
+
+def print_status():
+    print(f"Worker     : {'actif' if worker_alive() else 'arrêté'}")
+    for state in ("pending", "running", "failed"):
+        print(f"{state:<10} : {len(_jobs(state))}")
+    for path in _jobs("failed")[-5:]:
+        job = read_json(path, {})
+        print(f"  - {job.get('kind')} ({job.get('cwd')}) : {job.get('last_error')}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if "--worker" in args:
+        run_worker()
+    elif "--drain" in args:
+        # Traitement au premier plan, jusqu'à ce que la file soit vide
+        if not run_worker(idle_exit=0):
+            print("Un worker est déjà actif : python postprocess_queue.py pour suivre la file.")
+    elif "--retry-failed" in args:
+        print(f"{retry_failed()} tâche(s) remise(s) en file.")
+        ensure_worker()
+    else:
+        print_status()
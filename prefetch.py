@@ -0,0 +1,38 @@
+"""Collecte du contexte de geni en arrière-plan.
+
+Le repo map, le résumé YAML, l'embedding de la question et la recherche des souvenirs ne dépendent
+que de la question : ils sont lancés dès qu'elle est saisie et avancent pendant l'ajout des
+fichiers. L'attente après la dernière saisie se limite alors à l'étape la plus lente, au lieu de
+la somme des étapes.
+"""
+import threading
+from concurrent.futures import Future
+
+
+def in_background(fn, *args, **kwargs):
+    """Lance fn dans un fil démon et renvoie un Future.
+
+    Contrairement à ThreadPoolExecutor, le fil n'est pas attendu à la sortie : une réponse reprise
+    du cache sémantique ou un Ctrl+C ne restent pas bloqués derrière Aider ou la base distante.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=f"prefetch-{getattr(fn, '__name__', 'tâche')}", daemon=True).start()
+    return future
+
+
+def read_text(path, default):
+    """Contenu d'un fichier texte, ou default s'il est absent."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return default
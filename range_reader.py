@@ -0,0 +1,167 @@
+"""Lecture de plages de lignes par mmap, sans charger le fichier.
+
+Extraire les lignes 10 à 50 d'un journal ou d'un dump SQL de 300 Mo passait par f.readlines() :
+tout le fichier en liste de chaînes. Le fichier est désormais projeté en mémoire (mmap) et seuls
+les octets des plages demandées sont décodés. Pour trouver le début d'une ligne, un index des
+retours à la ligne est construit au fil des besoins : le nombre de lignes de chaque bloc de
+BLOCK_BYTES octets (bytes.count, en C), puis une recherche dans le seul bloc concerné.
+L'index est gardé par (chemin, date de modification, taille), en mémoire et, pour les gros
+fichiers, dans ~/.cache/terminai/line_index/.
+
+Syntaxe des plages (plusieurs séparées par des virgules, servies en une lecture) :
+  10-50    lignes 10 à 50
+  120      ligne 120 seule
+  300-     de la ligne 300 à la fin
+  -20      les 20 dernières lignes
+"""
+import hashlib
+import mmap
+import os
+import re
+
+from local_store import cache_path, read_json, write_json_atomic
+
+BLOCK_BYTES = 256 * 1024
+DISK_CACHE_MIN_BYTES = 8 * 1024 * 1024  # En dessous, l'index se reconstruit en quelques millisecondes
+
+RANGE = re.compile(r"^(?:(\d+)\s*-\s*(\d*)|-\s*(\d+)|(\d+))$")
+
+_indexes = {}  # (chemin, mtime_ns, taille) → LineIndex
+
+
+class LineIndex:
+    """starts[i] : nombre de retours à la ligne avant le bloc i (index complété à la demande)."""
+
+    def __init__(self, key, size):
+        self.key = key
+        self.size = size
+        self.starts = [0]
+
+    @property
+    def complete(self):
+        return (len(self.starts) - 1) * BLOCK_BYTES >= self.size
+
+    def extend(self, data, newlines):
+        """Compte les blocs suivants jusqu'à couvrir newlines retours à la ligne (ou la fin du fichier)."""
+        while not self.complete and self.starts[-1] < newlines:
+            first = (len(self.starts) - 1) * BLOCK_BYTES
+            self.starts.append(self.starts[-1] + data[first:first + BLOCK_BYTES].count(b"\n"))
+
+    def offset(self, data, line):
+        """Position du premier octet de la ligne line (numérotée à partir de 0), ou la taille du fichier."""
+        if line <= 0:
+            return 0
+        self.extend(data, line)
+        # Bloc contenant le line-ième retour à la ligne : dernier bloc qui en a moins avant lui
+        low, high = 0, len(self.starts) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.starts[middle] < line:
+                low = middle
+            else:
+                high = middle - 1
+        position = low * BLOCK_BYTES - 1
+        for _ in range(line - self.starts[low]):
+            position = data.find(b"\n", position + 1)
+            if position < 0:
+                return self.size
+        return position + 1
+
+    def total_lines(self, data):
+        self.extend(data, float("inf"))
+        last_line_open = self.size and data[self.size - 1:self.size] != b"\n"
+        return self.starts[-1] + (1 if last_line_open else 0)
+
+
+def _disk_path(path):
+    key = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    return cache_path("line_index", f"{key}.json")
+
+
+def _load_index(path, stat):
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    index = _indexes.get(key)
+    if index:
+        return index
+    index = LineIndex(key, stat.st_size)
+    if stat.st_size >= DISK_CACHE_MIN_BYTES:
+        saved = read_json(_disk_path(path))
+        if saved and saved.get("key") == list(key) and saved.get("block") == BLOCK_BYTES:
+            index.starts = saved["starts"]
+    _indexes[key] = index
+    return index
+
+
+def _save_index(path, index):
+    if index.size >= DISK_CACHE_MIN_BYTES:
+        write_json_atomic(_disk_path(path), {"key": list(index.key), "block": BLOCK_BYTES, "starts": index.starts})
+
+
+def parse_ranges(spec):
+    """[(début, fin)] : lignes numérotées à partir de 1, fin None = fin du fichier, début négatif = dernières lignes."""
+    ranges = []
+    for token in spec.split(","):
+        token = token.strip()
+        if not token:
+            continue
+        match = RANGE.match(token)
+        if not match:
+            raise ValueError(f"plage invalide : {token!r} (ex : 10-50, 120, 300-, -20)")
+        start, end, last, single = match.groups()
+        if (last or single) and int(last or single) < 1:
+            raise ValueError(f"plage invalide : {token!r}")
+        if last:
+            ranges.append((-int(last), None))
+        elif single:
+            ranges.append((int(single), int(single)))
+        else:
+            start, end = int(start), int(end) if end else None
+            if start < 1 or (end is not None and end < start):
+                raise ValueError(f"plage invalide : {token!r}")
+            ranges.append((start, end))
+    if not ranges:
+        raise ValueError("aucune plage indiquée")
+    return ranges
+
+
+def read_ranges(path, spec):
+    """[((première, dernière ligne), texte)] pour chaque plage de spec, dans l'ordre demandé."""
+    ranges = parse_ranges(spec)
+    stat = os.stat(path)
+    index = _load_index(path, stat)
+    if stat.st_size == 0:
+        return [((start, start), "") for start, _ in ranges]
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        known_blocks = len(index.starts)
+        total = None
+        if any(start < 0 or end is None for start, end in ranges):
+            total = index.total_lines(data)
+
+        resolved = []
+        for start, end in ranges:
+            if start < 0:
+                start, end = max(1, total + start + 1), total
+            elif end is None:
+                end = max(start, total)
+            resolved.append((start, end))
+
+        # Plages traitées par position croissante : l'index n'est étendu qu'une fois, d'un seul tenant
+        spans = {}
+        for start, end in sorted(set(resolved)):
+            spans[(start, end)] = (index.offset(data, start - 1), index.offset(data, end))
+
+        results = []
+        for start, end in resolved:
+            first, last = spans[(start, end)]
+            text = data[first:last].decode("utf-8", errors="replace").replace("\r\n", "\n")
+            results.append(((start, end), text))
+
+    if len(index.starts) != known_blocks:
+        _save_index(path, index)
+    return results
+
+
+def extract_ranges(path, spec):
+    """Blocs de contexte prêts à insérer dans le prompt, un par plage."""
+    return [f"--- {path} (Lignes {start}-{end}) ---\n{text}" for (start, end), text in read_ranges(path, spec)]
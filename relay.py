@@ -0,0 +1,170 @@
+"""Relais HTTP (conteneur LXC) : reçoit les requêtes chiffrées des clients et interroge OpenRouter.
+
+Points d'entrée :
+- POST /relay  : {"internal_token", "payload"} → chat completions OpenRouter (flux SSE compris) ;
+- POST /embed  : {"internal_token", "text"} → {"embedding": [...]} (Gemini, GEMINI_DIM dimensions) ;
+- GET  /health : état et versions d'enveloppe acceptées (négociation, voir relay_transport.py).
+
+Les corps sont déchiffrés en enveloppe v1 (Fernet) ou v2 (voir envelope.py) et relus par
+json.loads, jamais évalués. La réponse repart dans la version de la requête.
+
+Un seul client httpx.AsyncClient par processus, créé au démarrage : ses connexions vers OpenRouter
+et Gemini restent ouvertes et sont partagées par toutes les requêtes (terminaux, sessions Aider),
+au lieu d'un client, donc d'une poignée de main TLS, par requête. RELAY_UPSTREAM_POOL_SIZE borne
+les connexions simultanées, RELAY_WORKERS le nombre de processus uvicorn (un pool chacun).
+
+Usage : python relay.py   (ou uvicorn relay:app --workers N)
+"""
+import hmac
+import json
+import os
+from contextlib import asynccontextmanager
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+
+from embedding_cache import GEMINI_DIM, GEMINI_MODEL
+from envelope import CONTENT_TYPE, STREAM_CONTENT_TYPE, Envelope, EnvelopeError, available_compressions
+
+load_dotenv()
+
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+GEMINI_URL = os.getenv("GEMINI_URL", "https://generativelanguage.googleapis.com/v1beta")
+SECRET_TOKEN = os.getenv("SECRET_TOKEN") or ""
+
+HOST = os.getenv("RELAY_HOST", "0.0.0.0")
+PORT = int(os.getenv("RELAY_PORT", "8000"))
+WORKERS = int(os.getenv("RELAY_WORKERS", "2"))
+UPSTREAM_POOL_SIZE = int(os.getenv("RELAY_UPSTREAM_POOL_SIZE", "100"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("RELAY_UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("RELAY_UPSTREAM_READ_TIMEOUT", "300"))
+
+envelope = Envelope(os.getenv("ENCRYPTION_KEY"))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.client = httpx.AsyncClient(
+        timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=UPSTREAM_POOL_SIZE, max_keepalive_connections=UPSTREAM_POOL_SIZE),
+    )
+    try:
+        yield
+    finally:
+        await app.state.client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class Incoming:
+    """Requête déchiffrée : données JSON, version d'enveloppe et compression de la réponse."""
+
+    def __init__(self, data, version, compression):
+        self.data = data
+        self.version = version
+        self.compression = compression
+
+    def reply(self, content, status_code=200, headers=None):
+        """Réponse JSON (octets) dans la version d'enveloppe de la requête."""
+        if self.version == 1:
+            return Response(content, status_code, headers, media_type="application/json")
+        return Response(envelope.seal(content, 2, self.compression), status_code, headers, media_type=CONTENT_TYPE)
+
+    def reply_json(self, data, status_code=200):
+        return self.reply(json.dumps(data).encode(), status_code)
+
+
+def _compression(accept):
+    """Meilleure compression lisible par le client (en-tête X-Envelope-Accept)."""
+    accepted = [name.strip() for name in accept.split(",")] if accept else ["zlib"]
+    return next((name for name in available_compressions() if name in accepted), "none")
+
+
+async def read_request(request):
+    """Déchiffre et valide le corps ; 403 si illisible ou si le jeton interne est faux."""
+    body = await request.body()
+    try:
+        # Déchiffrement et décompression hors de la boucle : un gros prompt ne bloque pas les autres
+        data = json.loads(await run_in_threadpool(envelope.open, body))
+    except (EnvelopeError, ValueError):
+        raise HTTPException(status_code=403, detail="Déchiffrement échoué")
+    if not isinstance(data, dict) or not hmac.compare_digest(str(data.get("internal_token", "")), SECRET_TOKEN):
+        raise HTTPException(status_code=403, detail="Jeton interne invalide")
+    return Incoming(data, Envelope.version(body), _compression(request.headers.get("X-Envelope-Accept")))
+
+
+def _upstream_error(service, e):
+    return {"error": {"message": f"{service} injoignable depuis le relais : {e}", "code": 502}}
+
+
+def _passthrough_headers(response):
+    retry_after = response.headers.get("Retry-After")
+    return {"Retry-After": retry_after} if retry_after else None
+
+
+@app.post("/relay")
+async def relay(request: Request):
+    incoming = await read_request(request)
+    payload = incoming.data.get("payload")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="payload manquant")
+    payload.pop("project_id", None)  # Sert au filtrage côté client, inconnu d'OpenRouter
+
+    client = request.app.state.client
+    headers = {"Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}"}
+    upstream = client.build_request("POST", OPENROUTER_URL, json=payload, headers=headers)
+    try:
+        response = await client.send(upstream, stream=bool(payload.get("stream")))
+    except httpx.HTTPError as e:
+        return incoming.reply_json(_upstream_error("OpenRouter", e), 502)
+
+    if not payload.get("stream") or response.status_code != 200:
+        await response.aread()
+        await response.aclose()
+        return incoming.reply(response.content, response.status_code, _passthrough_headers(response))
+
+    # Flux SSE d'OpenRouter relayé morceau par morceau (v1 en clair, v2 en enregistrements chiffrés)
+    if incoming.version == 1:
+        chunks, media_type = response.aiter_bytes(), "text/event-stream"
+    else:
+        async def sealed():
+            async for chunk in response.aiter_bytes():
+                yield envelope.seal_record(chunk, incoming.compression)
+
+        chunks, media_type = sealed(), STREAM_CONTENT_TYPE
+    return StreamingResponse(chunks, media_type=media_type, background=BackgroundTask(response.aclose))
+
+
+@app.post("/embed")
+async def embed(request: Request):
+    incoming = await read_request(request)
+    text = incoming.data.get("text")
+    if not isinstance(text, str):
+        raise HTTPException(status_code=400, detail="text manquant")
+
+    body = {"content": {"parts": [{"text": text}]}, "outputDimensionality": GEMINI_DIM}
+    try:
+        response = await request.app.state.client.post(
+            f"{GEMINI_URL}/{GEMINI_MODEL}:embedContent", json=body,
+            headers={"x-goog-api-key": os.getenv("GEMINI_API_KEY") or ""})
+    except httpx.HTTPError as e:
+        return incoming.reply_json(_upstream_error("Gemini", e), 502)
+    if response.status_code != 200:
+        return incoming.reply(response.content, response.status_code, _passthrough_headers(response))
+    return incoming.reply_json({"embedding": response.json()["embedding"]["values"]})
+
+
+@app.get("/health")
+async def health():
+    return JSONResponse({"status": "ok", "envelope": [1, 2], "compression": available_compressions()})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("relay:app", host=HOST, port=PORT, workers=WORKERS)
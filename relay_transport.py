@@ -0,0 +1,252 @@
+"""Transport HTTP partagé vers le relais : connexions gardées ouvertes et délais explicites.
+
+Chaque requests.post(RELAY_URL, ...) ouvrait une nouvelle connexion : résolution DNS, poignée de
+main TCP puis TLS à travers le proxy et le tunnel Cloudflare, à chaque modèle essayé par le
+failover, à chaque embedding et à chaque consolidation YAML. Toutes les requêtes vers le relais
+passent désormais par une session unique du processus :
+- pool de RELAY_POOL_SIZE connexions réutilisées (failover hedge/race compris) ;
+- HTTP/2 optionnel (RELAY_HTTP2=1, nécessite httpx[http2]) : une seule connexion multiplexée ;
+- délais explicites : RELAY_CONNECT_TIMEOUT pour établir la connexion, RELAY_READ_TIMEOUT entre
+  deux morceaux de la réponse (et non pour la réponse entière, qui peut être longue en streaming) ;
+- préchauffage (warm_up) au démarrage de la commande : la connexion s'ouvre pendant la saisie
+  de la question ou la lecture du pipe, et la première vraie requête la trouve prête.
+
+post_json chiffre les messages (voir envelope.py) : enveloppe v2 (compressée, binaire) si le
+relais l'annonce dans sa réponse à GET /health, Fernet (v1) sinon. Les capacités annoncées sont
+gardées dans ~/.cache/terminai/relay_capabilities.json ; RELAY_ENVELOPE=1 ou 2 force une version.
+"""
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from local_store import cache_path, read_json, write_json_atomic
+
+load_dotenv()
+
+RELAY_URL = os.getenv("RELAY_URL") or ""
+CONNECT_TIMEOUT = float(os.getenv("RELAY_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("RELAY_READ_TIMEOUT", "120"))
+POOL_SIZE = int(os.getenv("RELAY_POOL_SIZE", "4"))
+HTTP2 = os.getenv("RELAY_HTTP2", "0") == "1"
+WARMUP = os.getenv("RELAY_WARMUP", "1") != "0"
+ENVELOPE = os.getenv("RELAY_ENVELOPE", "auto")  # auto, 1 (Fernet) ou 2 (compression + AES-GCM)
+
+CAPABILITIES_FILE = "relay_capabilities.json"
+
+_lock = threading.Lock()
+_session = None
+_warmed = threading.Event()
+_warmed.set()  # Aucun préchauffage en cours
+_warm_started = False
+_envelope = None
+
+
+def relay_url(endpoint="relay"):
+    """URL d'un point d'entrée du relais (RELAY_URL se termine par /relay)."""
+    return f"{RELAY_URL.rsplit('/', 1)[0]}/{endpoint}"
+
+
+class _HttpxResponse:
+    """Réponse httpx présentée comme une réponse requests (les appelants n'en connaissent qu'une)."""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    def iter_lines(self):
+        return self._response.iter_lines()
+
+    def iter_content(self, chunk_size=None):
+        return self._response.iter_bytes(chunk_size)
+
+    @property
+    def content(self):
+        return self._response.read()
+
+    def json(self):
+        self._response.read()
+        return self._response.json()
+
+    @property
+    def text(self):
+        self._response.read()
+        return self._response.text
+
+    def close(self):
+        self._response.close()
+
+
+class _HttpxSession:
+    def __init__(self):
+        import httpx
+
+        self.client = httpx.Client(
+            http2=True,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+        )
+
+    def request(self, method, url, data=None, stream=False, headers=None):
+        request = self.client.build_request(method, url, content=data, headers=headers)
+        return _HttpxResponse(self.client.send(request, stream=stream))
+
+
+class _RequestsSession:
+    def __init__(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, data=None, stream=False, headers=None):
+        return self.session.request(method, url, data=data, stream=stream, headers=headers,
+                                    timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401  (dépendance de httpx pour HTTP/2)
+        import httpx  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def session():
+    """Session partagée du processus, créée au premier appel."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _HttpxSession() if HTTP2 and _http2_available() else _RequestsSession()
+        return _session
+
+
+def post(url, data, stream=False, headers=None):
+    """POST vers le relais par la session partagée (réponse à fermer par l'appelant en streaming)."""
+    # Préchauffage en cours : attendre sa connexion coûte moins qu'en ouvrir une seconde
+    _warmed.wait(CONNECT_TIMEOUT)
+    return session().request("POST", url, data=data, stream=stream, headers=headers)
+
+
+# --- Enveloppe chiffrée ---
+
+def envelope():
+    global _envelope
+    if _envelope is None:
+        from envelope import Envelope
+        _envelope = Envelope(os.getenv("ENCRYPTION_KEY"))
+    return _envelope
+
+
+def capabilities():
+    """Versions d'enveloppe et compressions annoncées par le relais lors du dernier /health."""
+    known = read_json(cache_path(CAPABILITIES_FILE), {})
+    return known.get(relay_url(""), {"envelope": [1]})
+
+
+def _remember(advertised):
+    path = cache_path(CAPABILITIES_FILE)
+    known = read_json(path, {})
+    known[relay_url("")] = {"envelope": advertised.get("envelope", [1]),
+                            "compression": advertised.get("compression", []), "checked": time.time()}
+    write_json_atomic(path, known)
+
+
+def _negotiate():
+    """(version, compression) de l'enveloppe à envoyer."""
+    from envelope import available_compressions
+
+    advertised = capabilities()
+    if ENVELOPE == "1" or (ENVELOPE != "2" and 2 not in advertised.get("envelope", [1])):
+        return 1, None
+    common = [name for name in available_compressions() if name in advertised.get("compression", ["zlib"])]
+    return 2, (common or ["zlib"])[0]
+
+
+def post_json(url, data, stream=False):
+    """Chiffre data (JSON) dans l'enveloppe négociée et l'envoie ; un relais resté en v1 est détecté."""
+    from envelope import CONTENT_TYPE, available_compressions
+
+    body = json.dumps(data).encode()
+    version, compression = _negotiate()
+    if version == 1:
+        return post(url, envelope().seal(body, 1), stream)
+
+    # Le relais répond dans la même version, avec une compression que ce client sait lire
+    headers = {"Content-Type": CONTENT_TYPE, "X-Envelope-Accept": ",".join(available_compressions())}
+    response = post(url, envelope().seal(body, 2, compression), stream, headers)
+    if response.status_code in (400, 403, 415) and ENVELOPE != "2":
+        # Relais déchiffrant seulement Fernet : nouvel envoi en v1, retenu s'il aboutit
+        response.close()
+        response = post(url, envelope().seal(body, 1), stream)
+        if response.status_code == 200:
+            _remember({"envelope": [1]})
+    return response
+
+
+def is_stream(response):
+    from envelope import STREAM_CONTENT_TYPE
+
+    content_type = response.headers.get("Content-Type", "")
+    return content_type.startswith("text/event-stream") or content_type.startswith(STREAM_CONTENT_TYPE)
+
+
+def json_body(response):
+    """Corps JSON d'une réponse, en clair ou dans une enveloppe v2."""
+    from envelope import CONTENT_TYPE
+
+    if response.headers.get("Content-Type", "").startswith(CONTENT_TYPE):
+        return json.loads(envelope().open(response.content))
+    return response.json()
+
+
+def iter_lines(response):
+    """Lignes d'une réponse en flux (SSE en clair, ou enregistrements v2 déchiffrés au fil de l'eau)."""
+    from envelope import STREAM_CONTENT_TYPE
+
+    if not response.headers.get("Content-Type", "").startswith(STREAM_CONTENT_TYPE):
+        yield from response.iter_lines()
+        return
+    pending = b""
+    for chunk in envelope().open_stream(response.iter_content(chunk_size=None)):
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        yield from lines
+    if pending:
+        yield pending
+
+
+def _warm_up():
+    try:
+        # Toute réponse convient (même 404) : seule compte la connexion, rendue ensuite au pool.
+        # Un relais récent y annonce ses versions d'enveloppe et ses compressions.
+        response = session().request("GET", relay_url("health"))
+        try:
+            advertised = response.json() if response.status_code == 200 else None
+        except ValueError:
+            advertised = None
+        response.close()
+        if isinstance(advertised, dict) and "envelope" in advertised:
+            _remember(advertised)
+    except Exception:
+        pass  # Relais injoignable : la vraie requête remontera l'erreur
+    finally:
+        _warmed.set()
+
+
+def warm_up():
+    """Ouvre la connexion au relais en arrière-plan, une fois par processus (sauf RELAY_WARMUP=0)."""
+    global _warm_started
+    with _lock:
+        if _warm_started or not WARMUP or not RELAY_URL:
+            return
+        _warm_started = True
+        _warmed.clear()
+    threading.Thread(target=_warm_up, name="relay-warmup", daemon=True).start()
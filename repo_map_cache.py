@@ -0,0 +1,133 @@
+"""Cache du repo map d'Aider, par dépôt.
+
+`aider --show-repo-map` démarre une seconde application Python et parcourt tout le dépôt : plusieurs
+secondes sur un projet Symfony, à chaque question de geni. Le résultat est gardé dans
+~/.cache/terminai/repo_maps/ avec l'empreinte de l'arbre qui l'a produit :
+- le commit courant (HEAD) ;
+- chaque fichier modifié ou non suivi, avec sa date de modification et sa taille.
+Tant que l'empreinte ne change pas, la carte en cache est renvoyée sans lancer Aider (deux appels
+git de quelques millisecondes). Hors d'un dépôt git, Aider est lancé à chaque fois.
+
+Usage : python repo_map_cache.py [--refresh | --clear]
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from local_store import cache_path, read_json, write_json_atomic
+
+ENABLED = os.environ.get("REPO_MAP_CACHE", "1") != "0"
+
+CACHE_DIR = "repo_maps"
+# Fichiers écrits par Aider lui-même (cache des tags, historique) : ils invalideraient la carte à chaque appel
+IGNORED_PREFIXES = (".aider",)
+# Aider tourne sans terminal (stdin fermé) : aucune question de confirmation, et aucun
+# avertissement de modèle mêlé à la carte sur stdout (il serait mis en cache avec elle)
+AIDER_COMMAND = ["aider", "--show-repo-map", "--yes-always", "--no-show-model-warnings"]
+
+
+def _git(*args):
+    try:
+        result = subprocess.run(["git", *args], capture_output=True, text=True, encoding="utf-8",
+                                stdin=subprocess.DEVNULL)
+    except OSError:
+        return None  # git absent
+    return result.stdout if result.returncode == 0 else None
+
+
+def fingerprint():
+    """Empreinte de l'arbre de travail (HEAD + fichiers modifiés), ou None hors d'un dépôt git."""
+    head = _git("rev-parse", "--show-toplevel", "HEAD")
+    if not head:
+        return None
+    lines = head.splitlines()
+    root = lines[0]
+    commit = lines[1] if len(lines) > 1 else "(aucun commit)"
+
+    # Chaque fichier non suivi est listé : sans --untracked-files=all, un nouveau dossier n'apparaît
+    # qu'une fois ("?? dossier/") et les fichiers ajoutés ou modifiés dedans ne changent pas l'empreinte
+    status = _git("status", "--porcelain", "-z", "--untracked-files=all")
+    if status is None:
+        return None
+
+    digest = hashlib.sha256(commit.encode())
+    entries = iter(status.split("\0"))
+    for entry in entries:
+        if not entry:
+            continue
+        code, path = entry[:2], entry[3:]
+        if code[0] in "RC":
+            next(entries, None)  # Ancien nom du fichier renommé ou copié
+        if path.startswith(IGNORED_PREFIXES):
+            continue
+        try:
+            stat = os.stat(os.path.join(root, path))
+            state = f"{stat.st_mtime_ns}:{stat.st_size}"
+        except OSError:
+            state = "absent"
+        digest.update(f"\0{code}{path}\0{state}".encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+
+def _entry_path():
+    # Une entrée par dossier de travail : la carte d'Aider dépend du dossier où il est lancé
+    key = hashlib.sha256(os.path.abspath(os.getcwd()).encode("utf-8")).hexdigest()[:16]
+    return cache_path(CACHE_DIR, f"{key}.json")
+
+
+def generate():
+    """Lance Aider ; renvoie la carte, ou None en cas d'échec (jamais mis en cache)."""
+    try:
+        result = subprocess.run(
+            AIDER_COMMAND,
+            capture_output=True, text=True, encoding='utf-8',
+            stdin=subprocess.DEVNULL  # Lancé pendant la saisie des fichiers : le terminal reste à geni
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0 or not result.stdout.strip():
+        return None
+    return result.stdout
+
+
+def get_repo_map(refresh=False):
+    """Carte du projet courant : depuis le cache si l'arbre n'a pas changé, via Aider sinon."""
+    key = fingerprint() if ENABLED else None
+    path = _entry_path()
+    if key and not refresh:
+        entry = read_json(path)
+        if entry and entry.get("fingerprint") == key and entry.get("command") == AIDER_COMMAND:
+            return entry["map"]
+
+    repo_map = generate()
+    if repo_map is None:
+        return "Impossible de générer le repo-map."
+    if key:
+        write_json_atomic(path, {"fingerprint": key, "command": AIDER_COMMAND, "cwd": os.getcwd(),
+                                 "created": time.time(), "map": repo_map})
+    return repo_map
+
+
+if __name__ == "__main__":
+    if "--clear" in sys.argv[1:]:
+        shutil.rmtree(cache_path(CACHE_DIR, ""), ignore_errors=True)
+        print("Cache des repo maps vidé.")
+    elif "--refresh" in sys.argv[1:]:
+        started = time.perf_counter()
+        get_repo_map(refresh=True)
+        print(f"Repo map régénéré en {time.perf_counter() - started:.1f}s.")
+    else:
+        started = time.perf_counter()
+        key = fingerprint()
+        elapsed = time.perf_counter() - started
+        entry = read_json(_entry_path())
+        if key is None:
+            print("Hors d'un dépôt git : le repo map n'est pas mis en cache.")
+        elif entry and entry.get("fingerprint") == key and entry.get("command") == AIDER_COMMAND:
+            print(f"Repo map à jour (généré le {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['created']))}, "
+                  f"empreinte calculée en {elapsed * 1000:.0f} ms).")
+        else:
+            print("Repo map absent ou périmé : il sera régénéré à la prochaine question.")
@@ -0,0 +1,156 @@
+"""Cache disque des réponses, indexé par le contenu (pile de modèles + prompt normalisé).
+
+Une question identique posée deux fois (relance de glog après un plantage du post-traitement,
+boucle `cat fichier | glog "même question"`...) est servie en quelques millisecondes, sans
+appel à OpenRouter. Les entrées expirent après RESPONSE_CACHE_TTL secondes et les moins
+récemment utilisées sont supprimées au-delà de RESPONSE_CACHE_MAX_MB.
+
+Usage : python response_cache.py [--clear]
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+
+from local_store import cache_path, file_lock, read_json, write_json_atomic
+
+ENABLED = os.environ.get("RESPONSE_CACHE", "1") != "0"
+TTL = float(os.environ.get("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_BYTES = int(float(os.environ.get("RESPONSE_CACHE_MAX_MB", "50")) * 1024 * 1024)
+
+CACHE_DIR = "responses"
+STATS_FILE = "response_cache_stats.json"
+
+
+def normalize_prompt(prompt):
+    """Ignore les différences sans effet sur la question : fins de ligne, espaces en fin de ligne et de texte."""
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def cache_key(models, prompt):
+    material = json.dumps({"models": list(models), "prompt": normalize_prompt(prompt)}, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return cache_path(CACHE_DIR, f"{key}.json")
+
+
+def _count(field):
+    # Les statistiques ne doivent jamais bloquer une réponse
+    path = cache_path(STATS_FILE)
+    try:
+        with file_lock(path):
+            stats = read_json(path, {"hits": 0, "misses": 0})
+            stats[field] = stats.get(field, 0) + 1
+            write_json_atomic(path, stats)
+    except (OSError, TimeoutError):
+        pass
+
+
+def lookup(models, prompt):
+    """Renvoie l'entrée en cache ({response, winner, created}) ou None."""
+    path = _entry_path(cache_key(models, prompt))
+    entry = read_json(path)
+    if entry and time.time() - entry.get("created", 0) > TTL:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        entry = None
+
+    if not entry:
+        _count("misses")
+        return None
+
+    try:
+        os.utime(path)  # La date de modification sert d'horodatage LRU
+    except OSError:
+        pass
+    _count("hits")
+    return entry
+
+
+def store(models, prompt, response, winner):
+    """Enregistre une réponse puis applique les limites de durée et de taille."""
+    try:
+        write_json_atomic(_entry_path(cache_key(models, prompt)), {
+            "created": time.time(), "winner": winner, "response": response
+        })
+        evict()
+    except OSError:
+        pass
+
+
+def _entries():
+    folder = os.path.dirname(_entry_path("x"))
+    entries = []
+    for name in os.listdir(folder):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def evict(max_bytes=None, ttl=None):
+    """Supprime les entrées expirées, puis les moins récemment utilisées au-delà de la taille maximale."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    ttl = TTL if ttl is None else ttl
+    now = time.time()
+    removed = 0
+
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in entries:
+        # Tri du moins au plus récemment utilisé : on s'arrête dès que le reste est récent et tient dans la limite
+        if now - mtime <= ttl and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+            total -= size
+        except OSError:
+            pass
+    return removed
+
+
+def stats():
+    entries = _entries()
+    counters = read_json(cache_path(STATS_FILE), {"hits": 0, "misses": 0})
+    return {
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "hits": counters.get("hits", 0),
+        "misses": counters.get("misses", 0),
+    }
+
+
+def clear():
+    for _, _, path in _entries():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    write_json_atomic(cache_path(STATS_FILE), {"hits": 0, "misses": 0})
+
+
+if __name__ == "__main__":
+    if "--clear" in sys.argv[1:]:
+        clear()
+        print("Cache des réponses vidé.")
+    else:
+        s = stats()
+        requests_count = s["hits"] + s["misses"]
+        hit_rate = s["hits"] / requests_count if requests_count else 0
+        print(f"Entrées   : {s['entries']} ({s['bytes'] / 1024:.0f} Ko / {MAX_BYTES / 1024 / 1024:.0f} Mo)")
+        print(f"Hits      : {s['hits']}")
+        print(f"Misses    : {s['misses']}")
+        print(f"Taux      : {hit_rate:.0%}")
+        print(f"Durée max : {TTL / 3600:.0f} h")
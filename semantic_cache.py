@@ -0,0 +1,128 @@
+"""Cache sémantique : réutilise la réponse d'une question quasi identique déjà posée.
+
+À l'indexation, la question de chaque échange (ligne PROMPT) est embeddée à part, dans
+chat_history.question_embedding (migration 7). Avant d'appeler le LLM, la nouvelle question est
+comparée à ces vecteurs, question contre question : au-delà de SEMANTIC_CACHE_THRESHOLD de
+similarité cosinus, la réponse enregistrée est proposée (offer) ou reprise directement (auto).
+Les échanges plus vieux que SEMANTIC_CACHE_MAX_AGE_DAYS, ou d'un autre projet, sont ignorés.
+
+Réglage du seuil : python benchmarks/semantic_cache_report.py
+Usage : python semantic_cache.py --backfill [--batch-size 50]   # questions des échanges déjà indexés
+"""
+import os
+import re
+import sys
+
+MODES = ("off", "offer", "auto")
+MODE = os.environ.get("SEMANTIC_CACHE", "off").lower()
+THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+MAX_AGE_DAYS = float(os.environ.get("SEMANTIC_CACHE_MAX_AGE_DAYS", "30"))
+
+# Format des entrées écrites par glog : en-tête (DATE, PROMPT) puis la réponse
+ENTRY_PATTERN = re.compile(r"PROMPT : (.*?)\n-{50}\n(.*)", re.DOTALL)
+
+
+def enabled():
+    return MODE in ("offer", "auto")
+
+
+def parse_entry(content):
+    """Sépare une entrée de l'historique en (question, réponse), ou None si le format est inconnu."""
+    match = ENTRY_PATTERN.search(content or "")
+    if not match:
+        return None
+    return match.group(1).strip(), match.group(2).strip()
+
+
+def find_similar(cur, embedding, project_id=None, threshold=None, max_age_days=None, limit=3):
+    """Échanges passés au-dessus du seuil de similarité, du plus proche au plus lointain.
+
+    embedding est celui de la question seule, comparé à question_embedding. Renvoie
+    [{"question", "answer", "similarity", "created_at"}]. project_id limite la recherche au projet
+    courant (colonne project_id de chat_history).
+    """
+    threshold = THRESHOLD if threshold is None else threshold
+    max_age_days = MAX_AGE_DAYS if max_age_days is None else max_age_days
+
+    sql = ("SELECT content, created_at, 1 - (question_embedding <=> %s::vector) FROM chat_history "
+           "WHERE question_embedding IS NOT NULL AND created_at >= NOW() - %s * INTERVAL '1 day'")
+    params = [embedding, max_age_days]
+    if project_id:
+        sql += " AND project_id = %s"
+        params.append(project_id)
+    sql += " ORDER BY question_embedding <=> %s::vector LIMIT %s"
+    params += [embedding, limit]
+
+    cur.execute(sql, params)
+    matches = []
+    for content, created_at, similarity in cur.fetchall():
+        parsed = parse_entry(content)
+        if parsed is None or similarity < threshold:
+            continue
+        question, answer = parsed
+        matches.append({"question": question, "answer": answer,
+                        "similarity": float(similarity), "created_at": created_at})
+    return matches
+
+
+def choose(console, matches, files_added=False, interactive=True, mode=None):
+    """Applique le mode du cache sémantique et renvoie la réponse à réutiliser (ou None).
+
+    auto : la réponse la plus proche est reprise sans confirmation, sauf si des fichiers ont été
+    ajoutés au contexte (la question porte alors sur leur contenu actuel).
+    offer : la réponse est affichée et l'utilisateur choisit de la réutiliser ou non.
+    """
+    mode = mode or MODE
+    if mode not in ("offer", "auto") or not matches:
+        return None
+
+    best = matches[0]
+    when = best["created_at"].strftime("%Y-%m-%d %H:%M") if best["created_at"] else "?"
+    title = f"Réponse similaire ({best['similarity']:.0%}, {when})"
+
+    if mode == "auto" and not files_added:
+        console.print(f"[bold green]♻️  {title} : « {best['question'][:80]} »[/bold green]")
+        return best["answer"]
+
+    if not interactive:
+        return None
+
+    from rich.markdown import Markdown
+    from rich.panel import Panel
+
+    console.print(Panel(Markdown(best["answer"]), title=f"[bold yellow]{title}[/bold yellow]",
+                        subtitle=f"[dim]{best['question'][:80]}[/dim]", border_style="yellow", expand=False))
+    reply = console.input("[bold yellow]Réutiliser cette réponse au lieu d'interroger le modèle ? [o/N] [/bold yellow]")
+    return best["answer"] if reply.strip().lower() in ("o", "oui", "y", "yes") else None
+
+
+def backfill(batch_size=50):
+    """Embeddings des questions des échanges de chat_history indexés avant la migration 7."""
+    import embedding_cache
+    from memory_db import connect, store_questions
+
+    conn = connect()
+    total = last_id = 0
+    try:
+        with conn.cursor() as cur:
+            while True:
+                cur.execute("SELECT id, content FROM chat_history WHERE id > %s AND question_embedding IS NULL "
+                            "ORDER BY id LIMIT %s", (last_id, batch_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                total += store_questions(cur, rows, embedding_cache.gemini_embeddings)
+                conn.commit()
+                print(f"\r{total} questions embeddées...", end="", flush=True)
+    finally:
+        conn.close()
+    print(f"\n✔ {total} questions embeddées.")
+
+
+if __name__ == "__main__":
+    if "--backfill" in sys.argv[1:]:
+        size = sys.argv[sys.argv.index("--batch-size") + 1] if "--batch-size" in sys.argv else 50
+        backfill(int(size))
+    else:
+        print(__doc__)
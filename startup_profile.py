@@ -0,0 +1,128 @@
+"""Mesure du temps de démarrage des commandes (glog, geni, ask...).
+
+- `python glog.py --profile-startup` : coût d'import module par module (python -X importtime)
+- `python startup_profile.py --check` : échoue si un démarrage à froid dépasse le budget
+  (STARTUP_BUDGET_MS, 400 ms par défaut) ou si une dépendance lourde est importée trop tôt.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+ENTRY_POINTS = ["ask", "call_relay", "glog", "glog_relay", "geni", "geni_relay"]
+
+# Dépendances qui ne doivent être chargées qu'au premier usage
+HEAVY_MODULES = ["openai", "google.genai", "psycopg2", "pgvector", "requests", "cryptography", "rich.markdown"]
+
+DEFAULT_BUDGET_MS = 400
+
+
+def _child_env():
+    env = dict(os.environ)
+    # Les modules relais lisent ENCRYPTION_KEY dès l'import : une valeur factice suffit pour mesurer
+    env.setdefault("ENCRYPTION_KEY", "0" * 44)
+    return env
+
+
+def import_times(module):
+    """Lance un interpréteur neuf avec -X importtime et renvoie [(module, self_us, cumulé_us, profondeur)]."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=_child_env(), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import de {module} impossible :\n{result.stderr[-500:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def cold_start(module):
+    """Temps mur d'un démarrage à froid et liste des dépendances lourdes chargées."""
+    probe = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, env=_child_env(), capture_output=True, text=True)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Import de {module} impossible :\n{result.stderr[-500:]}")
+    heavy = [m for m in result.stdout.strip().split(",") if m]
+    return elapsed_ms, heavy
+
+
+def report_startup(module, top=20):
+    """Affiche le coût d'import des modules chargés au démarrage (option --profile-startup)."""
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console(stderr=True)
+    rows = import_times(module)
+    elapsed_ms, heavy = cold_start(module)
+
+    table = Table(title=f"Démarrage de {module} : {elapsed_ms:.0f} ms (budget {budget_ms():.0f} ms)")
+    table.add_column("Module")
+    table.add_column("Self (ms)", justify="right")
+    table.add_column("Cumulé (ms)", justify="right")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        table.add_row(f"{'  ' * depth}{name}", f"{self_us / 1000:.1f}", f"{cumulative_us / 1000:.1f}")
+    console.print(table)
+
+    if heavy:
+        console.print(f"[bold red]⚠️  Dépendances lourdes chargées au démarrage : {', '.join(heavy)}[/bold red]")
+    else:
+        console.print("[bold green]✔[/bold green] Aucune dépendance lourde chargée au démarrage.")
+
+
+def budget_ms():
+    return float(os.environ.get("STARTUP_BUDGET_MS", DEFAULT_BUDGET_MS))
+
+
+def check_budget(modules=None, budget=None, runs=3):
+    """Renvoie la liste des problèmes détectés (vide si tout respecte le budget)."""
+    budget = budget if budget is not None else budget_ms()
+    failures = []
+    for module in modules or ENTRY_POINTS:
+        samples = [cold_start(module) for _ in range(runs)]
+        median_ms = statistics.median(ms for ms, _ in samples)
+        heavy = samples[-1][1]
+        status = "OK" if median_ms <= budget and not heavy else "ÉCHEC"
+        print(f"{status:<6} {module:<12} {median_ms:7.0f} ms / {budget:.0f} ms"
+              + (f" | chargés trop tôt : {', '.join(heavy)}" if heavy else ""))
+        if median_ms > budget:
+            failures.append(f"{module} : {median_ms:.0f} ms > {budget:.0f} ms")
+        if heavy:
+            failures.append(f"{module} : import anticipé de {', '.join(heavy)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profil et budget de démarrage des commandes.")
+    parser.add_argument("module", nargs="?", help="Module à profiler (ex : glog)")
+    parser.add_argument("--check", action="store_true", help="Vérifie le budget de tous les points d'entrée")
+    parser.add_argument("--budget", type=float, help="Budget en ms (défaut : STARTUP_BUDGET_MS ou 400)")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.check:
+        failures = check_budget(budget=args.budget, runs=args.runs)
+        if failures:
+            print("\n❌ Budget de démarrage dépassé :\n- " + "\n- ".join(failures))
+            sys.exit(1)
+        print("\n✅ Budget de démarrage respecté.")
+    elif args.module:
+        report_startup(args.module)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import json
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+# --- Filtrage des balises <think> sur un flux ---
+
+def _partial_suffix(text, tag):
+    """Longueur du plus long suffixe de text qui est un début de tag."""
+    for size in range(min(len(text), len(tag) - 1), 0, -1):
+        if tag.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class ThinkFilter:
+    """Retire les blocs <think>…</think> d'un flux de tokens.
+
+    Équivalent incrémental de re.sub(r'<think>.*?</think>', '', …).strip() :
+    une balise coupée entre deux chunks est conservée en tampon, et un bloc
+    <think> jamais refermé est restitué tel quel en fin de flux.
+    """
+
+    def __init__(self):
+        self.pending = ""
+        self.thinking = ""
+        self.inside = False
+        self.started = False
+
+    def _emit(self, text):
+        # Équivalent du strip() de tête : rien n'est émis avant le premier caractère utile
+        if not self.started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self.started = True
+        return text
+
+    def feed(self, text):
+        self.pending += text
+        out = []
+        while self.pending:
+            if self.inside:
+                idx = self.pending.find(THINK_CLOSE)
+                if idx == -1:
+                    keep = _partial_suffix(self.pending, THINK_CLOSE)
+                    self.thinking += self.pending[:len(self.pending) - keep]
+                    self.pending = self.pending[len(self.pending) - keep:]
+                    break
+                self.pending = self.pending[idx + len(THINK_CLOSE):]
+                self.thinking = ""
+                self.inside = False
+            else:
+                idx = self.pending.find(THINK_OPEN)
+                if idx == -1:
+                    keep = _partial_suffix(self.pending, THINK_OPEN)
+                    out.append(self.pending[:len(self.pending) - keep])
+                    self.pending = self.pending[len(self.pending) - keep:]
+                    break
+                out.append(self.pending[:idx])
+                self.pending = self.pending[idx + len(THINK_OPEN):]
+                self.inside = True
+        return self._emit("".join(out))
+
+    def flush(self):
+        """Vide le tampon en fin de flux (bloc <think> non refermé compris)."""
+        rest = f"{THINK_OPEN}{self.thinking}{self.pending}" if self.inside else self.pending
+        self.pending, self.thinking, self.inside = "", "", False
+        return self._emit(rest)
+
+
+# --- Lecture d'un flux SSE (OpenRouter / relais) ---
+
+def iter_sse_deltas(lines):
+    """Extrait le texte des lignes 'data: {...}' d'un flux SSE de chat completions."""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line.startswith("data:"):
+            continue  # Lignes vides et commentaires de keep-alive (": OPENROUTER PROCESSING")
+
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+
+        event = json.loads(data)
+        if "error" in event:
+            raise RuntimeError(event["error"].get("message", "Erreur inconnue dans le flux"))
+
+        for choice in event.get("choices", []):
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+# --- Rendu progressif dans un Panel Rich ---
+
+class LiveAnswer:
+    """Redessine le Panel Markdown au fil des chunks reçus.
+
+    Pendant le flux, seule la fin de la réponse (hauteur du terminal) est affichée ;
+    le Panel complet est imprimé une fois le flux terminé.
+    """
+
+    TITLE = "[bold green]Analyse du Modèle[/bold green]"
+
+    def __init__(self, console, refresh_per_second=8):
+        self.console = console
+        self.refresh_per_second = refresh_per_second
+        self.text = ""
+        self.live = None
+
+    def _panel(self, markdown_text):
+        # Import différé : rich.markdown (et pygments) n'est chargé qu'au premier rendu
+        from rich.markdown import Markdown
+        from rich.panel import Panel
+
+        return Panel(Markdown(markdown_text), title=self.TITLE, border_style="green", expand=False)
+
+    def _tail(self):
+        lines = self.text.splitlines()
+        visible = max(self.console.height - 6, 5)
+        if len(lines) <= visible:
+            return self.text
+        hidden, tail = lines[:-visible], lines[-visible:]
+        # Un bloc de code ouvert plus haut doit rester ouvert dans l'extrait affiché
+        fences = sum(1 for line in hidden if line.lstrip().startswith("```"))
+        prefix = ["```"] if fences % 2 else []
+        return "\n".join(prefix + tail)
+
+    def update(self, chunk):
+        if not chunk:
+            return
+        if self.live is None:
+            from rich.live import Live
+
+            self.live = Live(console=self.console, refresh_per_second=self.refresh_per_second, transient=True)
+            self.live.start()
+        self.text += chunk
+        self.live.update(self._panel(self._tail()))
+
+    def close(self):
+        """Arrête le rendu progressif et imprime la réponse complète."""
+        if self.live is not None:
+            self.live.stop()
+        if self.text.strip():
+            self.console.print(self._panel(self.text.strip()))
+        return self.text.strip()
+
@@ -0,0 +1,27 @@
+from chunker import _split_block
+
+
+def test_long_line_keeps_line_order():
+    max_chars = 50
+    block = "a\n" + "x" * 3 * max_chars + "\nb"
+    pieces = _split_block(block, max_chars)
+    assert "".join(pieces).replace("\n", "") == block.replace("\n", "")
+    assert pieces[0] == "a" and pieces[-1] == "b"
+    assert all(len(piece) <= max_chars for piece in pieces)
+
+
+def test_long_line_in_code_block_keeps_order_and_fences():
+    max_chars = 50
+    block = "```py\nfirst = 1\n" + "y" * 2 * max_chars + "\nlast = 2\n```"
+    pieces = _split_block(block, max_chars)
+    assert all(piece.startswith("```py\n") and piece.endswith("\n```") for piece in pieces)
+    body = "".join(piece[len("```py\n"):-len("\n```")] for piece in pieces)
+    assert body.replace("\n", "") == "first = 1" + "y" * 2 * max_chars + "last = 2"
+
+
+def test_code_block_pieces_fit_with_fences():
+    max_chars = 50
+    block = "```python\n" + "\n".join(f"value_{i} = {i}" for i in range(40)) + "\n" + "z" * 3 * max_chars + "\n```"
+    pieces = _split_block(block, max_chars)
+    assert len(pieces) > 1
+    assert all(len(piece) <= max_chars for piece in pieces)
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import startup_profile
+
+# Machines de CI plus lentes et plus chargées qu'un poste : budget large, seules les vraies régressions échouent
+CI_BUDGET_MS = float(os.environ.get("STARTUP_CI_BUDGET_MS", "1500"))
+
+HEAVY = ["openai", "psycopg2", "google.genai"]
+
+
+def test_entry_points_start_within_budget():
+    assert startup_profile.check_budget(budget=CI_BUDGET_MS, runs=1) == []
+
+
+@pytest.mark.parametrize("module", ["ask", "glog", "geni"])
+def test_heavy_dependencies_not_imported_at_startup(module):
+    probe = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", probe], cwd=startup_profile.ROOT,
+                            env=startup_profile._child_env(), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-500:]
+    assert result.stdout.strip() == ""